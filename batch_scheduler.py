@@ -0,0 +1,152 @@
+"""
+Micro-batching scheduler for concurrent queries
+
+Requests that arrive within a few milliseconds of each other are collected
+into one batch and handed to a batch function (e.g.
+query_assistant.answer_questions), which vectorizes them together and
+searches the index with a single call. Each caller gets a Future that
+resolves to its own result.
+
+A worker thread waits for the first request, then keeps collecting until the
+batch holds `max_batch_size` requests or `window_ms` milliseconds have passed
+since that first request. Several workers may run at once; each collects its
+own batch from the shared queue. As with WorkerPool, admission is bounded: at
+most `max_pending` requests may be waiting or in a batch being processed,
+and further submissions fail with QueueFullError.
+
+With an executor (e.g. the web app's WorkerPool), batches are run on the
+executor's threads and the scheduler's workers only collect them, so
+batched and other retrieval share one limit on the queries processed at
+once. A batch the executor rejects with QueueFullError fails its requests
+with that error.
+
+Worker threads are started on the first submission in each process, so a
+scheduler created before a pre-fork server forks its workers still works
+in every child.
+"""
+from concurrent.futures import Future
+import os
+import queue
+import threading
+import time
+
+from worker_pool import QueueFullError
+
+# Tells a worker thread to exit
+_STOP = object()
+
+
+class BatchScheduler:
+    """Collect concurrent requests into batches for a batch function"""
+
+    def __init__(self, process_batch, max_batch_size=32, window_ms=2.0, workers=1, max_pending=None,
+                 executor=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self.max_pending = max_pending
+        self.n_workers = workers
+        # Runs batches when set: anything with submit(fn, *args) -> Future
+        self.executor = executor
+        self._lock = threading.Lock()
+        self._queue = None
+        self._workers = []
+        self._pending = 0
+        # Process whose worker threads are running
+        self._pid = None
+
+    @property
+    def pending(self):
+        """Requests waiting for a batch or in a batch being processed"""
+        return self._pending
+
+    def submit(self, item):
+        """Queue one request and return a Future for its result"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            if self.max_pending is not None and self._pending >= self.max_pending:
+                raise QueueFullError(
+                    f"{self._pending} queries in progress (limit {self.max_pending})"
+                )
+            self._pending += 1
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self):
+        """Stop the worker threads once the queued requests are processed"""
+        with self._lock:
+            workers, self._workers, self._pid = self._workers, [], None
+        for _ in workers:
+            self._queue.put(_STOP)
+        for worker in workers:
+            worker.join()
+
+    def _start(self):
+        """Start worker threads in this process; called with the lock held"""
+        # Threads (and anything queued) do not survive a fork
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._workers = [
+            threading.Thread(target=self._run, args=(self._queue,), name=f"batch-worker-{i}", daemon=True)
+            for i in range(self.n_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._pid = os.getpid()
+
+    def _collect(self, requests, first):
+        """Build a batch starting with first, within the window and size limit"""
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                entry = requests.get(timeout=timeout) if timeout > 0 else requests.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                # Leave it for this or another worker to pick up next
+                requests.put(_STOP)
+                break
+            batch.append(entry)
+        return batch
+
+    def _process(self, items):
+        """Results of the batch function for items, on the executor if set"""
+        if self.executor is None:
+            return self.process_batch(items)
+        return self.executor.submit(self.process_batch, items).result()
+
+    def _run(self, requests):
+        while True:
+            first = requests.get()
+            if first is _STOP:
+                return
+            collected = self._collect(requests, first)
+            # Skip requests whose caller has already given up
+            batch = [(item, future) for item, future in collected if future.set_running_or_notify_cancel()]
+            error = None
+            try:
+                if batch:
+                    results = list(self._process([item for item, _ in batch]))
+                    if len(results) != len(batch):
+                        raise RuntimeError(f"Batch function returned {len(results)} results for {len(batch)} requests")
+                    for (_, future), result in zip(batch, results):
+                        future.set_result(result)
+            except BaseException as e:
+                # Including SystemExit (e.g. from a store that failed to
+                # load); the worker thread keeps serving later batches
+                error = e
+            finally:
+                # Never leave a caller waiting on a request of this batch
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error or RuntimeError("Batch was not processed"))
+                with self._lock:
+                    self._pending -= len(collected)
@@ -0,0 +1,193 @@
+"""
+BM25 keyword index over the store's chunks
+
+Scores chunks with Okapi BM25:
+
+    score(q, d) = sum over query terms t of
+                  idf(t) * tf(t, d) * (k1 + 1) / (tf(t, d) + k1 * (1 - b + b * |d| / avgdl))
+
+with idf(t) = ln(1 + (N - df(t) + 0.5) / (df(t) + 0.5)). The per-term,
+per-chunk part does not depend on the query, so it is computed once at
+build time and stored as a term-major CSR matrix of weights, the same
+inverted-index layout as SparseIndex. A query is then one sparse product
+that only touches the postings of its terms. Tokenization reuses the
+store's QueryVectorizer (same lowercasing, token pattern and stop words),
+so BM25 and TF-IDF see the same terms.
+
+KeywordStore serves a BM25 index (this one or an InvertedIndex) through the
+similarity_search_with_score interface of the vector stores.
+"""
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+
+from metadata_filter import MetadataIndex
+from metrics import STAGE_SECONDS
+from query_vectorizer import QueryVectorizer
+from sparse_index import smallest_k
+
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+
+def as_query_vectorizer(vectorizer):
+    """Return vectorizer as a QueryVectorizer"""
+    if isinstance(vectorizer, QueryVectorizer):
+        return vectorizer
+    # Stores saved before vectorizer.npz hold a fitted sklearn vectorizer
+    return QueryVectorizer.from_sklearn(vectorizer)
+
+
+def inverse_document_frequency(counts):
+    """BM25 idf of every term of an (n_docs x n_terms) term count matrix"""
+    n_docs, n_terms = counts.shape
+    document_frequency = np.bincount(counts.indices, minlength=n_terms)
+    return np.log1p((n_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+
+
+def length_norms(doc_lengths, k1=DEFAULT_K1, b=DEFAULT_B):
+    """The k1 * (1 - b + b * |d| / avgdl) term of every document, as float32"""
+    doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+    average_length = doc_lengths.mean() if len(doc_lengths) else 0.0
+    if not average_length:
+        return np.full(len(doc_lengths), k1, dtype=np.float32)
+    return (k1 * (1 - b + b * doc_lengths / average_length)).astype(np.float32)
+
+
+def term_weights(idf, tf, length_norm, k1=DEFAULT_K1):
+    """float32 BM25 weights of postings with term frequencies tf, given the
+    idf of each posting's term and the length norm of its document"""
+    tf = np.asarray(tf, dtype=np.float32)
+    return (idf * (k1 + 1)).astype(np.float32) * tf / (tf + length_norm)
+
+
+class BM25Index:
+    """Okapi BM25 search over term-major weight postings"""
+
+    def __init__(self, vectorizer, weights, k1=DEFAULT_K1, b=DEFAULT_B):
+        self.vectorizer = as_query_vectorizer(vectorizer)
+        # Row t holds the BM25 weight of term t in every chunk
+        self.weights = weights
+        self.k1 = k1
+        self.b = b
+
+    @property
+    def ntotal(self):
+        return self.weights.shape[1]
+
+    @classmethod
+    def build(cls, vectorizer, texts, k1=DEFAULT_K1, b=DEFAULT_B):
+        """Index texts, tokenized with vectorizer's vocabulary"""
+        vectorizer = as_query_vectorizer(vectorizer)
+        counts = vectorizer.term_counts(texts)
+        norms = length_norms(np.asarray(counts.sum(axis=1)).ravel(), k1, b)
+        idf = inverse_document_frequency(counts)
+        data = term_weights(idf[counts.indices], counts.data, np.repeat(norms, np.diff(counts.indptr)), k1)
+
+        weights = sparse.csr_matrix((data, counts.indices, counts.indptr), shape=counts.shape).T.tocsr()
+        return cls(vectorizer, weights, k1=k1, b=b)
+
+    def search(self, queries, k, mask=None):
+        """Return (scores, indices) arrays of shape (n_queries, k).
+
+        Higher scores are better. Only chunks sharing a term with the query
+        (and marked True in mask, a boolean array over the chunks, if given)
+        are returned, ordered by score and then by index; rows are padded
+        with -1 indices and -inf scores.
+        """
+        n_queries = len(queries)
+        scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        indices = np.full((n_queries, k), -1, dtype=np.int64)
+        if self.ntotal == 0 or k <= 0 or n_queries == 0:
+            return scores, indices
+
+        # Repeated query terms count once per occurrence, as in Lucene
+        matches = (self.vectorizer.term_counts(queries) @ self.weights).tocsr()
+        # Chunk order within each row is the tie-break order
+        matches.sort_indices()
+        for row in range(n_queries):
+            start, end = matches.indptr[row], matches.indptr[row + 1]
+            docs = matches.indices[start:end]
+            row_scores = matches.data[start:end]
+            if mask is not None:
+                allowed = mask[docs]
+                docs, row_scores = docs[allowed], row_scores[allowed]
+            top = smallest_k(-row_scores, min(k, len(docs)))
+            scores[row, :len(top)] = row_scores[top]
+            indices[row, :len(top)] = docs[top]
+        return scores, indices
+
+    def save(self, path):
+        """Save the weights as .npy arrays that can be memory-mapped"""
+        os.makedirs(path, exist_ok=True)
+        np.save(f"{path}/weights.data.npy", self.weights.data)
+        np.save(f"{path}/weights.indices.npy", self.weights.indices)
+        np.save(f"{path}/weights.indptr.npy", self.weights.indptr)
+        with open(f"{path}/config.json", "w") as f:
+            json.dump({"k1": self.k1, "b": self.b, "chunks": self.ntotal}, f)
+
+    @classmethod
+    def load(cls, path, vectorizer, mmap=True):
+        """Load an index saved by save(), tokenizing with the store's vectorizer"""
+        with open(f"{path}/config.json", "r") as f:
+            config = json.load(f)
+        mmap_mode = "r" if mmap else None
+        data = np.load(f"{path}/weights.data.npy", mmap_mode=mmap_mode)
+        indices = np.load(f"{path}/weights.indices.npy", mmap_mode=mmap_mode)
+        indptr = np.load(f"{path}/weights.indptr.npy", mmap_mode=mmap_mode)
+        weights = sparse.csr_matrix(
+            (data, indices, indptr), shape=(len(indptr) - 1, config["chunks"]), copy=False
+        )
+        return cls(vectorizer, weights, k1=config["k1"], b=config["b"])
+
+
+class KeywordStore:
+    """A BM25 index searched through the vector store interface.
+
+    Results are (text, metadata, score) tuples as from SimpleVectorStore,
+    but the scores are BM25 scores, so higher is better.
+    """
+
+    # Tells result formatting that scores are not distances
+    higher_scores_better = True
+
+    def __init__(self, keyword_index, texts, metadatas, version=None, metadata_index=None):
+        if keyword_index.ntotal != len(texts):
+            raise ValueError(f"BM25 index holds {keyword_index.ntotal} chunks but there are {len(texts)} texts")
+        self.keyword_index = keyword_index
+        self.texts = texts
+        self.metadatas = metadatas
+        self.version = version
+        # Built from the metadata on first use if not given
+        self._metadata_index = metadata_index
+
+    def filter_mask(self, filter):
+        """Boolean mask of the chunks matching filter, or None for no filter"""
+        if not filter:
+            return None
+        if self._metadata_index is None:
+            self._metadata_index = MetadataIndex.build(self.metadatas)
+        with STAGE_SECONDS.time("filter"):
+            return self._metadata_index.mask(filter)
+
+    def similarity_search_with_score(self, query, k=5, search_params=None, filter=None):
+        """Search for the chunks best matching query's keywords"""
+        return self.similarity_search_with_score_batch(
+            [query], k=k, search_params=search_params, filter=filter
+        )[0]
+
+    def similarity_search_with_score_batch(self, queries, k=5, search_params=None, filter=None):
+        """Search for several queries at once, returning one list of results per query"""
+        if search_params:
+            raise ValueError("Keyword search takes no search parameters")
+        mask = self.filter_mask(filter)
+        if not queries:
+            return []
+        with STAGE_SECONDS.time("bm25"):
+            scores, indices = self.keyword_index.search(queries, k, mask=mask)
+        return [
+            [(self.texts[idx], self.metadatas[idx], score) for score, idx in zip(row_scores, row_indices) if idx >= 0]
+            for row_scores, row_indices in zip(scores.tolist(), indices.tolist())
+        ]
@@ -1,23 +1,53 @@
 # chunk_docs.py
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from pathlib import Path
+"""
+Split the raw documents in ./raw_docs into overlapping chunks
+
+Every doc_*.txt file is split with a RecursiveCharacterTextSplitter into
+chunks/<doc>_chunk_NNN.txt, and chunks/metadata.json lists every chunk with
+its source document and position in it.
+
+With --workers N the documents are split by N worker processes, each
+writing its documents' chunk files. Documents are processed in sorted file
+name order and their metadata is merged in that order, so the chunk files
+and metadata.json are identical whatever the number of workers.
+
+Usage:
+    python chunk_docs.py --workers 8
+"""
+import argparse
 import json
+import os
+from multiprocessing import Pool
+from pathlib import Path
 
-raw_dir = Path("./raw_docs")
-chunk_dir = Path("./chunks")
-chunk_dir.mkdir(exist_ok=True)
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
 
-splitter = RecursiveCharacterTextSplitter(
-    chunk_size=500,
-    chunk_overlap=50,
-    length_function=len
-)
+# Documents handed to a worker at a time: enough to amortize the
+# inter-process round trip, few enough to keep the workers evenly loaded
+DOCUMENTS_PER_TASK = 8
 
-metadata_list = []
+_splitter = None
 
-for path in raw_dir.glob("doc_*.txt"):
+
+def get_splitter():
+    """The text splitter of this process, created on first use"""
+    global _splitter
+    if _splitter is None:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        _splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            length_function=len
+        )
+    return _splitter
+
+
+def chunk_document(path, chunk_dir):
+    """Split one document, write its chunk files and return their metadata"""
     text = path.read_text(encoding="utf-8")
-    chunks = splitter.split_text(text)
+    chunks = get_splitter().split_text(text)
+    metadata_list = []
     for idx, chunk in enumerate(chunks):
         fn = chunk_dir / f"{path.stem}_chunk_{idx:03d}.txt"
         fn.write_text(chunk, encoding="utf-8")
@@ -26,6 +56,52 @@ for path in raw_dir.glob("doc_*.txt"):
             "source": str(path),
             "chunk_index": idx
         })
-# Save metadata
-with open("./chunks/metadata.json", "w") as mf:
-    json.dump(metadata_list, mf)
\ No newline at end of file
+    return metadata_list
+
+
+def _chunk_document_task(args):
+    return chunk_document(*args)
+
+
+def chunk_documents(raw_dir, chunk_dir, workers=1):
+    """Chunk every doc_*.txt file of raw_dir into chunk_dir.
+
+    Returns the metadata of all chunks, in sorted document order and then
+    chunk order, and saves it as chunk_dir/metadata.json.
+    """
+    raw_dir, chunk_dir = Path(raw_dir), Path(chunk_dir)
+    chunk_dir.mkdir(exist_ok=True)
+    paths = sorted(raw_dir.glob("doc_*.txt"))
+
+    tasks = [(path, chunk_dir) for path in paths]
+    if workers > 1 and len(paths) > 1:
+        with Pool(min(workers, len(paths))) as pool:
+            # imap returns results in task order, whichever worker finishes first
+            per_document = list(pool.imap(_chunk_document_task, tasks, chunksize=DOCUMENTS_PER_TASK))
+    else:
+        per_document = [chunk_document(*task) for task in tasks]
+    metadata_list = [metadata for document in per_document for metadata in document]
+
+    # Save metadata
+    with open(chunk_dir / "metadata.json", "w") as mf:
+        json.dump(metadata_list, mf)
+    return metadata_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split raw documents into chunks")
+    parser.add_argument("--raw-dir", default="./raw_docs", help="Directory of the doc_*.txt documents")
+    parser.add_argument("--chunk-dir", default="./chunks", help="Directory to write the chunks to")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Worker processes splitting documents in parallel (0: one per CPU)"
+    )
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count() or 1
+    metadata_list = chunk_documents(args.raw_dir, args.chunk_dir, workers=workers)
+    print(f"Wrote {len(metadata_list)} chunks to {args.chunk_dir}")
+
+
+if __name__ == "__main__":
+    main()
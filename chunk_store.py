@@ -0,0 +1,91 @@
+"""
+Pickle-free, memory-mapped storage for chunk texts and metadata
+
+Records are concatenated into one contiguous blob file, with an int64 array
+of offsets saved next to it (record i spans offsets[i]:offsets[i + 1]). Both
+files are memory-mapped on load, so opening a store costs almost nothing and
+a record is only read and decoded when it is accessed, e.g. for the top-k
+hits of a query.
+"""
+from collections.abc import Sequence
+import json
+import mmap
+import os
+
+import numpy as np
+
+
+def encode_text(text):
+    return text.encode("utf-8")
+
+
+def decode_text(data):
+    return data.decode("utf-8")
+
+
+def encode_json(record):
+    return json.dumps(record, ensure_ascii=False).encode("utf-8")
+
+
+def decode_json(data):
+    return json.loads(data.decode("utf-8"))
+
+
+def write_records(blob_path, offsets_path, records, encode):
+    """Write records to a blob file plus an offsets array"""
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    with open(blob_path, "wb") as f:
+        for i, record in enumerate(records):
+            data = encode(record)
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(offsets_path, offsets)
+
+
+class RecordStore(Sequence):
+    """Read-only, lazily decoded sequence of records backed by a blob file"""
+
+    def __init__(self, blob_path, offsets_path, decode):
+        self.decode = decode
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        if os.path.getsize(blob_path) == 0:
+            # mmap cannot map empty files
+            self._blob = b""
+        else:
+            with open(blob_path, "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = len(self)
+        i = int(i)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("record index out of range")
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.decode(self._blob[start:end])
+
+
+def write_texts(path, texts):
+    """Save chunk texts as texts.bin and texts.offsets.npy under path"""
+    write_records(f"{path}/texts.bin", f"{path}/texts.offsets.npy", texts, encode_text)
+
+
+def write_metadatas(path, metadatas):
+    """Save chunk metadata as JSON records in metadata.bin and metadata.offsets.npy"""
+    write_records(f"{path}/metadata.bin", f"{path}/metadata.offsets.npy", metadatas, encode_json)
+
+
+def open_texts(path):
+    """Open the chunk texts written by write_texts"""
+    return RecordStore(f"{path}/texts.bin", f"{path}/texts.offsets.npy", decode_text)
+
+
+def open_metadatas(path):
+    """Open the chunk metadata written by write_metadatas"""
+    return RecordStore(f"{path}/metadata.bin", f"{path}/metadata.offsets.npy", decode_json)
@@ -18,15 +18,21 @@ https://docs.aws.amazon.com/wellarchitected/latest/framework/welcome.html
 """
 import json
 from pathlib import Path
-import pickle
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import faiss
 from tqdm import tqdm
 import os
 from dotenv import load_dotenv
 
+from index_factory import ANN_INDEX_TYPES
+# The vector store classes live in vector_store so the query path can import
+# them without the build-time dependencies; re-exported here for callers
+from vector_store import INDEX_TYPES, STORE_FORMAT, LsaEmbeddings, SimpleVectorStore, TfidfEmbeddings
+from sharded_store import ShardedVectorStore
+from bm25_index import BM25Index, KeywordStore
+from hybrid_search import HybridSearch
+from inverted_index import InvertedIndex
+from near_duplicates import DEFAULT_THRESHOLD, find_near_duplicates
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -36,121 +42,114 @@ load_dotenv()
 CHUNK_DIR = Path("./chunks")
 VECTOR_STORE_PATH = "./faiss_index"
 
-class TfidfEmbeddings:
-    """Simple TF-IDF based embeddings"""
-    
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(lowercase=True, stop_words='english')
-        self.trained = False
-        self.vectors = None
-    
-    def fit(self, texts):
-        """Fit the vectorizer on the texts"""
-        self.vectors = self.vectorizer.fit_transform(texts)
-        self.trained = True
-    
-    def embed_documents(self, texts):
-        """Embed documents using the fitted vectorizer"""
-        if not self.trained:
-            raise ValueError("Vectorizer not trained. Call fit() first.")
-        return self.vectorizer.transform(texts).toarray()
-    
-    def embed_query(self, text):
-        """Embed a single query"""
-        if not self.trained:
-            raise ValueError("Vectorizer not trained. Call fit() first.")
-        return self.vectorizer.transform([text]).toarray()[0]
-
-class SimpleVectorStore:
-    """Simple vector store using FAISS"""
-    
-    def __init__(self, embeddings, texts=None, metadatas=None):
-        self.embeddings = embeddings
-        self.texts = texts or []
-        self.metadatas = metadatas or []
-        self.index = None
-    
-    def add_texts(self, texts, metadatas=None):
-        """Add texts to the vector store"""
-        if metadatas is None:
-            metadatas = [{} for _ in texts]
-        
-        self.texts.extend(texts)
-        self.metadatas.extend(metadatas)
-        
-        if not self.embeddings.trained:
-            self.embeddings.fit(self.texts)
-        
-        vectors = self.embeddings.embed_documents(texts)
-        
-        if self.index is None:
-            # Initialize FAISS index
-            dimension = vectors.shape[1]
-            self.index = faiss.IndexFlatL2(dimension)
-        
-        # Add vectors to index
-        self.index.add(np.array(vectors).astype('float32'))
-    
-    def similarity_search_with_score(self, query, k=5):
-        """Search for similar documents"""
-        query_vector = self.embeddings.embed_query(query)
-        
-        # Search in FAISS
-        distances, indices = self.index.search(
-            np.array([query_vector]).astype('float32'), k
-        )
-        
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.texts):
-                results.append((self.texts[idx], self.metadatas[idx], distances[0][i]))
-        
-        return results
-        
-    def save(self, path):
-        """Save the vector store to disk"""
-        data = {
-            "texts": self.texts,
-            "metadatas": self.metadatas,
-        }
-        
-        # Create directory if it doesn't exist
-        os.makedirs(path, exist_ok=True)
-        
-        # Save texts and metadata
-        with open(f"{path}/data.pickle", "wb") as f:
-            pickle.dump(data, f)
-        
-        # Save FAISS index
-        faiss.write_index(self.index, f"{path}/index.faiss")
-        
-        # Save vectorizer
-        with open(f"{path}/vectorizer.pickle", "wb") as f:
-            pickle.dump(self.embeddings.vectorizer, f)
+# Embedding model for new vector stores: "tfidf" uses raw TF-IDF vectors,
+# "lsa" projects them to EMBEDDING_DIMENSION latent dimensions
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "tfidf")
+EMBEDDING_DIMENSION = int(os.environ.get("EMBEDDING_DIMENSION", 256))
+
+# Search engine used for new vector stores: "sparse" keeps the TF-IDF matrix
+# sparse, "flat" stores dense vectors in a FAISS flat index, and the
+# approximate types (see index_factory) trade some recall for speed on large
+# corpora. Defaults to sparse for TF-IDF and flat for LSA, which produces
+# dense vectors.
+INDEX_TYPE = os.environ.get("INDEX_TYPE")
+
+# Number of shards the chunks are split across; with more than one, the
+# shards are searched in parallel (see sharded_store)
+VECTOR_STORE_SHARDS = int(os.environ.get("VECTOR_STORE_SHARDS", 1))
+
+# BM25 engine for the keyword index: "inverted" stores compressed postings
+# and skips most of them for top-k queries (see inverted_index), "matrix"
+# scores every posting of the query terms with one sparse product
+BM25_ENGINE = os.environ.get("BM25_ENGINE", "inverted")
+BM25_ENGINES = {"inverted": InvertedIndex, "matrix": BM25Index}
+
+# Chunks whose word shingles overlap an earlier chunk's by at least this
+# Jaccard similarity are left out of the indexes (see near_duplicates);
+# 0 keeps every chunk
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", DEFAULT_THRESHOLD))
+
+# Build and default search settings for approximate indexes, read from the
+# environment when set (e.g. IVF_NLIST=1024 IVF_NPROBE=16)
+INDEX_PARAM_ENV_VARS = {
+    "nlist": "IVF_NLIST",
+    "nprobe": "IVF_NPROBE",
+    "pq_m": "PQ_M",
+    "nbits": "PQ_NBITS",
+    "hnsw_m": "HNSW_M",
+    "ef_construction": "HNSW_EF_CONSTRUCTION",
+    "ef_search": "HNSW_EF_SEARCH",
+}
+
+def evaluate_recall(store, exact_store, queries, k=5):
+    """Mean recall@k of store's results against exact_store's ranking.
     
-    @classmethod
-    def load(cls, path):
-        """Load the vector store from disk"""
-        # Load texts and metadata
-        with open(f"{path}/data.pickle", "rb") as f:
-            data = pickle.load(f)
-        
-        # Load vectorizer
-        with open(f"{path}/vectorizer.pickle", "rb") as f:
-            vectorizer = pickle.load(f)
-        
-        # Create embeddings
-        embeddings = TfidfEmbeddings()
-        embeddings.vectorizer = vectorizer
-        embeddings.trained = True
-        
-        # Create vector store
-        store = cls(embeddings, data["texts"], data["metadatas"])
-        
-        # Load FAISS index
-        store.index = faiss.read_index(f"{path}/index.faiss")
-        
-        return store
+    Both stores must hold the same chunks in the same order.
+    """
+    _, approx = store.search_indices(queries, k=k)
+    _, exact = exact_store.search_indices(queries, k=k)
+    recalls = []
+    for approx_row, exact_row in zip(approx, exact):
+        expected = set(exact_row[exact_row >= 0].tolist())
+        if expected:
+            found = set(approx_row[approx_row >= 0].tolist())
+            recalls.append(len(found & expected) / len(expected))
+    return float(np.mean(recalls)) if recalls else 1.0
+
+def sample_queries(texts, n=200, n_words=8, seed=0):
+    """Pseudo-queries made of the opening words of randomly sampled chunks"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(texts), size=min(n, len(texts)), replace=False)
+    return [" ".join(texts[i].split()[:n_words]) for i in picks]
+
+def sample_known_items(texts, n=200, n_words=5, seed=0):
+    """Keyword queries of random words from randomly sampled chunks.
+
+    Returns (queries, targets), where targets[i] is the chunk query i was
+    drawn from.
+    """
+    rng = np.random.default_rng(seed)
+    queries, targets = [], []
+    for i in rng.choice(len(texts), size=min(n, len(texts)), replace=False):
+        words = texts[i].split()
+        if len(words) >= n_words:
+            queries.append(" ".join(rng.choice(words, size=n_words, replace=False)))
+            targets.append(int(i))
+    return queries, targets
+
+def evaluate_hit_rate(search_batch, texts, queries, targets, k=3):
+    """Share of queries whose source chunk is among the top k results of
+    search_batch (a similarity_search_with_score_batch-style function)"""
+    results = search_batch(queries, k=k)
+    hits = [any(text == texts[target] for text, _, _ in found) for found, target in zip(results, targets)]
+    return float(np.mean(hits)) if hits else 1.0
+
+def drop_near_duplicates(texts, metadatas, threshold=DEDUP_THRESHOLD):
+    """Remove near-duplicate chunks, keeping the first copy of each.
+
+    Returns (texts, metadatas, report), where report records the threshold
+    and, for every dropped chunk, its id, the id of the kept chunk it
+    duplicates and their similarity.
+    """
+    report = {"threshold": threshold, "chunks": len(texts), "dropped": []}
+    if threshold <= 0:
+        return texts, metadatas, report
+    duplicates = find_near_duplicates(texts, threshold)
+    report["dropped"] = [
+        {"id": metadatas[dropped]["id"], "duplicate_of": metadatas[kept]["id"], "similarity": round(similarity, 4)}
+        for dropped, kept, similarity in duplicates
+    ]
+    dropped = {dropped for dropped, _, _ in duplicates}
+    kept = [i for i in range(len(texts)) if i not in dropped]
+    return [texts[i] for i in kept], [metadatas[i] for i in kept], report
+
+def index_params_from_env():
+    """Index build and search settings set through environment variables"""
+    return {
+        name: int(os.environ[var])
+        for name, var in INDEX_PARAM_ENV_VARS.items()
+        if os.environ.get(var)
+    }
 
 def main():
     """Create embeddings and save to FAISS vector store"""
@@ -174,14 +173,67 @@ def main():
         else:
             print(f"Warning: Chunk file not found: {chunk_path}")
     
-    print(f"Creating TF-IDF embeddings for {len(texts)} chunks...")
-    embeddings = TfidfEmbeddings()
-    vector_store = SimpleVectorStore(embeddings)
+    texts, metadatas, dedup_report = drop_near_duplicates(texts, metadatas)
+    if dedup_report["dropped"]:
+        print(f"Dropped {len(dedup_report['dropped'])} near-duplicate chunks "
+              f"(similarity >= {DEDUP_THRESHOLD}), e.g.:")
+        for entry in dedup_report["dropped"][:5]:
+            print(f"  {entry['id']} duplicates {entry['duplicate_of']} ({entry['similarity']:.2f})")
+    
+    if EMBEDDING_MODEL == "lsa":
+        embeddings = LsaEmbeddings(EMBEDDING_DIMENSION)
+        index_type = INDEX_TYPE or "flat"
+    elif EMBEDDING_MODEL == "tfidf":
+        embeddings = TfidfEmbeddings()
+        index_type = INDEX_TYPE or "sparse"
+    else:
+        raise ValueError(f"Unknown embedding model {EMBEDDING_MODEL!r}, expected 'tfidf' or 'lsa'")
+    
+    print(f"Creating {EMBEDDING_MODEL} embeddings for {len(texts)} chunks ({index_type} index)...")
+    if VECTOR_STORE_SHARDS > 1:
+        print(f"Splitting the chunks across {VECTOR_STORE_SHARDS} shards")
+        vector_store = ShardedVectorStore(
+            embeddings, VECTOR_STORE_SHARDS, index_type=index_type, index_params=index_params_from_env()
+        )
+    else:
+        vector_store = SimpleVectorStore(embeddings, index_type=index_type, index_params=index_params_from_env())
     vector_store.add_texts(texts, metadatas)
+    if vector_store.index_params:
+        print(f"Index settings: {vector_store.index_params}")
+    
+    if isinstance(embeddings, LsaEmbeddings) or index_type in ANN_INDEX_TYPES:
+        # Report how much of the exact TF-IDF ranking survives compression
+        # and approximate search
+        exact_embeddings = TfidfEmbeddings(embeddings.vectorizer)
+        exact_store = SimpleVectorStore(exact_embeddings, index_type="sparse")
+        exact_store.add_texts(texts, metadatas)
+        queries = sample_queries(texts)
+        for k in (1, 5, 10):
+            recall = evaluate_recall(vector_store, exact_store, queries, k=k)
+            print(f"{EMBEDDING_MODEL}/{index_type} recall@{k} vs exact TF-IDF: {recall:.3f}")
+    
+    # Keyword index for RETRIEVAL_MODE=keyword and hybrid, over the same chunks
+    if BM25_ENGINE not in BM25_ENGINES:
+        raise ValueError(f"Unknown BM25 engine {BM25_ENGINE!r}, expected one of {sorted(BM25_ENGINES)}")
+    print(f"Building BM25 keyword index ({BM25_ENGINE} engine)...")
+    keyword_index = BM25_ENGINES[BM25_ENGINE].build(embeddings.vectorizer, texts)
+    queries, targets = sample_known_items(texts)
+    keyword_store = KeywordStore(keyword_index, texts, metadatas)
+    hybrid = HybridSearch(vector_store, keyword_index)
+    for name, search_batch in (
+        ("vector", vector_store.similarity_search_with_score_batch),
+        ("keyword", keyword_store.similarity_search_with_score_batch),
+        ("hybrid", hybrid.search_batch),
+    ):
+        hit_rate = evaluate_hit_rate(search_batch, texts, queries, targets)
+        print(f"{name} hit@3 for keyword queries drawn from chunks: {hit_rate:.3f}")
     
     # Save the index
     print(f"Saving vector store to {VECTOR_STORE_PATH}")
     vector_store.save(VECTOR_STORE_PATH)
+    keyword_index.save(f"{VECTOR_STORE_PATH}/bm25")
+    with open(f"{VECTOR_STORE_PATH}/dedup_report.json", "w") as f:
+        json.dump(dedup_report, f, indent=2)
     print("Embeddings and vector store created successfully!")
 
 if __name__ == "__main__":
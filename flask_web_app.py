@@ -10,19 +10,24 @@ LEGAL DISCLAIMER:
 - Users should always refer to the official AWS documentation for authoritative information.
 - AWS Well-Architected Framework documentation is copyrighted by AWS.
 """
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, url_for
 import logging
 import os
 import sys
+import time
 from pathlib import Path
 
+from metadata_filter import parse_filter
+import metrics
+from profiling import profile_call
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Try importing the query assistant, but provide fallback if it fails
 try:
-    from query_assistant import answer_question, create_retriever
+    from query_assistant import answer_question, answer_questions, create_retriever, get_retriever
     logger.info("Successfully imported query_assistant module")
     QUERY_ASSISTANT_AVAILABLE = True
 except Exception as e:
@@ -31,17 +36,36 @@ except Exception as e:
     QUERY_ASSISTANT_AVAILABLE = False
     
     # Mock functions for testing
-    def answer_question(question):
+    def answer_question(question, use_cache=True, filter=None):
         return {
             "answer": f"This is a mock answer for: {question}",
             "sources": ["Mock source 1", "Mock source 2"]
         }
     
+    def answer_questions(questions, filters=None):
+        return [answer_question(question) for question in questions]
+    
     def create_retriever():
         return None
 
+# Largest number of questions accepted by /api/query/batch
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 1000))
+
+# Profiling of single queries on request (X-Profile: 1 header or ?profile=1);
+# profiles are returned inline and also saved to PROFILE_DIR when it is set
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+
 app = Flask(__name__)
 
+# Load the vector store once at startup so requests share a single retriever
+if QUERY_ASSISTANT_AVAILABLE:
+    try:
+        get_retriever()
+        logger.info("Vector store loaded")
+    except (Exception, SystemExit) as e:
+        logger.error(f"Failed to load vector store at startup: {e}")
+
 # Create templates directory if it doesn't exist
 templates_dir = Path("templates")
 templates_dir.mkdir(exist_ok=True)
@@ -190,11 +214,47 @@ if not index_html.exists():
 </html>
         """)
 
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.teardown_request
+def record_request_time(exc=None):
+    """Time every API request for the /metrics endpoint"""
+    start = g.pop('request_start', None)
+    if start is not None and request.path.startswith('/api/'):
+        # Label by route template, so clients cannot create new metric series
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(endpoint, time.perf_counter() - start)
+
 @app.route('/', methods=['GET'])
 def index():
     """Render the main page"""
     return render_template('index.html')
 
+def profiling_requested():
+    """Whether this request asked for a profile and profiling is enabled"""
+    return PROFILING_ENABLED and (
+        request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+    )
+
+def invalid_filter(filter):
+    """Error message for an invalid metadata filter, or None if it is valid"""
+    try:
+        parse_filter(filter)
+    except ValueError as e:
+        return str(e)
+    return None
+
+def profiled_answer(question, filter=None):
+    """Answer one question under the profiler, bypassing the cache"""
+    result, profile = profile_call(answer_question, question, use_cache=False, filter=filter)
+    logger.info(f"Profiled query in {profile.elapsed * 1000:.1f} ms")
+    response = {"answer": result["answer"], "sources": result["sources"], "profile": profile.collapsed()}
+    if PROFILE_DIR:
+        response["profile_file"] = profile.save_in(PROFILE_DIR)
+    return response
+
 @app.route('/api/query', methods=['POST'])
 def query():
     """Process a query and return the answer with sources"""
@@ -204,9 +264,17 @@ def query():
             return jsonify({"error": "No question provided"}), 400
             
         question = data['question']
+        # Restricts the passages by metadata, e.g. {"pillar": "security"}
+        filter = data.get('filter')
+        error = invalid_filter(filter)
+        if error:
+            return jsonify({"error": error}), 400
         logger.info(f"Processing query: {question}")
         
-        result = answer_question(question)
+        if profiling_requested():
+            return jsonify(profiled_answer(question, filter))
+        
+        result = answer_question(question, filter=filter)
         logger.info("Query processed successfully")
         
         return jsonify({
@@ -215,11 +283,52 @@ def query():
         })
     except Exception as e:
         logger.error(f"Error processing query: {e}")
+        metrics.ERRORS.inc('/api/query')
         return jsonify({
             "answer": f"Error processing your query: {e}",
             "sources": ["Error occurred"]
         }), 500
 
+@app.route('/api/query/batch', methods=['POST'])
+def query_batch():
+    """Process a list of queries with one batched search"""
+    questions = []
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict) or not isinstance(data.get('questions'), list):
+            return jsonify({"error": "No questions provided"}), 400
+        
+        questions = data['questions']
+        if len(questions) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} questions per batch"}), 400
+        if not all(isinstance(question, str) for question in questions):
+            return jsonify({"error": "Questions must be strings"}), 400
+        # Applies to every question of the batch
+        filter = data.get('filter')
+        error = invalid_filter(filter)
+        if error:
+            return jsonify({"error": error}), 400
+        
+        logger.info(f"Processing batch of {len(questions)} queries")
+        results = answer_questions(questions, filters=[filter] * len(questions))
+        logger.info("Batch processed successfully")
+        
+        return jsonify({"results": results})
+    except Exception as e:
+        logger.error(f"Error processing batch: {e}")
+        metrics.ERRORS.inc('/api/query/batch')
+        return jsonify({
+            "results": [
+                {"answer": f"Error processing your query: {e}", "sources": ["Error occurred"]}
+                for _ in questions
+            ]
+        }), 500
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Pipeline latency histograms and counters in Prometheus text format"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     # Get port from environment variable or default to 5001
     port = int(os.environ.get("PORT", 5001))
@@ -237,4 +346,10 @@ if __name__ == "__main__":
     print("For authoritative information, refer to the official AWS documentation.\n")
     
     # Start the server
-    app.run(host="0.0.0.0", port=port, debug=True)
+    if os.environ.get("DEBUG", "").lower() in ("1", "true", "yes"):
+        # Development: Flask's debug server
+        app.run(host="0.0.0.0", port=port, debug=True)
+    else:
+        # Production: pre-forked workers sharing the memory-mapped index
+        from serve import serve
+        serve(app, port=port)
@@ -0,0 +1,51 @@
+"""
+Thread pool that survives a fork
+
+Threads do not survive os.fork(): a ThreadPoolExecutor inherited from the
+parent process believes its worker threads exist and never runs anything
+submitted in the child. ForkSafeExecutor creates its ThreadPoolExecutor on
+first use in each process instead, so objects holding one (sharded stores,
+shard coordinators, hybrid searchers) can be built before a pre-fork
+server forks its workers.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+
+class ForkSafeExecutor:
+    """ThreadPoolExecutor created on first use in each process"""
+
+    def __init__(self, max_workers=None, thread_name_prefix=""):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._lock = threading.Lock()
+        self._executor = None
+        # Process the executor belongs to
+        self._pid = None
+
+    def _get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix=self.thread_name_prefix
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) and return a concurrent.futures.Future"""
+        return self._get().submit(fn, *args, **kwargs)
+
+    def map(self, fn, *iterables):
+        """Like ThreadPoolExecutor.map"""
+        return self._get().map(fn, *iterables)
+
+    def shutdown(self, wait=True):
+        """Shut down this process's executor, if it has been created"""
+        with self._lock:
+            executor = self._executor if self._pid == os.getpid() else None
+            self._executor = self._pid = None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,188 @@
+"""
+Generate a synthetic document corpus for scale testing
+
+Fits a simple model to an existing chunk directory (by default ./chunks) and
+writes an arbitrarily large corpus in the same layout the pipeline uses:
+
+    <output>/raw_docs/doc_000000_synthetic.txt
+    <output>/chunks/doc_000000_synthetic_chunk_000.txt
+    <output>/chunks/metadata.json
+
+The model reproduces:
+- chunks per document and words per chunk, sampled from the real distributions
+- local word order, by stitching together short spans of the real token stream
+- vocabulary growth, following a Heaps' law (V = K * n^beta) fitted to the real
+  chunks, so larger corpora have proportionally larger vocabularies
+
+Raw documents are the chunks joined by blank lines, so chunk_docs.py can
+re-chunk them, create_embeddings.py can index the chunks directly, and the
+query path can be exercised offline at any size.
+
+Usage:
+    python generate_corpus.py --chunks 100000 --output-dir ./synthetic
+"""
+import argparse
+import json
+import re
+import string
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+# Maximum chunk length used by chunk_docs.py
+CHUNK_SIZE = 500
+
+# Tokens are words plus explicit line breaks, so generated text keeps the
+# line structure of the source chunks
+TOKEN_PATTERN = re.compile(r"\S+|\n")
+
+
+def heaps_law(tokens):
+    """Fit V(n) = K * n^beta to the vocabulary growth of a token stream"""
+    seen = set()
+    sizes = []
+    for token in tokens:
+        seen.add(token.lower())
+        sizes.append(len(seen))
+    n = np.arange(1, len(sizes) + 1)
+    # Skip the noisy start of the curve
+    start = min(100, len(sizes) // 10)
+    beta, log_k = np.polyfit(np.log(n[start:]), np.log(sizes[start:]), 1)
+    return float(np.exp(log_k)), float(beta)
+
+
+def novel_word(words, i):
+    """The i-th new word: an alphabetic variant of a real word.
+
+    Suffixes are letters only, so tokenizers keep each variant as one term.
+    """
+    base = words[i % len(words)].strip(string.punctuation) or "term"
+    suffix = ""
+    n = i // len(words) + 1
+    while n:
+        n, r = divmod(n - 1, 26)
+        suffix = string.ascii_lowercase[r] + suffix
+    return f"{base}{suffix}"
+
+
+class CorpusModel:
+    """Statistics of a chunk corpus used to generate look-alike text"""
+
+    def __init__(self, tokens, words_per_chunk, chunks_per_doc, heaps_k, heaps_beta):
+        self.tokens = np.array(tokens, dtype=object)
+        self.words_per_chunk = np.array(words_per_chunk)
+        self.chunks_per_doc = np.array(chunks_per_doc)
+        self.heaps_k = heaps_k
+        self.heaps_beta = heaps_beta
+        self.words = sorted({token for token in tokens if token != "\n"})
+
+    @classmethod
+    def fit(cls, chunk_dir):
+        """Fit the model to chunk_dir/metadata.json and its chunk files"""
+        chunk_dir = Path(chunk_dir)
+        with open(chunk_dir / "metadata.json", "r") as f:
+            metadata_list = json.load(f)
+
+        tokens = []
+        words_per_chunk = []
+        for item in metadata_list:
+            chunk_path = chunk_dir / f"{item['id']}.txt"
+            if not chunk_path.exists():
+                continue
+            chunk_tokens = TOKEN_PATTERN.findall(chunk_path.read_text(encoding="utf-8"))
+            tokens.extend(chunk_tokens)
+            words_per_chunk.append(sum(token != "\n" for token in chunk_tokens))
+        if not tokens:
+            raise ValueError(f"No chunk text found in {chunk_dir}")
+
+        chunks_per_doc = list(Counter(item["source"] for item in metadata_list).values())
+        heaps_k, heaps_beta = heaps_law(token for token in tokens if token != "\n")
+        return cls(tokens, words_per_chunk, chunks_per_doc, heaps_k, heaps_beta)
+
+    def novel_word_rate(self, n_chunks):
+        """Fraction of tokens replaced by new words to follow Heaps' law at n_chunks"""
+        total_words = n_chunks * self.words_per_chunk.mean()
+        target_vocab = self.heaps_k * total_words ** self.heaps_beta
+        needed = max(0.0, target_vocab - len({word.lower() for word in self.words}))
+        # Drawing 3x as many novel tokens as new words covers ~95% of them
+        return min(0.5, 3 * needed / max(total_words, 1)), int(needed)
+
+    def generate_chunk(self, rng, n_words, novel_rate, n_novel, mean_span=8):
+        """Text of one chunk with about n_words words"""
+        parts = []
+        produced = 0
+        while produced < n_words:
+            span = int(rng.geometric(1 / mean_span))
+            start = int(rng.integers(0, max(1, len(self.tokens) - span)))
+            piece = list(self.tokens[start:start + span])
+            produced += sum(token != "\n" for token in piece)
+            parts.extend(piece)
+        if novel_rate and n_novel:
+            for i in np.flatnonzero(rng.random(len(parts)) < novel_rate):
+                if parts[i] != "\n":
+                    parts[i] = novel_word(self.words, int(rng.integers(0, n_novel)))
+        text = " ".join(parts).replace(" \n ", "\n").replace("\n ", "\n").replace(" \n", "\n").strip()
+        if len(text) > CHUNK_SIZE:
+            cut = text.rfind(" ", 0, CHUNK_SIZE)
+            text = text[:cut if cut > 0 else CHUNK_SIZE]
+        return text
+
+    def generate(self, output_dir, n_chunks, seed=0):
+        """Write raw_docs/, chunks/ and chunks/metadata.json with n_chunks chunks"""
+        rng = np.random.default_rng(seed)
+        output_dir = Path(output_dir)
+        raw_dir = output_dir / "raw_docs"
+        chunk_dir = output_dir / "chunks"
+        raw_dir.mkdir(parents=True, exist_ok=True)
+        chunk_dir.mkdir(parents=True, exist_ok=True)
+
+        novel_rate, n_novel = self.novel_word_rate(n_chunks)
+        metadata_list = []
+        doc_index = 0
+        while len(metadata_list) < n_chunks:
+            n_doc_chunks = min(int(rng.choice(self.chunks_per_doc)), n_chunks - len(metadata_list))
+            stem = f"doc_{doc_index:06d}_synthetic"
+            raw_path = raw_dir / f"{stem}.txt"
+            chunks = []
+            for idx in range(n_doc_chunks):
+                text = self.generate_chunk(rng, int(rng.choice(self.words_per_chunk)), novel_rate, n_novel)
+                chunk_id = f"{stem}_chunk_{idx:03d}"
+                (chunk_dir / f"{chunk_id}.txt").write_text(text, encoding="utf-8")
+                metadata_list.append({"id": chunk_id, "source": str(raw_path), "chunk_index": idx})
+                chunks.append(text)
+            raw_path.write_text("\n\n".join(chunks), encoding="utf-8")
+            doc_index += 1
+
+        with open(chunk_dir / "metadata.json", "w") as mf:
+            json.dump(metadata_list, mf)
+        return metadata_list
+
+    def generate_texts(self, n_chunks, seed=0):
+        """Generate chunk texts in memory without writing any files"""
+        rng = np.random.default_rng(seed)
+        novel_rate, n_novel = self.novel_word_rate(n_chunks)
+        return [
+            self.generate_chunk(rng, int(rng.choice(self.words_per_chunk)), novel_rate, n_novel)
+            for _ in range(n_chunks)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus for scale testing")
+    parser.add_argument("--chunks", type=int, required=True, help="Number of chunks to generate")
+    parser.add_argument("--output-dir", default="./synthetic", help="Directory to write the corpus to")
+    parser.add_argument("--source-dir", default="./chunks", help="Chunk directory to fit the model to")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    model = CorpusModel.fit(args.source_dir)
+    print(f"Fitted {len(model.tokens)} tokens, {len(model.words)} distinct words, "
+          f"Heaps' law K={model.heaps_k:.2f} beta={model.heaps_beta:.3f}")
+    metadata_list = model.generate(args.output_dir, args.chunks, seed=args.seed)
+    n_docs = len({item["source"] for item in metadata_list})
+    print(f"Wrote {len(metadata_list)} chunks from {n_docs} documents to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Hybrid retrieval: BM25 keyword search fused with vector search
+
+HybridSearch runs the BM25 index and the vector store search for the same
+queries concurrently (the BM25 leg on a worker thread, the vector leg on the
+calling thread), takes the top `candidates` chunks of each and fuses the two
+rankings into one:
+
+- "rrf" (reciprocal rank fusion): score = sum of weight / (RRF_K + rank)
+  over the rankings a chunk appears in. Only ranks matter, so the very
+  different score scales of BM25 and vector distances need no calibration.
+- "weighted": each leg's scores are min-max normalized to [0, 1] over its
+  candidates and combined as weight * vector + (1 - weight) * bm25.
+
+`vector_weight` weighs the vector leg against BM25 in both methods. Fused
+results keep the (text, metadata, distance) form of vector search, with the
+vector distance of each chunk; chunks only BM25 found get an infinite
+distance, which the answer formatting shows without a score.
+"""
+from fork_safe_executor import ForkSafeExecutor
+from metrics import STAGE_SECONDS
+
+FUSION_METHODS = ("rrf", "weighted")
+
+# Rank offset of reciprocal rank fusion; 60 is the value from the original paper
+RRF_K = 60
+
+# TF-IDF vectors rank keyword queries worse than BM25, so BM25 gets the
+# larger share by default
+DEFAULT_VECTOR_WEIGHT = 0.3
+
+
+def reciprocal_rank_fusion(rankings, weights, k=RRF_K):
+    """Fuse ranked lists of ids; returns {id: score}, higher is better"""
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, idx in enumerate(ranking, 1):
+            scores[idx] = scores.get(idx, 0.0) + weight / (k + rank)
+    return scores
+
+
+def weighted_fusion(scored_lists, weights):
+    """Fuse lists of (id, score) pairs, higher scores better, by min-max
+    normalized weighted sum; returns {id: score}"""
+    scores = {}
+    for scored, weight in zip(scored_lists, weights):
+        if not scored:
+            continue
+        values = [score for _, score in scored]
+        low, high = min(values), max(values)
+        for idx, score in scored:
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            scores[idx] = scores.get(idx, 0.0) + weight * normalized
+    return scores
+
+
+class HybridSearch:
+    """Vector search fused with BM25 keyword search"""
+
+    def __init__(self, vector_store, keyword_index, fusion="rrf", vector_weight=DEFAULT_VECTOR_WEIGHT,
+                 candidates=20):
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method {fusion!r}, expected one of {FUSION_METHODS}")
+        if not hasattr(vector_store, "search_indices"):
+            raise ValueError("Hybrid search needs a local vector store")
+        if keyword_index.ntotal != len(vector_store.texts):
+            raise ValueError(
+                f"BM25 index holds {keyword_index.ntotal} chunks but the vector store {len(vector_store.texts)}"
+            )
+        self.vector_store = vector_store
+        self.keyword_index = keyword_index
+        self.fusion = fusion
+        self.vector_weight = vector_weight
+        self.candidates = candidates
+        self._pool = ForkSafeExecutor(thread_name_prefix="bm25")
+
+    def _keyword_search(self, queries, depth, mask):
+        with STAGE_SECONDS.time("bm25"):
+            return self.keyword_index.search(queries, depth, mask=mask)
+
+    def search_batch(self, queries, k=5, search_params=None, filter=None):
+        """Fused results for every query, in the form of
+        similarity_search_with_score_batch. filter applies to both legs."""
+        if not queries:
+            return []
+        depth = max(k, self.candidates)
+        # The store caches the mask, so its own search reuses it
+        mask = self.vector_store.filter_mask(filter)
+        keyword_future = self._pool.submit(self._keyword_search, queries, depth, mask)
+        distances, indices = self.vector_store.search_indices(
+            queries, k=depth, search_params=search_params, filter=filter
+        )
+        keyword_scores, keyword_indices = keyword_future.result()
+
+        weights = (self.vector_weight, 1 - self.vector_weight)
+        texts, metadatas = self.vector_store.texts, self.vector_store.metadatas
+        batch_results = []
+        for row_distances, row_indices, row_scores, row_keyword_indices in zip(
+            distances.tolist(), indices.tolist(), keyword_scores.tolist(), keyword_indices.tolist()
+        ):
+            vector_hits = [(idx, distance) for idx, distance in zip(row_indices, row_distances) if idx >= 0]
+            keyword_hits = [(idx, score) for idx, score in zip(row_keyword_indices, row_scores) if idx >= 0]
+            if self.fusion == "rrf":
+                fused = reciprocal_rank_fusion(
+                    [[idx for idx, _ in vector_hits], [idx for idx, _ in keyword_hits]], weights
+                )
+            else:
+                # Lower distances are better; negate them so higher is better
+                fused = weighted_fusion(
+                    [[(idx, -distance) for idx, distance in vector_hits], keyword_hits], weights
+                )
+            vector_distances = dict(vector_hits)
+            # Ties go to the lower chunk number, as in the underlying indexes
+            ranked = sorted(fused, key=lambda idx: (-fused[idx], idx))[:k]
+            batch_results.append([
+                (texts[idx], metadatas[idx], vector_distances.get(idx, float("inf"))) for idx in ranked
+            ])
+        return batch_results
@@ -0,0 +1,134 @@
+"""
+FAISS index types available to SimpleVectorStore
+
+Besides exact flat search, the store can build approximate indexes for large
+corpora:
+
+- ivf_flat: inverted file over k-means clusters, exact vectors per list
+- ivf_pq: inverted file with product-quantized (compressed) vectors
+- hnsw: hierarchical navigable small-world graph
+
+IVF indexes are trained on the vectors they are built from. Build settings
+(nlist, pq_m, nbits, hnsw_m, ef_construction) and default search settings
+(nprobe, ef_search) are resolved once and stored with the vector store;
+nprobe and ef_search can also be overridden per query, and searches can be
+restricted to a subset of the chunks with a FAISS IDSelector.
+
+FAISS is imported on first use, so sparse-only callers never load it.
+"""
+import math
+
+ANN_INDEX_TYPES = ("ivf_flat", "ivf_pq", "hnsw")
+
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "ivf_flat": {"nprobe": 8},
+    "ivf_pq": {"nprobe": 8},
+    "hnsw": {"hnsw_m": 32, "ef_construction": 40, "ef_search": 64},
+}
+
+# Settings that only affect searching and may be changed per query
+SEARCH_PARAM_NAMES = {
+    "flat": (),
+    "ivf_flat": ("nprobe",),
+    "ivf_pq": ("nprobe",),
+    "hnsw": ("ef_search",),
+}
+
+
+# Default PQ sub-quantizers: the largest divisor of the dimension up to
+# MAX_DEFAULT_PQ_M. Fewer than MIN_DEFAULT_PQ_M would compress each vector
+# into a few bytes and ruin recall, so such dimensions need PQ_M set
+MAX_DEFAULT_PQ_M = 64
+MIN_DEFAULT_PQ_M = 8
+
+
+def _largest_divisor(n, limit):
+    """Largest divisor of n that is at most limit"""
+    for m in range(min(n, limit), 0, -1):
+        if n % m == 0:
+            return m
+    return 1
+
+
+def resolve_index_params(index_type, dimension, n_vectors, params=None):
+    """Fill in defaults for the build and search settings of an index type"""
+    resolved = dict(DEFAULT_INDEX_PARAMS[index_type])
+    resolved.update(params or {})
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # Rule of thumb: about 4 * sqrt(n) lists, and never more lists than vectors
+        resolved.setdefault("nlist", int(4 * math.sqrt(n_vectors)))
+        resolved["nlist"] = max(1, min(resolved["nlist"], n_vectors))
+        resolved["nprobe"] = max(1, min(resolved["nprobe"], resolved["nlist"]))
+    if index_type == "ivf_pq":
+        if "pq_m" not in resolved:
+            resolved["pq_m"] = _largest_divisor(dimension, MAX_DEFAULT_PQ_M)
+            if resolved["pq_m"] < min(MIN_DEFAULT_PQ_M, dimension):
+                raise ValueError(
+                    f"The vector dimension {dimension} has no divisor between {MIN_DEFAULT_PQ_M} and "
+                    f"{MAX_DEFAULT_PQ_M} to use as the number of PQ sub-quantizers; set PQ_M to a divisor "
+                    f"of it, or use EMBEDDING_MODEL=lsa with an EMBEDDING_DIMENSION such as 256"
+                )
+        if dimension % resolved["pq_m"] != 0:
+            raise ValueError(f"pq_m={resolved['pq_m']} must divide the vector dimension {dimension}")
+        # PQ training needs at least 2**nbits vectors per sub-quantizer
+        resolved.setdefault("nbits", max(1, min(8, int(math.log2(max(n_vectors, 2))))))
+    return resolved
+
+
+def create_index(index_type, dimension, metric, params):
+    """Create an empty (possibly untrained) FAISS index"""
+    import faiss
+    if index_type == "flat":
+        return faiss.IndexFlat(dimension, metric)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["hnsw_m"], metric)
+        index.hnsw.efConstruction = params["ef_construction"]
+        apply_search_params(index, index_type, params)
+        return index
+    quantizer = faiss.IndexFlat(dimension, metric)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dimension, params["nlist"], metric)
+    elif index_type == "ivf_pq":
+        index = faiss.IndexIVFPQ(
+            quantizer, dimension, params["nlist"], params["pq_m"], params["nbits"], metric
+        )
+    else:
+        raise ValueError(f"Unknown FAISS index type {index_type!r}")
+    apply_search_params(index, index_type, params)
+    return index
+
+
+def apply_search_params(index, index_type, params):
+    """Set the default search settings stored in params on the index"""
+    import faiss
+    if index_type in ("ivf_flat", "ivf_pq") and "nprobe" in params:
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+    elif index_type == "hnsw" and "ef_search" in params:
+        index.hnsw.efSearch = params["ef_search"]
+
+
+def search_parameters(index_type, overrides, selector=None, defaults=None):
+    """Per-query FAISS SearchParameters for overrides such as {"nprobe": 32}.
+
+    selector (a FAISS IDSelector) restricts the search to the chunks it
+    selects. SearchParameters replace all of the index's own search
+    settings, so those not overridden are taken from defaults, the index's
+    stored parameters.
+    """
+    if not overrides and selector is None:
+        return None
+    overrides = overrides or {}
+    unknown = set(overrides) - set(SEARCH_PARAM_NAMES.get(index_type, ()))
+    if unknown:
+        raise ValueError(f"Search parameters {sorted(unknown)} do not apply to {index_type!r} indexes")
+    settings = dict(DEFAULT_INDEX_PARAMS.get(index_type, {}))
+    settings.update(defaults or {})
+    settings.update(overrides)
+    import faiss
+    extra = {} if selector is None else {"sel": selector}
+    if index_type == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=int(settings["ef_search"]), **extra)
+    if index_type in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(nprobe=int(settings["nprobe"]), **extra)
+    return faiss.SearchParameters(**extra)
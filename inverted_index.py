@@ -0,0 +1,241 @@
+"""
+Inverted-index BM25 engine with compressed postings and block-max pruning
+
+The postings of every term of the TfidfVectorizer vocabulary are cut into
+blocks by chunk number: a block holds the term's postings among block_size
+consecutive chunks. Postings are compressed frame-of-reference style: a chunk
+is stored as its offset from the block's first chunk number, which fits in
+one byte for the default block size of 256, and term frequencies in the
+narrowest unsigned type that holds the largest of them (one byte in
+practice). A posting thus takes two bytes, against eight (int32 chunk number
+and float32 weight) in BM25Index, and a block decodes with no per-posting
+work beyond a widening copy. Every block also records the largest BM25
+weight among its postings; block positions are likewise stored in the
+narrowest integer types that hold them.
+
+Top-k search prunes with these block maxima, block-max WAND applied to whole
+ranges of chunk numbers: the sum of the query terms' block maxima in a range
+bounds the score of every chunk in it. Ranges are scored in order of
+decreasing bound, in batches of doubling size, and the search stops as soon
+as no remaining range can beat the current k-th score, so the postings of
+those ranges are never read. A metadata filter mask drops the ranges
+without any allowed chunk before the search starts.
+
+Results are exactly those of BM25Index: the same weights summed in the same
+order, with ties going to the lower chunk number.
+"""
+import json
+import os
+
+import numpy as np
+
+from bm25_index import (
+    DEFAULT_B, DEFAULT_K1, BM25Index, as_query_vectorizer, inverse_document_frequency, length_norms,
+    term_weights,
+)
+from sparse_index import smallest_k
+
+# Consecutive chunk numbers covered by one block of postings
+DEFAULT_BLOCK_SIZE = 256
+
+# Relative slack on block score bounds, covering the float32 rounding of
+# the scores they bound
+_BOUND_SLACK = 1e-5
+
+_ARRAYS = (
+    "term_blocks", "block_ranges", "block_max", "block_postings", "offsets", "tfs", "length_norms", "idf",
+)
+
+
+def _concatenated_ranges(starts, ends):
+    """Concatenation of np.arange(start, end) for every start, end pair"""
+    lengths = ends - starts
+    shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(int(lengths.sum())) + shifts
+
+
+class InvertedIndex:
+    """BM25 search over compressed, block-max annotated postings"""
+
+    def __init__(self, vectorizer, arrays, k1=DEFAULT_K1, b=DEFAULT_B, block_size=DEFAULT_BLOCK_SIZE):
+        self.vectorizer = as_query_vectorizer(vectorizer)
+        # Blocks of term t: term_blocks[t]:term_blocks[t + 1]. Block j holds
+        # postings block_postings[j]:block_postings[j + 1] of offsets and tfs,
+        # for chunks block_ranges[j] * block_size + offsets
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.k1 = k1
+        self.b = b
+        self.block_size = block_size
+
+    @property
+    def ntotal(self):
+        return len(self.length_norms)
+
+    @classmethod
+    def build(cls, vectorizer, texts, k1=DEFAULT_K1, b=DEFAULT_B, block_size=DEFAULT_BLOCK_SIZE):
+        """Index texts, tokenized with vectorizer's vocabulary"""
+        vectorizer = as_query_vectorizer(vectorizer)
+        counts = vectorizer.term_counts(texts)
+        n_docs, n_terms = counts.shape
+        norms = length_norms(np.asarray(counts.sum(axis=1)).ravel(), k1, b)
+        idf = inverse_document_frequency(counts)
+
+        # Term-major postings, chunk numbers ascending within each term
+        postings = counts.T.tocsr()
+        postings.sort_indices()
+        terms = np.repeat(np.arange(n_terms, dtype=np.int64), np.diff(postings.indptr))
+        docs = postings.indices.astype(np.int64)
+        tf = postings.data
+        weights = term_weights(idf[terms], tf, norms[docs], k1)
+
+        # The postings of a term within one chunk range form a block
+        ranges = docs // block_size
+        keys = terms * (n_docs // block_size + 1) + ranges
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else keys
+        block_ranges = ranges[starts]
+
+        arrays = {
+            "term_blocks": np.searchsorted(terms[starts], np.arange(n_terms + 1)).astype(
+                np.min_scalar_type(len(starts))
+            ),
+            "block_ranges": block_ranges.astype(np.min_scalar_type(n_docs // block_size)),
+            "block_max": np.maximum.reduceat(weights, starts) if len(starts) else weights,
+            "block_postings": np.append(starts, len(docs)).astype(np.min_scalar_type(len(docs))),
+            "offsets": (docs - ranges * block_size).astype(np.min_scalar_type(block_size - 1)),
+            "tfs": tf.astype(np.min_scalar_type(int(tf.max()) if len(tf) else 0)),
+            "length_norms": norms,
+            "idf": idf,
+        }
+        return cls(vectorizer, arrays, k1=k1, b=b, block_size=block_size)
+
+    def search(self, queries, k, mask=None):
+        """Return (scores, indices) arrays of shape (n_queries, k).
+
+        Higher scores are better. Only chunks sharing a term with the query
+        (and marked True in mask, a boolean array over the chunks, if given)
+        are returned, ordered by score and then by index; rows are padded
+        with -1 indices and -inf scores.
+        """
+        n_queries = len(queries)
+        scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        indices = np.full((n_queries, k), -1, dtype=np.int64)
+        if self.ntotal == 0 or k <= 0 or n_queries == 0:
+            return scores, indices
+
+        allowed_ranges = None
+        if mask is not None:
+            allowed_ranges = np.bincount(
+                np.flatnonzero(mask) // self.block_size, minlength=self.ntotal // self.block_size + 1
+            ) > 0
+        query_counts = self.vectorizer.term_counts(queries)
+        for row in range(n_queries):
+            start, end = query_counts.indptr[row], query_counts.indptr[row + 1]
+            top_scores, top_docs = self._search_terms(
+                query_counts.indices[start:end], query_counts.data[start:end], k, mask, allowed_ranges
+            )
+            scores[row, :len(top_docs)] = top_scores
+            indices[row, :len(top_docs)] = top_docs
+        return scores, indices
+
+    def _search_terms(self, terms, term_counts, k, mask=None, allowed_ranges=None):
+        """Top k (scores, chunk numbers) for distinct query terms in ascending
+        order, among the chunks of mask and the ranges of allowed_ranges"""
+        # Every block of the query terms, in term order
+        first_blocks = self.term_blocks[terms].astype(np.int64)
+        end_blocks = self.term_blocks[terms + 1].astype(np.int64)
+        blocks = _concatenated_ranges(first_blocks, end_blocks)
+        block_terms = np.repeat(np.arange(len(terms)), end_blocks - first_blocks)
+        block_ranges = self.block_ranges[blocks].astype(np.int64)
+        bounds = np.bincount(
+            block_ranges, weights=term_counts[block_terms] * self.block_max[blocks],
+            minlength=self.ntotal // self.block_size + 1,
+        )
+        if allowed_ranges is not None:
+            bounds[~allowed_ranges] = 0
+        candidates = np.flatnonzero(bounds)
+        order = candidates[np.lexsort((candidates, -bounds[candidates]))]
+
+        top_scores = np.zeros(0, dtype=np.float32)
+        top_docs = np.zeros(0, dtype=np.int64)
+        scored = 0
+        batch_size = 1
+        while scored < len(order):
+            batch = order[scored:scored + batch_size]
+            if len(top_docs) == k:
+                # Ranges bounded below the k-th score cannot contribute, and
+                # neither can any range after them
+                batch = batch[bounds[batch] * (1 + _BOUND_SLACK) >= top_scores[-1]]
+                if len(batch) == 0:
+                    break
+            batch_scores, batch_docs = self._score_ranges(
+                np.sort(batch), k, terms, term_counts, blocks, block_terms, block_ranges, mask
+            )
+            merged_scores = np.concatenate((top_scores, batch_scores))
+            merged_docs = np.concatenate((top_docs, batch_docs))
+            keep = np.lexsort((merged_docs, -merged_scores))[:k]
+            top_scores, top_docs = merged_scores[keep], merged_docs[keep]
+            scored += batch_size
+            batch_size *= 2
+        return top_scores, top_docs
+
+    def _score_ranges(self, chunk_ranges, k, terms, term_counts, blocks, block_terms, block_ranges, mask=None):
+        """Top k (scores, chunk numbers) among the chunks of ascending
+        chunk_ranges, restricted to those of mask if given"""
+        # Chunk c of the i-th range is scored at position i * block_size + offset
+        slots = np.full(self.ntotal // self.block_size + 1, -1)
+        slots[chunk_ranges] = np.arange(len(chunk_ranges))
+        selected = slots[block_ranges] >= 0
+        blocks, block_terms, block_ranges = blocks[selected], block_terms[selected], block_ranges[selected]
+
+        first = self.block_postings[blocks].astype(np.int64)
+        end = self.block_postings[blocks + 1].astype(np.int64)
+        postings = _concatenated_ranges(first, end)
+        offsets = self.offsets[postings].astype(np.int64)
+        posting_terms = np.repeat(block_terms, end - first)
+        docs = np.repeat(block_ranges * self.block_size, end - first) + offsets
+        weights = term_weights(self.idf[terms[posting_terms]], self.tfs[postings], self.length_norms[docs], self.k1)
+        contributions = term_counts[posting_terms] * weights
+        positions = np.repeat(slots[block_ranges] * self.block_size, end - first) + offsets
+
+        # Add term by term, so every chunk's score is summed in the same
+        # float32 order as in the sparse product of BM25Index
+        scores = np.zeros(len(chunk_ranges) * self.block_size, dtype=np.float32)
+        term_ends = np.searchsorted(posting_terms, np.arange(len(terms) + 1))
+        for start, stop in zip(term_ends[:-1], term_ends[1:]):
+            scores[positions[start:stop]] += contributions[start:stop]
+        matched = np.zeros(len(scores), dtype=bool)
+        matched[positions if mask is None else positions[mask[docs]]] = True
+
+        # Positions ascend with chunk number, so ties keep the lower chunk
+        candidates = np.flatnonzero(matched)
+        top = candidates[smallest_k(-scores[candidates], min(k, len(candidates)))]
+        return scores[top], chunk_ranges[top // self.block_size] * self.block_size + top % self.block_size
+
+    def save(self, path):
+        """Save the postings as .npy arrays that can be memory-mapped"""
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(f"{path}/{name}.npy", getattr(self, name))
+        with open(f"{path}/config.json", "w") as f:
+            json.dump({
+                "engine": "inverted", "k1": self.k1, "b": self.b, "block_size": self.block_size,
+                "chunks": self.ntotal,
+            }, f)
+
+    @classmethod
+    def load(cls, path, vectorizer, mmap=True):
+        """Load an index saved by save(), tokenizing with the store's vectorizer"""
+        with open(f"{path}/config.json", "r") as f:
+            config = json.load(f)
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np.load(f"{path}/{name}.npy", mmap_mode=mmap_mode) for name in _ARRAYS}
+        return cls(vectorizer, arrays, k1=config["k1"], b=config["b"], block_size=config["block_size"])
+
+
+def load_bm25_index(path, vectorizer, mmap=True):
+    """Load the BM25Index or InvertedIndex saved in path"""
+    with open(f"{path}/config.json", "r") as f:
+        engine = json.load(f).get("engine")
+    index_class = InvertedIndex if engine == "inverted" else BM25Index
+    return index_class.load(path, vectorizer, mmap=mmap)
@@ -0,0 +1,263 @@
+"""
+Metadata filters evaluated with precomputed chunk bitmaps
+
+A filter restricts a search to the chunks whose metadata match it:
+
+    {"source": "raw_docs/doc_0012_...txt"}         one source document
+    {"pillar": ["security", "reliability"]}        any of several pillars
+    {"chunk_index": {"gte": 0, "lte": 2}}          a range of chunk_index
+
+A list matches any of its values and the fields of one filter must all
+match. The pillar of a chunk is derived from its source file name (see
+pillar_of); chunks of other documents have no pillar.
+
+MetadataIndex is built once at index time and saved next to the vector
+store. For every value of source and pillar it records the chunks holding
+it, in the cheaper of two forms, as Roaring bitmaps do: a packed bitmap of
+all chunks for common values (every pillar on a real corpus) and a sorted
+list of chunk numbers for rare ones (a single source document). chunk_index
+is kept as one integer per chunk. mask() combines these into a boolean mask
+of the allowed chunks, which the search engines apply inside the search
+(FAISS through an IDSelectorBitmap), so a filtered search still returns k
+results whenever k chunks match.
+"""
+from collections import OrderedDict
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+# Source file name markers of each pillar: the short prefix of the pillar's
+# framework pages (e.g. "-sec-design") or the start of its own guide's name
+PILLARS = {
+    "operational-excellence": re.compile(r"-(oe-|operational-exc)"),
+    "security": re.compile(r"-(sec-|security)"),
+    "reliability": re.compile(r"-(rel-|reliability)"),
+    "performance-efficiency": re.compile(r"-(perf-|performance)"),
+    "cost-optimization": re.compile(r"-(cost-)"),
+    "sustainability": re.compile(r"-(sus-|sustainab)"),
+}
+
+# Fields matched by value, and the range comparisons chunk_index accepts
+VALUE_FIELDS = ("source", "pillar")
+RANGE_BOUNDS = ("gte", "gt", "lte", "lt")
+
+CHUNK_INDEX_MAX = int(np.iinfo(np.int32).max)
+
+# Masks of recently used filters kept by each MetadataIndex
+MASK_CACHE_SIZE = 64
+
+
+def pillar_of(source):
+    """Pillar a chunk's source document belongs to, or None"""
+    name = os.path.basename(source or "")
+    for pillar, pattern in PILLARS.items():
+        if pattern.search(name):
+            return pillar
+    return None
+
+
+def parse_filter(spec):
+    """Validate a filter and return it in a normalized, hashable form.
+
+    The result is a tuple of (field, values) pairs for source and pillar,
+    where values is a sorted tuple, plus ("chunk_index", (low, high)) with
+    inclusive bounds. None and {} mean no filter and return None. Raises
+    ValueError for unknown fields, pillars or malformed values.
+    """
+    if not spec:
+        return None
+    if not isinstance(spec, dict):
+        raise ValueError(f"A filter must be a JSON object, got {type(spec).__name__}")
+    unknown = set(spec) - set(VALUE_FIELDS) - {"chunk_index"}
+    if unknown:
+        raise ValueError(f"Cannot filter on {sorted(unknown)}, expected {list(VALUE_FIELDS) + ['chunk_index']}")
+
+    normalized = []
+    for field in VALUE_FIELDS:
+        if field not in spec:
+            continue
+        values = spec[field]
+        values = [values] if isinstance(values, str) else values
+        if not isinstance(values, (list, tuple)) or not all(isinstance(v, str) for v in values):
+            raise ValueError(f"Filter field {field!r} takes a string or a list of strings")
+        if field == "pillar":
+            unknown = set(values) - set(PILLARS)
+            if unknown:
+                raise ValueError(f"Unknown pillars {sorted(unknown)}, expected some of {list(PILLARS)}")
+        normalized.append((field, tuple(sorted(set(values)))))
+
+    if "chunk_index" in spec:
+        bounds = spec["chunk_index"]
+        if isinstance(bounds, int) and not isinstance(bounds, bool):
+            bounds = {"gte": bounds, "lte": bounds}
+        if not isinstance(bounds, dict) or not bounds or set(bounds) - set(RANGE_BOUNDS) or not all(
+            isinstance(v, int) and not isinstance(v, bool) for v in bounds.values()
+        ):
+            raise ValueError(f"Filter field 'chunk_index' takes an integer or integer bounds {list(RANGE_BOUNDS)}")
+        # Inclusive bounds, within the int32 range chunk_index is stored in
+        low, high = 0, CHUNK_INDEX_MAX
+        if "gte" in bounds:
+            low = max(low, bounds["gte"])
+        if "gt" in bounds:
+            low = max(low, bounds["gt"] + 1)
+        if "lte" in bounds:
+            high = min(high, bounds["lte"])
+        if "lt" in bounds:
+            high = min(high, bounds["lt"] - 1)
+        low = min(low, CHUNK_INDEX_MAX)
+        normalized.append(("chunk_index", (low, high)))
+    return tuple(normalized)
+
+
+def _field_values(metadatas, field):
+    if field == "pillar":
+        return [pillar_of(metadata.get("source")) for metadata in metadatas]
+    return [metadata.get(field) for metadata in metadatas]
+
+
+class ValuePostings:
+    """The chunks holding each value of one metadata field.
+
+    Value i (of the sorted `values`) is stored as row bitmap_rows[i] of
+    `bitmaps`, little-endian packed bits as FAISS IDSelectorBitmap reads
+    them, when bitmap_rows[i] >= 0, and otherwise as the chunk numbers
+    ids[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, n_chunks, values, bitmap_rows, bitmaps, offsets, ids):
+        self.n_chunks = n_chunks
+        self.values = list(values)
+        self.positions = {value: i for i, value in enumerate(self.values)}
+        self.bitmap_rows = bitmap_rows
+        self.bitmaps = bitmaps
+        self.offsets = offsets
+        self.ids = ids
+
+    @classmethod
+    def build(cls, field_values):
+        n_chunks = len(field_values)
+        chunks_of = {}
+        for chunk, value in enumerate(field_values):
+            if value is not None:
+                chunks_of.setdefault(str(value), []).append(chunk)
+        values = sorted(chunks_of)
+
+        id_type = np.min_scalar_type(max(n_chunks - 1, 0))
+        # A bitmap costs n_chunks bits whatever the value's frequency
+        dense = [len(chunks_of[value]) * id_type.itemsize * 8 >= n_chunks for value in values]
+        bitmap_rows = np.cumsum(dense, dtype=np.int64) - 1
+        bitmap_rows[~np.array(dense, dtype=bool)] = -1
+        bitmaps = np.zeros((sum(dense), (n_chunks + 7) // 8), dtype=np.uint8)
+        sparse_lists = []
+        for value, row in zip(values, bitmap_rows):
+            chunks = np.array(chunks_of[value], dtype=np.int64)
+            if row >= 0:
+                bits = np.zeros(n_chunks, dtype=bool)
+                bits[chunks] = True
+                bitmaps[row] = np.packbits(bits, bitorder="little")
+                sparse_lists.append(np.zeros(0, dtype=id_type))
+            else:
+                sparse_lists.append(chunks.astype(id_type))
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(chunks) for chunks in sparse_lists])
+        ids = np.concatenate(sparse_lists) if sparse_lists else np.zeros(0, dtype=id_type)
+        return cls(n_chunks, values, bitmap_rows.astype(np.int32), bitmaps, offsets, ids)
+
+    def mask(self, values):
+        """Boolean mask of the chunks holding any of values"""
+        packed = np.zeros((self.n_chunks + 7) // 8, dtype=np.uint8)
+        sparse_values = []
+        for value in values:
+            i = self.positions.get(value)
+            if i is None:
+                continue
+            if self.bitmap_rows[i] >= 0:
+                packed |= self.bitmaps[self.bitmap_rows[i]]
+            else:
+                sparse_values.append(i)
+        mask = np.unpackbits(packed, count=self.n_chunks, bitorder="little").view(bool)
+        for i in sparse_values:
+            mask[self.ids[self.offsets[i]:self.offsets[i + 1]]] = True
+        return mask
+
+
+class MetadataIndex:
+    """Precomputed per-value chunk sets for evaluating filters"""
+
+    def __init__(self, postings, chunk_index):
+        # {field: ValuePostings} for every field of VALUE_FIELDS
+        self.postings = postings
+        # chunk_index of every chunk, -1 where the metadata has none
+        self.chunk_index = chunk_index
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def n_chunks(self):
+        return len(self.chunk_index)
+
+    @classmethod
+    def build(cls, metadatas):
+        """Index the filterable fields of every chunk's metadata"""
+        postings = {field: ValuePostings.build(_field_values(metadatas, field)) for field in VALUE_FIELDS}
+        chunk_index = np.array(
+            [-1 if v is None else int(v) for v in _field_values(metadatas, "chunk_index")], dtype=np.int32
+        )
+        return cls(postings, chunk_index)
+
+    def mask(self, spec):
+        """Read-only boolean mask of the chunks matching a filter, or None
+        for an empty filter"""
+        key = parse_filter(spec)
+        if key is None:
+            return None
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+
+        mask = np.ones(self.n_chunks, dtype=bool)
+        for field, values in key:
+            if field == "chunk_index":
+                low, high = values
+                mask &= (self.chunk_index >= low) & (self.chunk_index <= high)
+            else:
+                mask &= self.postings[field].mask(values)
+        mask.setflags(write=False)
+
+        with self._lock:
+            self._masks[key] = mask
+            if len(self._masks) > MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return mask
+
+    def save(self, path):
+        """Save the index as .npy arrays that can be memory-mapped"""
+        os.makedirs(path, exist_ok=True)
+        config = {"chunks": self.n_chunks, "values": {}}
+        for field, postings in self.postings.items():
+            for name in ("bitmap_rows", "bitmaps", "offsets", "ids"):
+                np.save(f"{path}/{field}.{name}.npy", getattr(postings, name))
+            config["values"][field] = postings.values
+        np.save(f"{path}/chunk_index.npy", self.chunk_index)
+        with open(f"{path}/config.json", "w") as f:
+            json.dump(config, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load an index saved by save()"""
+        with open(f"{path}/config.json", "r") as f:
+            config = json.load(f)
+        mmap_mode = "r" if mmap else None
+        postings = {}
+        for field, values in config["values"].items():
+            arrays = {
+                name: np.load(f"{path}/{field}.{name}.npy", mmap_mode=mmap_mode)
+                for name in ("bitmap_rows", "bitmaps", "offsets", "ids")
+            }
+            postings[field] = ValuePostings(config["chunks"], values, **arrays)
+        return cls(postings, np.load(f"{path}/chunk_index.npy", mmap_mode=mmap_mode))
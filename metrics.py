@@ -0,0 +1,310 @@
+"""
+In-process latency histograms and counters for the query pipeline
+
+Metrics are kept in memory and rendered in the Prometheus text exposition
+format by the web apps' /metrics endpoints, so they can be scraped by
+Prometheus or simply read with curl. Every metric carries one label (e.g.
+the pipeline stage) and is safe to update from any thread. Under the
+pre-fork server (serve.py) the values are kept in memory-mapped files
+instead, one per worker process, and every /metrics response sums them, so
+any worker reports the totals of the whole server.
+
+Pipeline stages timed in STAGE_SECONDS:
+- store_load: loading the vector store from disk
+- embed_query: vectorizing the questions of one search call
+- search: the index search of one search call
+- format_regular / format_summary: formatting one answer
+- shard_fanout: searching all remote shard servers (shard_coordinator)
+- bm25: the BM25 keyword search of one hybrid search call (hybrid_search)
+- filter: evaluating a metadata filter into a chunk mask (metadata_filter)
+"""
+from contextlib import contextmanager
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+# Upper bounds in seconds, from half a millisecond to ten seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Layout of a SharedValues file: the number of bytes in use, then entries of
+# a key length, the UTF-8 JSON key padded to 8 bytes and a float64 value
+_USED = struct.Struct("<Q")
+_KEY_LENGTH = struct.Struct("<I")
+_VALUE = struct.Struct("<d")
+_INITIAL_FILE_SIZE = 1 << 16
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _whole(value):
+    """value as an int when it is a whole number, as counts are"""
+    return int(value) if float(value).is_integer() else value
+
+
+def _padded(size):
+    return (size + 7) & ~7
+
+
+def _read_entries(data):
+    """(key, value offset, value) of every entry of a SharedValues file"""
+    used = _USED.unpack_from(data, 0)[0] if len(data) >= _USED.size else 0
+    position = _USED.size
+    while position < min(used, len(data)):
+        length = _KEY_LENGTH.unpack_from(data, position)[0]
+        key = bytes(data[position + _KEY_LENGTH.size:position + _KEY_LENGTH.size + length])
+        offset = position + _padded(_KEY_LENGTH.size + length)
+        yield key, offset, _VALUE.unpack_from(data, offset)[0]
+        position = offset + _VALUE.size
+
+
+class LocalValues:
+    """Sample values of this process, keyed by tuples"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class SharedValues:
+    """Sample values summed over every process using one directory.
+
+    Each process adds to its own memory-mapped file, <directory>/<pid>.db,
+    opened on its first update, so forked workers never contend for a lock.
+    snapshot() sums the files of all processes, including those that have
+    exited, so totals never go backwards when a worker is replaced.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._map = None
+        self._offsets = {}
+
+    def _open(self):
+        """Open this process's file, keeping the values already in it"""
+        if self._map is not None:
+            # Inherited from the parent process, which still owns the file
+            self._map.close()
+            self._file.close()
+        self._pid = os.getpid()
+        self._file = open(os.path.join(self.directory, f"{self._pid}.db"), "a+b")
+        if os.fstat(self._file.fileno()).st_size < _USED.size:
+            os.ftruncate(self._file.fileno(), _INITIAL_FILE_SIZE)
+            self._map = mmap.mmap(self._file.fileno(), _INITIAL_FILE_SIZE)
+            _USED.pack_into(self._map, 0, _USED.size)
+        else:
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        self._offsets = {key: offset for key, offset, _ in _read_entries(self._map)}
+
+    def _append(self, key):
+        """Add a zero entry for key and return the offset of its value"""
+        used = _USED.unpack_from(self._map, 0)[0]
+        offset = used + _padded(_KEY_LENGTH.size + len(key))
+        end = offset + _VALUE.size
+        if end > len(self._map):
+            size = max(2 * len(self._map), _padded(end))
+            self._map.close()
+            os.ftruncate(self._file.fileno(), size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        _KEY_LENGTH.pack_into(self._map, used, len(key))
+        self._map[used + _KEY_LENGTH.size:used + _KEY_LENGTH.size + len(key)] = key
+        _VALUE.pack_into(self._map, offset, 0.0)
+        # Readers only see the entry once it is complete
+        _USED.pack_into(self._map, 0, end)
+        self._offsets[key] = offset
+        return offset
+
+    def add(self, key, amount):
+        encoded = json.dumps(key).encode("utf-8")
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            offset = self._offsets.get(encoded)
+            if offset is None:
+                offset = self._append(encoded)
+            _VALUE.pack_into(self._map, offset, _VALUE.unpack_from(self._map, offset)[0] + amount)
+
+    def snapshot(self):
+        values = {}
+        for path in glob.glob(os.path.join(self.directory, "*.db")):
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            for encoded, _, value in _read_entries(data):
+                key = tuple(json.loads(encoded))
+                values[key] = values.get(key, 0) + value
+        return values
+
+    def clear(self):
+        """Remove the values of every process"""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._file.close()
+            self._pid = self._file = self._map = None
+            for path in glob.glob(os.path.join(self.directory, "*.db")):
+                os.remove(path)
+
+
+class Counter:
+    """Monotonic counts per label value"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, label):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        # Replaced by the registry's values when registered
+        self.values = LocalValues()
+
+    def inc(self, label_value, amount=1):
+        self.values.add((self.name, label_value), amount)
+
+    def value(self, label_value):
+        return _whole(self.values.snapshot().get((self.name, label_value), 0))
+
+    def samples(self, values=None):
+        values = self.values.snapshot() if values is None else values
+        for key, count in sorted((key, count) for key, count in values.items() if key[0] == self.name):
+            yield self.name, {self.label: key[1]}, _whole(count)
+
+
+class Histogram:
+    """Distribution of durations in seconds per label value"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # (name, label value, bucket number | "sum" | "count") -> value;
+        # replaced by the registry's values when registered
+        self.values = LocalValues()
+
+    def observe(self, label_value, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.values.add((self.name, label_value, i), 1)
+                break
+        self.values.add((self.name, label_value, "sum"), seconds)
+        self.values.add((self.name, label_value, "count"), 1)
+
+    @contextmanager
+    def time(self, label_value):
+        """Observe the duration of the with block, even if it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label_value, time.perf_counter() - start)
+
+    def count(self, label_value):
+        return int(self.values.snapshot().get((self.name, label_value, "count"), 0))
+
+    def samples(self, values=None):
+        values = self.values.snapshot() if values is None else values
+        label_values = sorted({key[1] for key in values if key[0] == self.name})
+        for label_value in label_values:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += int(values.get((self.name, label_value, i), 0))
+                yield f"{self.name}_bucket", {self.label: label_value, "le": bound}, cumulative
+            yield f"{self.name}_sum", {self.label: label_value}, float(values.get((self.name, label_value, "sum"), 0))
+            yield f"{self.name}_count", {self.label: label_value}, int(values.get((self.name, label_value, "count"), 0))
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self.metrics = []
+        self.values = LocalValues()
+
+    def register(self, metric):
+        metric.values = self.values
+        self.metrics.append(metric)
+        return metric
+
+    def share(self, directory):
+        """Sum the metrics of every process that shares directory from now
+        on, e.g. the workers of a pre-fork server, starting from this
+        process's values so far"""
+        values = SharedValues(directory)
+        for key, amount in self.values.snapshot().items():
+            values.add(key, amount)
+        self.values = values
+        for metric in self.metrics:
+            metric.values = values
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        values = self.values.snapshot()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples(values):
+                label_text = ",".join(
+                    f'{key}="{_format_value(label_value)}"' for key, label_value in labels.items()
+                )
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        self.values.clear()
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "rag_stage_duration_seconds", "Time spent in each query pipeline stage", "stage"
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "rag_request_duration_seconds", "Total time to handle a web request", "endpoint"
+))
+QUERIES = registry.register(Counter(
+    "rag_queries_total", "Questions answered, by query type", "type"
+))
+CACHE_REQUESTS = registry.register(Counter(
+    "rag_cache_requests_total", "Query result cache lookups", "result"
+))
+ERRORS = registry.register(Counter(
+    "rag_errors_total", "Requests that failed or were rejected", "endpoint"
+))
+SHARD_REQUESTS = registry.register(Counter(
+    "rag_shard_requests_total", "Searches sent to remote shard servers, by outcome", "result"
+))
+
+
+def render():
+    return registry.render()
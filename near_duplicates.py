@@ -0,0 +1,201 @@
+"""
+Near-duplicate chunk detection with MinHash and locality-sensitive hashing
+
+Two chunks are near-duplicates when the Jaccard similarity of their sets of
+word shingles (runs of SHINGLE_SIZE consecutive lowercased words) reaches a
+threshold. Comparing every pair is quadratic, so candidates are found with
+MinHash LSH:
+
+- every chunk gets a signature of NUM_PERM MinHash values, the smallest
+  hash of its shingles under NUM_PERM random hash functions; two chunks
+  agree on any one value with probability equal to their Jaccard
+  similarity
+- signatures are cut into bands of rows, and chunks whose signatures agree
+  on all rows of some band share a bucket and become candidates. The band
+  shape is chosen so that pairs at the threshold are caught with high
+  probability while dissimilar pairs rarely collide
+
+Candidates are then checked against their exact shingle Jaccard, so LSH
+only ever costs recall, never precision. Chunks are visited in corpus
+order and each is dropped if it is a near-duplicate of an earlier chunk
+that was kept, so the first copy of a passage survives. Chunks sharing no
+bucket with any other chunk, nearly all of them in a corpus with few
+duplicates, are kept without any per-chunk Python work.
+"""
+import re
+
+import numpy as np
+
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+DEFAULT_THRESHOLD = 0.8
+
+# Shingles hashed per batch when computing signatures, bounding the memory
+# of the (shingles x NUM_PERM) intermediate array
+_BATCH_SHINGLES = 1 << 16
+
+_TOKEN = re.compile(r"\w+")
+
+
+def _mix64(x):
+    """splitmix64 finalizer: spreads uint64 values over all 64 bits"""
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def shingle_sets(texts, shingle_size=SHINGLE_SIZE):
+    """Hashed word shingles of every text.
+
+    Returns (hashes, offsets): the sorted, distinct uint64 shingle hashes
+    of text i are hashes[offsets[i]:offsets[i + 1]]. Texts shorter than
+    shingle_size words form a single shingle; texts without words have
+    none.
+    """
+    vocabulary = {}
+    token_ids = []
+    lengths = np.zeros(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        ids = [vocabulary.setdefault(token, len(vocabulary)) for token in _TOKEN.findall(text.lower())]
+        token_ids.extend(ids)
+        lengths[i] = len(ids)
+    tokens = np.array(token_ids, dtype=np.uint64) + np.uint64(1)
+    starts = np.concatenate(([0], np.cumsum(lengths)))
+
+    # Shingle j of a text starts at its token j; short texts get one shingle
+    n_shingles = np.where(lengths > 0, np.maximum(lengths - shingle_size + 1, 1), 0)
+    owners = np.repeat(np.arange(len(texts)), n_shingles)
+    positions = np.arange(int(n_shingles.sum())) - np.repeat(np.cumsum(n_shingles) - n_shingles, n_shingles)
+    first = starts[owners] + positions
+    hashes = np.zeros(len(first), dtype=np.uint64)
+    for offset in range(shingle_size):
+        index = first + offset
+        # Positions past the end of a short text contribute nothing
+        present = index < starts[owners + 1]
+        with np.errstate(over="ignore"):
+            hashes[present] = _mix64(hashes[present] * np.uint64(0x9E3779B97F4A7C15) + tokens[index[present]])
+
+    # Distinct hashes per text, in ascending order
+    order = np.lexsort((hashes, owners))
+    hashes, owners = hashes[order], owners[order]
+    distinct = np.ones(len(hashes), dtype=bool)
+    distinct[1:] = (hashes[1:] != hashes[:-1]) | (owners[1:] != owners[:-1])
+    hashes, owners = hashes[distinct], owners[distinct]
+    offsets = np.searchsorted(owners, np.arange(len(texts) + 1))
+    return hashes, offsets
+
+
+def minhash_signatures(hashes, offsets, num_perm=NUM_PERM, seed=0):
+    """(n_texts x num_perm) uint32 MinHash signatures of shingle sets.
+
+    Hash function p maps a shingle hash x to the high 32 bits of
+    a_p * x + b_p (mod 2**64), with random odd a_p. Texts without
+    shingles get all-ones signatures.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    n_texts = len(offsets) - 1
+    signatures = np.full((n_texts, num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    text_start = 0
+    while text_start < n_texts:
+        # Whole texts per batch, at least one
+        text_end = max(int(np.searchsorted(offsets, offsets[text_start] + _BATCH_SHINGLES, side="right")) - 1,
+                       text_start + 1)
+        text_end = min(text_end, n_texts)
+        lo, hi = offsets[text_start], offsets[text_end]
+        if hi > lo:
+            with np.errstate(over="ignore"):
+                values = ((hashes[lo:hi, None] * a + b) >> np.uint64(32)).astype(np.uint32)
+            counts = np.diff(offsets[text_start:text_end + 1])
+            nonempty = np.flatnonzero(counts)
+            starts = offsets[text_start:text_end][nonempty] - lo
+            signatures[text_start + nonempty] = np.minimum.reduceat(values, starts, axis=0)
+        text_start = text_end
+    return signatures
+
+
+def lsh_bands(threshold, num_perm=NUM_PERM, false_negative_weight=0.7):
+    """(bands, rows) with bands * rows <= num_perm for a Jaccard threshold.
+
+    Pairs with similarity s share a bucket with probability
+    1 - (1 - s**rows)**bands. The shape minimizes the weighted area of that
+    curve above 0 below the threshold (wasted checks) and of its complement
+    above the threshold (missed duplicates); missing duplicates is weighted
+    higher since every candidate is verified anyway.
+    """
+    similarities = np.linspace(0, 1, 1001)
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        collide = 1 - (1 - similarities ** rows) ** bands
+        below = similarities < threshold
+        cost = ((1 - false_negative_weight) * collide[below].sum()
+                + false_negative_weight * (1 - collide[~below]).sum()) / len(similarities)
+        if best is None or cost < best[0]:
+            best = (cost, bands, rows)
+    return best[1], best[2]
+
+
+def _bucket_keys(signatures, bands, rows):
+    """(n_texts x bands) uint64 keys of every band of every signature"""
+    rng = np.random.default_rng(12345)
+    multipliers = rng.integers(0, 2**63, size=rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    keys = np.zeros((len(signatures), bands), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for band in range(bands):
+            band_rows = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+            keys[:, band] = _mix64((band_rows * multipliers).sum(axis=1, dtype=np.uint64) + np.uint64(band))
+    return keys
+
+
+def jaccard(hashes, offsets, i, j):
+    """Exact Jaccard similarity of the shingle sets of texts i and j"""
+    a = hashes[offsets[i]:offsets[i + 1]]
+    b = hashes[offsets[j]:offsets[j + 1]]
+    if len(a) == 0 or len(b) == 0:
+        return 0.0
+    shared = len(np.intersect1d(a, b, assume_unique=True))
+    return shared / (len(a) + len(b) - shared)
+
+
+def find_near_duplicates(texts, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM,
+                         shingle_size=SHINGLE_SIZE, seed=0):
+    """Near-duplicates among texts.
+
+    Returns a list of (dropped, kept, similarity) tuples in ascending order
+    of dropped: text `dropped` has a shingle Jaccard similarity of at least
+    threshold with the earlier text `kept`, which is itself not dropped.
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError(f"Near-duplicate threshold must be in (0, 1], got {threshold}")
+    hashes, offsets = shingle_sets(texts, shingle_size)
+    signatures = minhash_signatures(hashes, offsets, num_perm, seed)
+    bands, rows = lsh_bands(threshold, num_perm)
+    keys = _bucket_keys(signatures, bands, rows)
+    # Texts without shingles are never duplicates
+    keys[np.diff(offsets) == 0] = 0
+
+    # Texts sharing no bucket with another text are kept as they are
+    colliding = np.zeros(len(texts), dtype=bool)
+    for band in range(bands):
+        _, inverse, counts = np.unique(keys[:, band], return_inverse=True, return_counts=True)
+        colliding |= (counts[inverse] > 1) & (keys[:, band] != 0)
+
+    duplicates = []
+    buckets = {}
+    for j in np.flatnonzero(colliding).tolist():
+        candidates = sorted({i for band, key in enumerate(keys[j].tolist()) for i in buckets.get((band, key), ())})
+        match = None
+        for i in candidates:
+            similarity = jaccard(hashes, offsets, i, j)
+            if similarity >= threshold:
+                match = (j, i, similarity)
+                break
+        if match is not None:
+            duplicates.append(match)
+            continue
+        for band, key in enumerate(keys[j].tolist()):
+            buckets.setdefault((band, key), []).append(j)
+    return duplicates
@@ -0,0 +1,99 @@
+"""
+On-demand profiling of single calls, with collapsed-stack output
+
+profile_call(fn, ...) runs one call under a deterministic profiler
+(sys.setprofile) that tracks the full call stack, including C functions
+such as numpy, scipy and FAISS calls, and charges the time between profiler
+events to the stack that was active. The result is written in the
+"collapsed stack" format understood by flamegraph.pl, speedscope and
+similar tools:
+
+    query_assistant.py:answer_question;query_assistant.py:SimpleRetriever.__call__;... 1234
+
+with one line per distinct stack and its self time in microseconds.
+Profiling only affects the calling thread and adds per-call overhead, so it
+is meant for inspecting individual slow queries, not for normal traffic.
+"""
+from collections import Counter
+import itertools
+import os
+import sys
+import time
+
+_profile_ids = itertools.count()
+
+
+def _frame_label(code):
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{os.path.basename(code.co_filename)}:{name}"
+
+
+def _c_function_label(function):
+    module = getattr(function, "__module__", None) or type(getattr(function, "__self__", None)).__name__
+    name = getattr(function, "__qualname__", getattr(function, "__name__", repr(function)))
+    return f"{module}:{name}"
+
+
+class Profile:
+    """Self time per call stack, in nanoseconds"""
+
+    def __init__(self, stacks, elapsed):
+        self.stacks = stacks
+        self.elapsed = elapsed
+
+    def collapsed(self):
+        """Stacks in collapsed format, weighted by self time in microseconds"""
+        lines = []
+        for stack, nanoseconds in sorted(self.stacks.items()):
+            microseconds = nanoseconds // 1000
+            if microseconds:
+                lines.append(f"{';'.join(stack)} {microseconds}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, path):
+        """Write the collapsed stacks to path"""
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+        return path
+
+    def save_in(self, directory):
+        """Write the collapsed stacks to a new, uniquely named file in directory"""
+        os.makedirs(directory, exist_ok=True)
+        name = f"profile_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{next(_profile_ids)}.collapsed"
+        return self.save(os.path.join(directory, name))
+
+
+class _StackTracer:
+    """sys.setprofile callback that accumulates self time per stack"""
+
+    def __init__(self):
+        self.stack = []
+        self.stacks = Counter()
+        self.last = time.perf_counter_ns()
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        if self.stack:
+            self.stacks[tuple(self.stack)] += now - self.last
+        if event == "call":
+            self.stack.append(_frame_label(frame.f_code))
+        elif event == "c_call":
+            self.stack.append(_c_function_label(arg))
+        elif event in ("return", "c_return", "c_exception"):
+            if self.stack:
+                self.stack.pop()
+        # Leave the tracer's own time out of the profile
+        self.last = time.perf_counter_ns()
+
+
+def profile_call(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) under the profiler and return (result, Profile)"""
+    tracer = _StackTracer()
+    start = time.perf_counter()
+    previous = sys.getprofile()
+    sys.setprofile(tracer)
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        sys.setprofile(previous)
+    return result, Profile(tracer.stacks, time.perf_counter() - start)
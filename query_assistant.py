@@ -13,12 +13,20 @@ https://docs.aws.amazon.com/wellarchitected/latest/framework/welcome.html
 """
 import os
 import sys
-import pickle
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Import our custom vector store
-from create_embeddings import SimpleVectorStore, TfidfEmbeddings
+# Import our custom vector store (without the embedding build dependencies)
+from bm25_index import KeywordStore
+from hybrid_search import DEFAULT_VECTOR_WEIGHT, HybridSearch
+from inverted_index import load_bm25_index
+from metadata_filter import parse_filter
+from sharded_store import load_store
+from shard_coordinator import ShardCoordinator
+from metrics import CACHE_REQUESTS, QUERIES, STAGE_SECONDS
+from query_cache import QueryCache
+from singleflight import SingleFlight
 
 # Load environment variables from .env file
 load_dotenv()
@@ -32,10 +40,49 @@ if "OPENAI_API_KEY" not in os.environ:
 # Path to the vector store
 VECTOR_STORE_PATH = Path("./faiss_index")
 
+# Comma-separated shard server URLs (shard_server.py); when set, queries are
+# searched on them instead of the local store, and each shard has
+# SHARD_TIMEOUT_MS milliseconds to answer
+SHARD_SERVERS = [url.strip() for url in os.environ.get("SHARD_SERVERS", "").split(",") if url.strip()]
+SHARD_TIMEOUT_MS = float(os.environ.get("SHARD_TIMEOUT_MS", 1000))
+
+# "vector" searches the vector store only; "keyword" searches the BM25 keyword
+# index over the same chunks (saved in faiss_index/bm25 by create_embeddings.py)
+# instead; "hybrid" runs both and fuses the two rankings, see hybrid_search
+RETRIEVAL_MODES = ("vector", "keyword", "hybrid")
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "vector")
+HYBRID_FUSION = os.environ.get("HYBRID_FUSION", "rrf")
+HYBRID_VECTOR_WEIGHT = float(os.environ.get("HYBRID_VECTOR_WEIGHT", DEFAULT_VECTOR_WEIGHT))
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", 20))
+
+# Cache of recent answers; a size of 0 disables it and a TTL of 0 never expires
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 1024))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 300))
+query_cache = QueryCache(max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+# Concurrent requests for the same uncached answer share one search
+in_flight = SingleFlight()
+
+# Queries containing any of these are answered with a summary
+SUMMARY_KEYWORDS = ["summarize", "summarise", "summary", "overview", "highlight",
+                    "key points", "main points", "critical things", "important aspects"]
+DEFAULT_K = 3  # Passages retrieved for regular questions
+SUMMARY_K = 7  # Passages retrieved for summary questions
+
+def is_summary_query(query):
+    """Detect if the query is asking for a summary"""
+    query_lower = query.lower()
+    return any(keyword in query_lower for keyword in SUMMARY_KEYWORDS)
+
 # We'll use a simpler approach without the langchain retriever abstraction
 
 def load_vector_store():
-    """Load the vector store"""
+    """Load the vector store, or connect to the shard servers"""
+    if SHARD_SERVERS:
+        print(f"Connecting to {len(SHARD_SERVERS)} shard servers...")
+        with STAGE_SECONDS.time("store_load"):
+            return ShardCoordinator(SHARD_SERVERS, timeout=SHARD_TIMEOUT_MS / 1000)
+    
     if not VECTOR_STORE_PATH.exists():
         print(f"Vector store not found at {VECTOR_STORE_PATH}")
         print("Please run create_embeddings.py first")
@@ -43,110 +90,272 @@ def load_vector_store():
     
     print("Loading vector store...")
     try:
-        return SimpleVectorStore.load(VECTOR_STORE_PATH)
+        with STAGE_SECONDS.time("store_load"):
+            return load_store(VECTOR_STORE_PATH)
     except Exception as e:
         print(f"Error loading vector store: {e}")
         print("Make sure you've created the vector store using create_embeddings.py")
         exit(1)
 
-def create_retriever(k=5):
-    """Create a retriever for the FAQ assistant"""
+def load_keyword_index(vector_store):
+    """Load the BM25 index saved next to the vector store"""
+    path = VECTOR_STORE_PATH / "bm25"
+    if not path.exists():
+        print(f"BM25 index not found at {path}")
+        print("Please run create_embeddings.py again to build it")
+        sys.exit(1)
+    return load_bm25_index(path, vector_store.embeddings.vectorizer)
+
+def load_retriever():
+    """Load the vector store, plus the BM25 index in keyword and hybrid mode"""
+    if RETRIEVAL_MODE not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown RETRIEVAL_MODE {RETRIEVAL_MODE!r}, expected one of {RETRIEVAL_MODES}")
+    if RETRIEVAL_MODE != "vector" and SHARD_SERVERS:
+        raise ValueError(f"RETRIEVAL_MODE={RETRIEVAL_MODE} needs the local store and cannot be used with SHARD_SERVERS")
     vector_store = load_vector_store()
-    
-    # Wrap everything in a simple callable object
-    class SimpleRetriever:
-        def __init__(self, vector_store, k=5):
-            self.vector_store = vector_store
-            self.k = k
-            
-        def is_summary_query(self, query):
-            """Detect if the query is asking for a summary"""
-            summary_keywords = ["summarize", "summarise", "summary", "overview", "highlight", 
-                              "key points", "main points", "critical things", "important aspects"]
-            query_lower = query.lower()
-            return any(keyword in query_lower for keyword in summary_keywords)
-            
-        def format_regular_output(self, query, contexts, source_docs):
-            """Format output for regular queries"""
-            result = f"Top {len(contexts)} relevant passages for: {query}\n\n"
-            for i, (text, score) in enumerate(contexts, 1):
-                # Only include scores if they're meaningful
-                if score < 0.95:  # Only show scores that indicate varying relevance
-                    result += f"[{i}] (Relevance: {score:.2f}) {text}\n\n"
-                else:
-                    result += f"[{i}] {text}\n\n"
-                    
-            return result
-            
-        def format_summary_output(self, query, contexts, source_docs):
-            """Format output for summary queries"""
-            # Extract titles and main content from passages
-            titles = []
-            key_points = []
-            
-            for text, _ in contexts:
-                # Try to extract a title if present
-                lines = text.split('\n')
-                if lines and lines[0].strip() and not lines[0].startswith('[Score:'):
-                    title = lines[0].strip()
-                    if len(title) < 100 and not title.startswith('http'):
-                        titles.append(title)
-                
-                # Extract key sentences
-                content = text.replace('\n', ' ')
-                sentences = [s.strip() for s in content.split('.') if len(s.strip()) > 20]
-                key_points.extend(sentences[:2])  # Take first two substantial sentences
-            
-            # Deduplicate titles and key points
-            titles = list(dict.fromkeys(titles))
-            key_points = list(dict.fromkeys(key_points))
-            
-            # Build summary output
-            result = f"Summary of AWS Well-Architected Framework based on your query:\n\n"
-            
-            if titles:
-                result += "Key Components:\n"
-                for title in titles[:5]:  # Limit to 5 titles
-                    result += f"- {title}\n"
-                result += "\n"
-            
-            if key_points:
-                result += "Key Points:\n"
-                for i, point in enumerate(key_points[:10], 1):  # Limit to 10 key points
-                    result += f"{i}. {point}.\n"
-                    
-            return result
-        
-        def __call__(self, query_dict):
-            query = query_dict.get("query")
-            # Get relevant documents
-            results = self.vector_store.similarity_search_with_score(query, k=self.k)
-            
-            # Format contexts and gather metadata
-            contexts = []
-            source_docs = []
-            for text, metadata, score in results:
-                contexts.append((text, score))
-                source_docs.append(metadata)
-            
-            # Check if this is a summary query
-            if self.is_summary_query(query):
-                # Increase number of results for summary queries
-                if len(contexts) < 5:
-                    more_results = self.vector_store.similarity_search_with_score(query, k=7)
-                    for text, metadata, score in more_results:
-                        if (text, score) not in contexts:
-                            contexts.append((text, score))
-                            source_docs.append(metadata)
-                
-                result = self.format_summary_output(query, contexts, source_docs)
+    if RETRIEVAL_MODE == "keyword":
+        keyword_store = KeywordStore(
+            load_keyword_index(vector_store), vector_store.texts, vector_store.metadatas,
+            version=vector_store.version, metadata_index=vector_store.metadata_index,
+        )
+        return SimpleRetriever(keyword_store)
+    hybrid = None
+    if RETRIEVAL_MODE == "hybrid":
+        hybrid = HybridSearch(
+            vector_store, load_keyword_index(vector_store), fusion=HYBRID_FUSION,
+            vector_weight=HYBRID_VECTOR_WEIGHT, candidates=HYBRID_CANDIDATES,
+        )
+    return SimpleRetriever(vector_store, hybrid=hybrid)
+
+class SimpleRetriever:
+    """Callable retriever over a vector store.
+
+    With a HybridSearch, results fuse BM25 keyword search with the vector
+    search. A single instance holds no per-query state, so it can be shared
+    by every thread or async handler in the process.
+    """
+    def __init__(self, vector_store, k=5, hybrid=None):
+        self.vector_store = vector_store
+        self.k = k
+        self.hybrid = hybrid
+
+    def is_summary_query(self, query):
+        """Detect if the query is asking for a summary"""
+        return is_summary_query(query)
+
+    @staticmethod
+    def search_k(k, is_summary):
+        """Number of passages to retrieve; summaries always get at least SUMMARY_K"""
+        return max(k, SUMMARY_K) if is_summary else k
+
+    @staticmethod
+    def dedupe(results):
+        """Drop repeated chunks, keeping the best-ranked copy of each"""
+        seen = set()
+        unique = []
+        for text, metadata, score in results:
+            chunk_id = metadata.get("id", text)
+            if chunk_id not in seen:
+                seen.add(chunk_id)
+                unique.append((text, metadata, score))
+        return unique
+
+    @property
+    def higher_scores_better(self):
+        """True if the store's scores are BM25 scores rather than distances"""
+        return getattr(self.vector_store, "higher_scores_better", False)
+
+    def format_regular_output(self, query, contexts, source_docs):
+        """Format output for regular queries"""
+        result = f"Top {len(contexts)} relevant passages for: {query}\n\n"
+        for i, (text, score) in enumerate(contexts, 1):
+            if self.higher_scores_better:
+                # BM25 scores have no fixed scale, so every one is shown
+                result += f"[{i}] (BM25 score: {score:.2f}) {text}\n\n"
+            # Only include distances if they're meaningful
+            elif score < 0.95:  # Only show scores that indicate varying relevance
+                result += f"[{i}] (Relevance: {score:.2f}) {text}\n\n"
             else:
+                result += f"[{i}] {text}\n\n"
+
+        return result
+
+    def format_summary_output(self, query, contexts, source_docs):
+        """Format output for summary queries"""
+        # Extract titles and main content from passages
+        titles = []
+        key_points = []
+
+        for text, _ in contexts:
+            # Try to extract a title if present
+            lines = text.split('\n')
+            if lines and lines[0].strip() and not lines[0].startswith('[Score:'):
+                title = lines[0].strip()
+                if len(title) < 100 and not title.startswith('http'):
+                    titles.append(title)
+
+            # Extract key sentences
+            content = text.replace('\n', ' ')
+            sentences = [s.strip() for s in content.split('.') if len(s.strip()) > 20]
+            key_points.extend(sentences[:2])  # Take first two substantial sentences
+
+        # Deduplicate titles and key points
+        titles = list(dict.fromkeys(titles))
+        key_points = list(dict.fromkeys(key_points))
+
+        # Build summary output
+        result = f"Summary of AWS Well-Architected Framework based on your query:\n\n"
+
+        if titles:
+            result += "Key Components:\n"
+            for title in titles[:5]:  # Limit to 5 titles
+                result += f"- {title}\n"
+            result += "\n"
+
+        if key_points:
+            result += "Key Points:\n"
+            for i, point in enumerate(key_points[:10], 1):  # Limit to 10 key points
+                result += f"{i}. {point}.\n"
+
+        return result
+
+    @staticmethod
+    def is_partial(results):
+        """True if some remote shards did not contribute to the results"""
+        return bool(getattr(results, "missing_shards", None))
+
+    def build_response(self, query, results, partial=False):
+        """Format search results into the retriever's response dict.
+
+        Responses built from partial results are marked "partial" so they
+        are not cached.
+        """
+        # Format contexts and gather metadata
+        contexts = []
+        source_docs = []
+        for text, metadata, score in results:
+            contexts.append((text, score))
+            source_docs.append(metadata)
+
+        if self.is_summary_query(query):
+            with STAGE_SECONDS.time("format_summary"):
+                result = self.format_summary_output(query, contexts, source_docs)
+        else:
+            with STAGE_SECONDS.time("format_regular"):
                 result = self.format_regular_output(query, contexts, source_docs)
-            
-            # Return in expected format
-            return {"result": result, "source_documents": source_docs}
-    
-    return SimpleRetriever(vector_store, k)
+
+        # Return in expected format
+        response = {"result": result, "source_documents": source_docs}
+        if partial:
+            response["partial"] = True
+        return response
+
+    @staticmethod
+    def search_options(search_params=None, filter=None):
+        """Keyword arguments passing the given search options to a search"""
+        options = {}
+        if search_params:
+            options["search_params"] = search_params
+        if filter:
+            options["filter"] = filter
+        return options
+
+    def retrieve(self, query_dict):
+        """Search one query.
+
+        Returns (results, partial): the (text, metadata, score) results
+        without repeated chunks, and whether some remote shards did not
+        contribute to them.
+        """
+        query = query_dict.get("query")
+        k = self.search_k(query_dict.get("k", self.k), self.is_summary_query(query))
+        # Get relevant documents in a single search
+        options = self.search_options(query_dict.get("search_params"), query_dict.get("filter"))
+        if self.hybrid is not None:
+            results = self.hybrid.search_batch([query], k=k, **options)[0]
+        else:
+            results = self.vector_store.similarity_search_with_score(query, k=k, **options)
+        return self.dedupe(results), self.is_partial(results)
+
+    def retrieve_batch(self, query_dicts):
+        """Search several queries with one vector store search per filter.
+
+        Every query is searched at the largest k any query with the same
+        metadata filter needs and the results are sliced per query, so the
+        results match calling retrieve() once per query.
+        """
+        queries = [query_dict.get("query") for query_dict in query_dicts]
+        if not queries:
+            return []
+        ks = [
+            self.search_k(query_dict.get("k", self.k), self.is_summary_query(query))
+            for query, query_dict in zip(queries, query_dicts)
+        ]
+
+        # Queries with the same metadata filter are searched together
+        groups = {}
+        for i, query_dict in enumerate(query_dicts):
+            groups.setdefault(parse_filter(query_dict.get("filter")), []).append(i)
+        all_results = [None] * len(queries)
+        for positions in groups.values():
+            group_queries = [queries[i] for i in positions]
+            group_k = max(ks[i] for i in positions)
+            options = self.search_options(filter=query_dicts[positions[0]].get("filter"))
+            if self.hybrid is not None:
+                group_results = self.hybrid.search_batch(group_queries, k=group_k, **options)
+            else:
+                group_results = self.vector_store.similarity_search_with_score_batch(
+                    group_queries, k=group_k, **options
+                )
+            for i, results in zip(positions, group_results):
+                all_results[i] = results
+        return [
+            (self.dedupe(results[:k]), self.is_partial(results))
+            for k, results in zip(ks, all_results)
+        ]
+
+    def __call__(self, query_dict):
+        results, partial = self.retrieve(query_dict)
+        return self.build_response(query_dict.get("query"), results, partial=partial)
+
+    def batch(self, query_dicts):
+        """Answer several queries with one vector store search per filter
+        (see retrieve_batch)"""
+        return [
+            self.build_response(query_dict.get("query"), results, partial=partial)
+            for query_dict, (results, partial) in zip(query_dicts, self.retrieve_batch(query_dicts))
+        ]
+
+
+# Process-wide retriever, loaded once on first use and shared by all callers
+_retriever = None
+_retriever_lock = threading.Lock()
+
+def get_retriever():
+    """Return the shared retriever, loading the vector store on first use"""
+    global _retriever
+    retriever = _retriever
+    if retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = load_retriever()
+            retriever = _retriever
+    return retriever
+
+def reload_retriever():
+    """Reload the vector store from disk and swap it in for new queries"""
+    global _retriever
+    retriever = load_retriever()
+    with _retriever_lock:
+        _retriever = retriever
+    # Entries are keyed on the old store's version and can never hit again
+    query_cache.clear()
+    return retriever
+
+def create_retriever(k=5):
+    """Create a retriever for the FAQ assistant backed by the shared vector store"""
+    shared = get_retriever()
+    return SimpleRetriever(shared.vector_store, k, hybrid=shared.hybrid)
 
 def interactive_qa():
     """Interactive question-answering"""
@@ -178,21 +387,128 @@ def interactive_qa():
         except Exception as e:
             print(f"Error: {e}")
 
-def answer_question(question):
-    """Answer a single question programmatically"""
+def question_k(question):
+    """Number of passages to retrieve for a question"""
     # Use more retrieved documents for summarization queries
-    if any(word in question.lower() for word in ["summarize", "summarise", "summary", "overview"]):
-        k = 7  # More documents for summaries
-    else:
-        k = 3  # Default for regular queries
-        
-    retriever = create_retriever(k=k)
-    result = retriever({"query": question})
+    return SUMMARY_K if is_summary_query(question) else DEFAULT_K
+
+def format_answer(result):
+    """Convert a retriever response into the public answer dict"""
     return {
         "answer": result["result"],
         "sources": [doc['source'] for doc in result["source_documents"]]
     }
 
+def render_answer(retriever, question, results):
+    """Public answer dict for question from its retrieved results.
+
+    The cache and request coalescing share results between questions that
+    only differ in case and whitespace, so the answer text, which repeats
+    the question, is rendered for each caller.
+    """
+    return format_answer(retriever.build_response(question, results))
+
+def _cache_key(retriever, question, k, filter=None):
+    """Cache key for a question against the retriever's current index.
+
+    Raises ValueError for an invalid metadata filter.
+    """
+    return QueryCache.make_key(
+        retriever.vector_store.version, question, k, retriever.is_summary_query(question),
+        parse_filter(filter),
+    )
+
+def _count_query(question, cached):
+    """Update the query type and cache counters for one question"""
+    QUERIES.inc("summary" if is_summary_query(question) else "regular")
+    CACHE_REQUESTS.inc("hit" if cached is not None else "miss")
+
+def answer_question(question, use_cache=True, filter=None):
+    """Answer a single question programmatically.
+
+    With use_cache=False the question is always searched, bypassing the
+    result cache and request coalescing (e.g. to profile the search path).
+    filter restricts the passages by metadata, e.g. {"pillar": "security"}
+    (see metadata_filter); an invalid filter raises ValueError.
+    """
+    retriever = get_retriever()
+    k = question_k(question)
+    query_dict = {"query": question, "k": k}
+    if filter:
+        query_dict["filter"] = filter
+    if not use_cache:
+        parse_filter(filter)
+        _count_query(question, None)
+        return format_answer(retriever(query_dict))
+    
+    key = _cache_key(retriever, question, k, filter)
+    cached = query_cache.get(key)
+    _count_query(question, cached)
+    if cached is not None:
+        return render_answer(retriever, question, cached)
+    
+    def search():
+        results, partial = retriever.retrieve(query_dict)
+        results = tuple(results)
+        if not partial:
+            query_cache.set(key, results)
+        return results
+    
+    return render_answer(retriever, question, in_flight.do(key, search))
+
+def answer_questions(questions, filters=None):
+    """Answer a list of questions with one batched vector store search.
+
+    filters optionally holds a metadata filter (or None) per question;
+    questions sharing a filter are searched together.
+    """
+    retriever = get_retriever()
+    if filters is None:
+        filters = [None] * len(questions)
+    # Reject invalid filters before claiming any in-flight searches
+    keys = [
+        _cache_key(retriever, question, question_k(question), filter)
+        for question, filter in zip(questions, filters)
+    ]
+    # Retrieved results per question, rendered once all are known
+    retrieved = [None] * len(questions)
+    misses = []
+    waiting = []
+    for i, (question, filter, key) in enumerate(zip(questions, filters, keys)):
+        k = question_k(question)
+        cached = query_cache.get(key)
+        _count_query(question, cached)
+        if cached is not None:
+            retrieved[i] = cached
+            continue
+        # Questions already being answered, here or by another request, are
+        # searched only once
+        future, leader = in_flight.claim(key)
+        if leader:
+            query_dict = {"query": question, "k": k}
+            if filter:
+                query_dict["filter"] = filter
+            misses.append((i, key, query_dict))
+        else:
+            waiting.append((i, future))
+    
+    # Only questions missing from the cache go to the vector store
+    try:
+        missed = retriever.retrieve_batch([query_dict for _, _, query_dict in misses])
+    except BaseException as e:
+        for _, key, _ in misses:
+            in_flight.resolve(key, error=e)
+        raise
+    for (i, key, _), (results, partial) in zip(misses, missed):
+        results = tuple(results)
+        if not partial:
+            query_cache.set(key, results)
+        in_flight.resolve(key, results)
+        retrieved[i] = results
+    for i, future in waiting:
+        retrieved[i] = future.result()
+    return [render_answer(retriever, question, results) for question, results in zip(questions, retrieved)]
+
 if __name__ == "__main__":
     # Print disclaimer for command-line use
     print("\nDISCLAIMER: This tool is not affiliated with or endorsed by AWS.")
@@ -0,0 +1,72 @@
+"""
+In-process cache for query results
+
+Entries are evicted least-recently-used first once the cache is full, and
+expire after a fixed time-to-live. Keys include the vector store version,
+so results computed against an older index are never served after a new
+one is loaded.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+def normalize_question(question):
+    """Normalize a question for cache lookups (case and whitespace insensitive)"""
+    return " ".join(question.lower().split())
+
+
+class QueryCache:
+    """Thread-safe LRU cache with a per-entry time-to-live"""
+
+    def __init__(self, max_size=1024, ttl=300.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(version, question, k, is_summary, filter=None):
+        """Build the cache key for a question against an index version.
+
+        filter is the question's metadata filter in the hashable form of
+        metadata_filter.parse_filter, or None.
+        """
+        return (version, normalize_question(question), k, bool(is_summary), filter)
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or self.clock() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entries"""
+        if self.max_size <= 0:
+            return
+        expires_at = self.clock() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
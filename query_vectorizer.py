@@ -0,0 +1,178 @@
+"""
+Pickle-free TF-IDF vectorizer for the query path
+
+At query time a fitted sklearn TfidfVectorizer is only needed for its
+vocabulary, IDF weights, stop words and token pattern. QueryVectorizer
+exports exactly those to a compact .npz file (no pickled objects) and
+rebuilds the vocabulary hash table (a dict) on load. Its transform()
+repeats sklearn's arithmetic step by step (lowercase, regex tokenization,
+stop-word removal, term counts, IDF weighting and sequential L2
+normalization), so it returns bit-identical vectors without importing
+scikit-learn or going through its generic input validation.
+
+Only the settings this project uses are supported: word unigrams, no custom
+preprocessor or tokenizer, no accent stripping, and raw (not sublinear or
+binary) term frequencies. from_sklearn() raises ValueError for anything else.
+"""
+import math
+import re
+
+import numpy as np
+from scipy import sparse
+
+# Terms and stop words are stored newline-separated
+_SEPARATOR = "\n"
+
+
+def _join(words, what):
+    words = list(words)
+    if any(_SEPARATOR in word for word in words):
+        raise ValueError(f"{what} containing newlines cannot be exported")
+    return _SEPARATOR.join(words)
+
+
+def _split(joined):
+    return joined.split(_SEPARATOR) if joined else []
+
+
+class QueryVectorizer:
+    """Transform-only stand-in for a fitted TfidfVectorizer"""
+
+    def __init__(self, terms, idf=None, stop_words=(), token_pattern=r"(?u)\b\w\w+\b",
+                 lowercase=True, norm="l2"):
+        if norm not in ("l2", None):
+            raise ValueError(f"Unsupported norm {norm!r}")
+        self.terms = list(terms)
+        # The vocabulary hash table: term -> column
+        self.vocabulary_ = {term: i for i, term in enumerate(self.terms)}
+        self.idf_ = None if idf is None else np.asarray(idf, dtype=np.float64)
+        self.stop_words = frozenset(stop_words)
+        self.token_pattern = token_pattern
+        self.lowercase = lowercase
+        self.norm = norm
+        self._tokenize = re.compile(token_pattern).findall
+
+    @classmethod
+    def from_sklearn(cls, vectorizer):
+        """Export the query-time parameters of a fitted TfidfVectorizer"""
+        unsupported = {
+            "analyzer": (vectorizer.analyzer, "word"),
+            "ngram_range": (tuple(vectorizer.ngram_range), (1, 1)),
+            "preprocessor": (vectorizer.preprocessor, None),
+            "tokenizer": (vectorizer.tokenizer, None),
+            "strip_accents": (vectorizer.strip_accents, None),
+            "binary": (vectorizer.binary, False),
+            "sublinear_tf": (vectorizer.sublinear_tf, False),
+        }
+        for name, (value, expected) in unsupported.items():
+            if value != expected:
+                raise ValueError(f"Cannot export a vectorizer with {name}={value!r}")
+
+        vocabulary = vectorizer.vocabulary_
+        terms = [None] * len(vocabulary)
+        for term, i in vocabulary.items():
+            terms[i] = term
+        return cls(
+            terms,
+            idf=vectorizer.idf_ if vectorizer.use_idf else None,
+            stop_words=vectorizer.get_stop_words() or (),
+            token_pattern=vectorizer.token_pattern,
+            lowercase=vectorizer.lowercase,
+            norm=vectorizer.norm,
+        )
+
+    def save(self, path):
+        """Write the parameters to an .npz file (loadable without pickle)"""
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                terms=np.array(_join(self.terms, "Terms")),
+                idf=self.idf_ if self.idf_ is not None else np.zeros(0),
+                use_idf=np.array(self.idf_ is not None),
+                stop_words=np.array(_join(sorted(self.stop_words), "Stop words")),
+                token_pattern=np.array(self.token_pattern),
+                lowercase=np.array(self.lowercase),
+                norm=np.array(self.norm or ""),
+            )
+
+    @classmethod
+    def load(cls, path):
+        """Load parameters written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                _split(str(data["terms"])),
+                idf=data["idf"] if bool(data["use_idf"]) else None,
+                stop_words=_split(str(data["stop_words"])),
+                token_pattern=str(data["token_pattern"]),
+                lowercase=bool(data["lowercase"]),
+                norm=str(data["norm"]) or None,
+            )
+
+    def tokens(self, text):
+        """Vocabulary-independent analysis: lowercase, tokenize, drop stop words"""
+        if isinstance(text, bytes):
+            text = text.decode("utf-8")
+        if self.lowercase:
+            text = text.lower()
+        return [token for token in self._tokenize(text) if token not in self.stop_words]
+
+    def _column_counts(self, text):
+        """Sorted vocabulary columns of text's terms and how often each occurs"""
+        vocabulary = self.vocabulary_
+        counts = {}
+        for token in self.tokens(text):
+            column = vocabulary.get(token)
+            if column is not None:
+                counts[column] = counts.get(column, 0) + 1
+        columns = sorted(counts)
+        return columns, [counts[column] for column in columns]
+
+    def term_counts(self, texts):
+        """Raw vocabulary term counts of texts as an (n x vocabulary) float32 CSR matrix"""
+        indptr = [0]
+        indices = []
+        data = []
+        for text in texts:
+            columns, counts = self._column_counts(text)
+            indices.extend(columns)
+            data.extend(counts)
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix(
+            (
+                np.array(data, dtype=np.float32),
+                np.array(indices, dtype=np.int32),
+                np.array(indptr, dtype=np.int64),
+            ),
+            shape=(len(indptr) - 1, len(self.terms)),
+        )
+
+    def transform(self, texts):
+        """TF-IDF vectors of texts as an (n x vocabulary) float64 CSR matrix"""
+        indptr = [0]
+        indices = []
+        data = []
+        for text in texts:
+            columns, counts = self._column_counts(text)
+            weights = np.array(counts, dtype=np.float64)
+            if self.idf_ is not None and columns:
+                weights *= self.idf_[columns]
+            if self.norm == "l2":
+                # Accumulate in order, as sklearn's inplace_csr_row_normalize_l2 does
+                total = 0.0
+                for weight in weights.tolist():
+                    total += weight * weight
+                if total != 0.0:
+                    weights /= math.sqrt(total)
+            indices.extend(columns)
+            data.append(weights)
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix(
+            (
+                np.concatenate(data) if data else np.zeros(0),
+                np.array(indices, dtype=np.int32),
+                np.array(indptr, dtype=np.int32),
+            ),
+            shape=(len(indptr) - 1, len(self.terms)),
+        )
@@ -0,0 +1,161 @@
+"""
+Pre-fork production server for the web apps
+
+Runs N worker processes behind one listening socket:
+
+    python serve.py web_app:app --workers 4 --port 8000
+    python serve.py flask_web_app:app --workers 4 --port 5001
+
+The parent process imports the app, which loads the vector store at import
+time, and then forks the workers. The index, chunk texts and vectorizer
+arrays are memory-mapped read-only, so every worker shares the same
+physical pages through the page cache instead of holding its own copy; the
+Python objects created before the fork are shared copy-on-write as well
+(gc.freeze() keeps the garbage collector from touching them). Each worker
+runs uvicorn on the inherited socket (Flask is served through uvicorn's
+WSGI interface), and the kernel spreads incoming connections across them.
+
+The parent only supervises: it restarts workers that die and stops them
+all on SIGINT/SIGTERM. Caches and worker pools are per process, while
+metrics are written to a shared directory and summed across the workers
+(see metrics.py), so /metrics reports the whole server whichever worker
+answers it.
+"""
+import argparse
+import gc
+import importlib
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Worker processes to fork (default: one per CPU)
+SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS", os.cpu_count() or 1))
+
+# Stop restarting workers that keep dying within this many seconds of starting
+MIN_WORKER_LIFETIME = 1.0
+
+
+def load_app(target):
+    """Import "module:attribute" and return the attribute"""
+    module_name, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "app")
+
+
+def app_interface(app):
+    """uvicorn interface for an application object"""
+    # Flask (and other WSGI) apps expose wsgi_app; everything else is ASGI
+    return "wsgi" if hasattr(app, "wsgi_app") else "asgi3"
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, interface):
+    """Serve app on sock until uvicorn exits; runs in a forked child"""
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, interface=interface, access_log=False, lifespan="off")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn_worker(app, sock, interface):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(app, sock, interface)
+        except BaseException:
+            logger.exception("Worker crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(app, host="0.0.0.0", port=8000, workers=None, interface=None):
+    """Fork workers serving app on host:port and supervise them until stopped"""
+    workers = workers or SERVE_WORKERS
+    interface = interface or app_interface(app)
+    sock = bind_socket(host, port)
+    logger.info(f"Serving on {host}:{port} with {workers} workers (parent pid {os.getpid()})")
+
+    # Every worker writes its metrics to this directory and /metrics sums
+    # them; values recorded so far (e.g. loading the store) are carried over
+    metrics_dir = tempfile.mkdtemp(prefix="rag-metrics-")
+    metrics.registry.share(metrics_dir)
+
+    # Objects created so far are shared with the workers; keep the collector
+    # from writing to them, which would copy their pages into every worker
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+    for _ in range(workers):
+        children[spawn_worker(app, sock, interface)] = time.monotonic()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        if time.monotonic() - started < MIN_WORKER_LIFETIME:
+            logger.error(f"Worker {pid} exited immediately (status {status}); shutting down")
+            stop(None, None)
+            continue
+        logger.warning(f"Worker {pid} exited (status {status}); starting a replacement")
+        children[spawn_worker(app, sock, interface)] = time.monotonic()
+    sock.close()
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a web app with pre-forked workers")
+    parser.add_argument("app", nargs="?", default="web_app:app",
+                        help="Application as module:attribute (default web_app:app)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS,
+                        help=f"Worker processes (default SERVE_WORKERS or CPU count, {SERVE_WORKERS})")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.path.insert(0, os.getcwd())
+    serve(load_app(args.app), host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Coordinator that searches remote shard servers
+
+ShardCoordinator offers the search interface of SimpleVectorStore
+(similarity_search_with_score and its batch form, plus a version for the
+result cache) over a set of shard_server.py processes, which may run on
+other machines. Every search is sent to all shards at once; each shard has
+`timeout` seconds to answer. Shards that miss the deadline or fail are left
+out, and the top-k lists of the others are merged with a heap in
+(distance, chunk number) order, the same order a local ShardedVectorStore
+returns. Results missing some shards are returned as PartialResults, which
+query_assistant does not cache; if no shard answers, ShardsUnavailableError
+is raised.
+
+Set SHARD_SERVERS to a comma-separated list of shard server URLs to make
+query_assistant search through a coordinator instead of a local store.
+"""
+from concurrent.futures import wait
+import hashlib
+import heapq
+import http.client
+import itertools
+import json
+import logging
+import socket
+import threading
+from urllib.parse import urlsplit
+
+from fork_safe_executor import ForkSafeExecutor
+from metadata_filter import parse_filter
+from metrics import SHARD_REQUESTS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class ShardsUnavailableError(RuntimeError):
+    """No shard server answered a search in time"""
+
+
+class PartialResults(list):
+    """Search results that are missing the results of some shards"""
+
+    def __init__(self, results, missing_shards):
+        super().__init__(results)
+        self.missing_shards = missing_shards
+
+
+class ShardClient:
+    """JSON-over-HTTP client for one shard server.
+
+    Keeps one keep-alive connection per calling thread.
+    """
+
+    def __init__(self, url, timeout=1.0):
+        parts = urlsplit(url if "//" in url else f"http://{url}")
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        """Send a request and return the decoded JSON response"""
+        payload = None if body is None else json.dumps(body)
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            try:
+                return self._send(connection, method, path, payload)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed the idle keep-alive connection; reconnect
+                pass
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self._local.connection = connection
+        return self._send(connection, method, path, payload)
+
+    def _send(self, connection, method, path, payload):
+        try:
+            connection.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            data = response.read()
+        except Exception:
+            connection.close()
+            self._local.connection = None
+            raise
+        if response.status != 200:
+            raise RuntimeError(f"{self.url}{path} returned HTTP {response.status}: {data[:200]!r}")
+        return json.loads(data)
+
+
+class ShardCoordinator:
+    """Searches shard servers in parallel and merges their results"""
+
+    def __init__(self, urls, timeout=1.0, max_concurrency=8):
+        if not urls:
+            raise ValueError("A shard coordinator needs at least one shard server")
+        self.clients = [ShardClient(url, timeout) for url in urls]
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        # Shards that miss the deadline keep a thread busy until the socket
+        # times out, so allow several searches per shard at once
+        self._pool = ForkSafeExecutor(
+            max_workers=len(self.clients) * max_concurrency, thread_name_prefix="shard-client"
+        )
+
+        # Fail fast on unreachable or mismatched shards
+        self.shards = [client.request("GET", "/info") for client in self.clients]
+        counts = {info["shards"] for info in self.shards}
+        numbers = sorted(info["shard"] for info in self.shards)
+        if len(counts) != 1 or numbers != list(range(counts.pop())):
+            raise ValueError(f"Shard servers {urls} do not serve exactly one copy of every shard: {self.shards}")
+        # Changes whenever any shard is rebuilt (seen at startup)
+        versions = ",".join(f"{info['shard']}:{info['version']}" for info in self.shards)
+        self.version = hashlib.sha1(versions.encode()).hexdigest()
+
+    def _fan_out(self, body):
+        """POST /search to every shard; returns (responses, missing shard urls)"""
+        with STAGE_SECONDS.time("shard_fanout"):
+            futures = {
+                self._pool.submit(client.request, "POST", "/search", body): client
+                for client in self.clients
+            }
+            done, _ = wait(futures, timeout=self.timeout)
+
+        responses = []
+        missing = []
+        for future, client in futures.items():
+            error = future.exception() if future in done else None
+            # The socket timeout equals the deadline, so either may fire first
+            if future not in done or isinstance(error, (socket.timeout, TimeoutError)):
+                future.cancel()
+                SHARD_REQUESTS.inc("timeout")
+                logger.warning(f"Shard {client.url} missed the {self.timeout}s deadline")
+                missing.append(client.url)
+            elif error is not None:
+                SHARD_REQUESTS.inc("error")
+                logger.warning(f"Shard {client.url} failed: {error}")
+                missing.append(client.url)
+            else:
+                SHARD_REQUESTS.inc("ok")
+                responses.append(future.result())
+        if not responses:
+            raise ShardsUnavailableError(f"No shard server answered within {self.timeout}s")
+        return responses, missing
+
+    def similarity_search_with_score(self, query, k=5, search_params=None, filter=None):
+        """Search for similar documents on all shards"""
+        return self.similarity_search_with_score_batch(
+            [query], k=k, search_params=search_params, filter=filter
+        )[0]
+
+    def similarity_search_with_score_batch(self, queries, k=5, search_params=None, filter=None):
+        """Search for several queries at once on all shards.
+
+        Returns one list of (text, metadata, distance) tuples per query, in
+        query order; PartialResults if some shards did not answer.
+        """
+        if not queries:
+            return []
+        body = {"queries": list(queries), "k": k}
+        if search_params:
+            body["search_params"] = search_params
+        if filter:
+            # Rejected here rather than by every shard
+            parse_filter(filter)
+            body["filter"] = filter
+        responses, missing = self._fan_out(body)
+
+        batch_results = []
+        for q in range(len(queries)):
+            hits = heapq.merge(
+                *(response["results"][q] for response in responses),
+                key=lambda hit: (hit["distance"], hit["id"]),
+            )
+            results = [(hit["text"], hit["metadata"], hit["distance"]) for hit in itertools.islice(hits, k)]
+            batch_results.append(PartialResults(results, missing) if missing else results)
+        return batch_results
@@ -0,0 +1,129 @@
+"""
+HTTP server for one shard of a vector store
+
+Serves a single shard of a store built with VECTOR_STORE_SHARDS (see
+sharded_store), so the shards of a corpus too large for one machine can
+live on different nodes. A node only needs its own shard directory and the
+store's config.json:
+
+    python shard_server.py faiss_index --shard 0 --port 9100
+    python shard_server.py faiss_index --shard 1 --port 9101
+
+An unsharded store is served as shard 0 of 1. shard_coordinator.py fans
+queries out to the shard servers and merges their results.
+
+Endpoints:
+- GET /info: shard number, shard count, store version and chunk count
+- POST /search: {"queries": [...], "k": 5, "search_params": {...},
+  "filter": {...}} returns
+  {"results": [[{"id", "distance", "text", "metadata"}, ...], ...]} with
+  one list per query, ordered by (distance, id). Ids are global chunk
+  numbers, so results from different shards can be merged directly. The
+  optional filter restricts the search by metadata (see metadata_filter).
+- GET /metrics: the shard's own metrics (see metrics.py)
+"""
+import argparse
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+
+import metrics
+from sharded_store import shard_path
+from vector_store import SimpleVectorStore
+
+logger = logging.getLogger(__name__)
+
+# Largest number of results a single query may ask for
+MAX_SHARD_K = 1000
+
+
+class SearchRequest(BaseModel):
+    queries: List[str]
+    k: int = Field(5, ge=1, le=MAX_SHARD_K)
+    search_params: Optional[Dict[str, int]] = None
+    filter: Optional[Dict[str, Any]] = None
+
+
+def load_shard(path, shard, mmap=True):
+    """Load one shard of the store at path; returns (store, shard count)"""
+    config = {}
+    if os.path.exists(f"{path}/config.json"):
+        with open(f"{path}/config.json", "r") as f:
+            config = json.load(f)
+    n_shards = config.get("shards")
+    if not n_shards:
+        if shard != 0:
+            raise ValueError(f"{path} is not sharded; it can only be served as shard 0")
+        return SimpleVectorStore.load(path, mmap=mmap), 1
+    if not 0 <= shard < n_shards:
+        raise ValueError(f"Shard {shard} out of range; {path} has {n_shards} shards")
+    return SimpleVectorStore.load(shard_path(path, shard), mmap=mmap), n_shards
+
+
+def create_app(store, shard=0, n_shards=1):
+    """FastAPI app serving searches of store as shard `shard` of `n_shards`"""
+    app = FastAPI(title=f"Vector store shard {shard}/{n_shards}")
+
+    @app.get("/info")
+    def info():
+        return {
+            "shard": shard,
+            "shards": n_shards,
+            "version": store.version,
+            "chunks": len(store.texts),
+            "index_type": store.index_type,
+        }
+
+    @app.post("/search")
+    def search(request: SearchRequest):
+        if not request.queries:
+            return JSONResponse({"results": []})
+        try:
+            distances, indices = store.search_indices(
+                request.queries, k=request.k, search_params=request.search_params, filter=request.filter
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        results = []
+        for row_distances, row_indices in zip(distances.tolist(), indices.tolist()):
+            results.append([
+                # Local position i of this shard is global chunk i * n_shards + shard
+                {"id": i * n_shards + shard, "distance": distance,
+                 "text": store.texts[i], "metadata": store.metadatas[i]}
+                for distance, i in zip(row_distances, row_indices)
+                if i >= 0
+            ])
+        # Skip FastAPI's response validation; the payload is plain JSON already
+        return JSONResponse({"results": results})
+
+    @app.get("/metrics")
+    def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one shard of a vector store over HTTP")
+    parser.add_argument("store", help="Path of the saved (sharded) vector store")
+    parser.add_argument("--shard", type=int, default=0, help="Shard number to serve (default 0)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (default 1)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    store, n_shards = load_shard(args.store, args.shard)
+    logger.info(f"Serving shard {args.shard}/{n_shards} ({len(store.texts)} chunks) on port {args.port}")
+
+    from serve import serve
+    serve(create_app(store, args.shard, n_shards), host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Sharded vector store with parallel scatter-gather search
+
+ShardedVectorStore partitions the chunks round-robin across S
+SimpleVectorStore shards: chunk g lives in shard g % S at position g // S.
+All shards share one set of embeddings fitted on the whole corpus, so a
+chunk gets the same vector (and the same score) as in an unsharded store.
+
+A search vectorizes the queries once, searches every shard on its own
+thread (FAISS and scipy's sparse products release the GIL, so the shards
+run on separate cores), and merges the per-shard top-k lists with a heap.
+Ties are broken by chunk number, which is also the order of an unsharded
+exact index, so flat and sparse shards return exactly the ranking of the
+equivalent SimpleVectorStore. Approximate index types are supported, with
+each shard training its own index.
+
+Saved stores are a directory with a config.json and one SimpleVectorStore
+directory per shard; load_store() opens either kind of store.
+"""
+from collections.abc import Sequence
+import heapq
+import itertools
+import json
+import os
+import uuid
+
+import numpy as np
+
+from fork_safe_executor import ForkSafeExecutor
+from metadata_filter import MetadataIndex
+from vector_store import STORE_FORMAT, SimpleVectorStore
+
+
+def shard_path(path, shard):
+    return os.path.join(path, f"shard_{shard:03d}")
+
+
+def merge_top_k(shard_results, n_queries, k):
+    """Merge per-shard search results into the global top k.
+
+    shard_results holds one FAISS-style (distances, indices) pair per shard,
+    with indices already translated to global chunk numbers and every row
+    sorted by (distance, index). Returns (distances, indices) arrays of
+    shape (n_queries, k), padded with infinite distances and -1 indices.
+    """
+    distances = np.full((n_queries, k), np.inf, dtype=np.float32)
+    indices = np.full((n_queries, k), -1, dtype=np.int64)
+    rows = [(d.tolist(), i.tolist()) for d, i in shard_results]
+    for q in range(n_queries):
+        candidates = heapq.merge(*(zip(d[q], i[q]) for d, i in rows))
+        found = itertools.islice(((d, i) for d, i in candidates if i >= 0), k)
+        for rank, (distance, idx) in enumerate(found):
+            distances[q, rank] = distance
+            indices[q, rank] = idx
+    return distances, indices
+
+
+class _InterleavedRecords(Sequence):
+    """Read-only view of the shards' texts or metadata in global chunk order"""
+
+    def __init__(self, shards, attribute):
+        self.shards = shards
+        self.attribute = attribute
+
+    def __len__(self):
+        return sum(len(getattr(shard, self.attribute)) for shard in self.shards)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("record index out of range")
+        n = len(self.shards)
+        return getattr(self.shards[i % n], self.attribute)[i // n]
+
+
+class ShardedVectorStore(SimpleVectorStore):
+    """SimpleVectorStore split round-robin across n_shards sub-stores"""
+
+    def __init__(self, embeddings, n_shards=2, index_type="flat", index_params=None, shards=None):
+        super().__init__(embeddings, index_type=index_type, index_params=index_params)
+        if shards is None:
+            if n_shards < 1:
+                raise ValueError("A sharded store needs at least one shard")
+            shards = [
+                SimpleVectorStore(embeddings, index_type=index_type, index_params=index_params)
+                for _ in range(n_shards)
+            ]
+        self.shards = list(shards)
+        self.texts = _InterleavedRecords(self.shards, "texts")
+        self.metadatas = _InterleavedRecords(self.shards, "metadatas")
+        self._pool = ForkSafeExecutor(max_workers=self.n_shards, thread_name_prefix="shard")
+
+    @property
+    def n_shards(self):
+        return len(self.shards)
+
+    def _map(self, fn, shards):
+        """fn(shard) for every shard, run in parallel; results in shard order"""
+        if len(shards) == 1:
+            return [fn(shards[0])]
+        return list(self._pool.map(fn, shards))
+
+    def add_texts(self, texts, metadatas=None):
+        """Add texts, continuing the round-robin assignment to shards"""
+        if metadatas is None:
+            metadatas = [{} for _ in texts]
+        if not self.embeddings.trained:
+            # Fit once on the whole corpus so every shard uses the same vectors
+            self.embeddings.fit(list(self.texts) + list(texts))
+
+        start = len(self.texts)
+        n = self.n_shards
+        parts = [
+            (shard, texts[(s - start) % n::n], metadatas[(s - start) % n::n])
+            for s, shard in enumerate(self.shards)
+        ]
+        # Shards are independent, so they are built in parallel
+        self._map(lambda part: part[0].add_texts(part[1], part[2]), [part for part in parts if part[1]])
+        self._metadata_index = None
+        self.version = uuid.uuid4().hex
+
+    def search_vectors(self, query_vectors, k=5, search_params=None, mask=None):
+        """Search every shard in parallel and merge their top-k lists.
+
+        mask is over global chunk numbers; each shard gets its own part.
+        """
+        n_queries = query_vectors.shape[0]
+        # Shards that have not received any chunks yet have no index
+        active = [(s, shard) for s, shard in enumerate(self.shards) if shard.index is not None]
+        if not active:
+            return merge_top_k([], n_queries, k)
+
+        def search_shard(item):
+            s, shard = item
+            shard_mask = None if mask is None else mask[s::self.n_shards]
+            distances, indices = shard.search_vectors(query_vectors, k, search_params=search_params, mask=shard_mask)
+            # Local position i of shard s is global chunk i * n_shards + s
+            return distances, np.where(indices >= 0, indices * self.n_shards + s, -1)
+
+        return merge_top_k(self._map(search_shard, active), n_queries, k)
+
+    def save(self, path):
+        """Save every shard to its own directory under path"""
+        os.makedirs(path, exist_ok=True)
+        for s, shard in enumerate(self.shards):
+            shard.save(shard_path(path, s))
+        # Shard servers filter with their shard's own index, a local store with this one
+        self.metadata_index.save(f"{path}/metadata_index")
+        config = {
+            "index_type": self.index_type,
+            "version": self.version,
+            "format": STORE_FORMAT,
+            "shards": self.n_shards,
+        }
+        with open(f"{path}/config.json", "w") as f:
+            json.dump(config, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a store saved by save(); mmap applies to every shard"""
+        with open(f"{path}/config.json", "r") as f:
+            config = json.load(f)
+        # The shards were saved with identical embeddings; load them once
+        shards = [SimpleVectorStore.load(shard_path(path, 0), mmap=mmap)]
+        embeddings = shards[0].embeddings
+        for s in range(1, config["shards"]):
+            shards.append(SimpleVectorStore.load(shard_path(path, s), mmap=mmap, embeddings=embeddings))
+        store = cls(embeddings, index_type=config["index_type"], shards=shards)
+        store.version = config["version"]
+        if os.path.exists(f"{path}/metadata_index/config.json"):
+            store._metadata_index = MetadataIndex.load(f"{path}/metadata_index", mmap=mmap)
+        return store
+
+
+def load_store(path, mmap=True):
+    """Load a SimpleVectorStore or ShardedVectorStore saved at path"""
+    config_path = os.path.join(path, "config.json")
+    if os.path.exists(config_path):
+        with open(config_path, "r") as f:
+            if json.load(f).get("shards"):
+                return ShardedVectorStore.load(path, mmap=mmap)
+    return SimpleVectorStore.load(path, mmap=mmap)
@@ -0,0 +1,62 @@
+"""
+Coalescing of identical in-flight computations ("singleflight")
+
+When many callers ask for the same key at once, only the first one (the
+leader) computes the value; the others wait for the leader's Future and
+receive the same result or exception. Once the leader resolves the key it
+is forgotten, so later callers start a new computation (or, in the query
+path, find the answer in the result cache).
+"""
+from concurrent.futures import Future
+import threading
+
+
+class SingleFlight:
+    """Share one computation between concurrent callers of the same key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # Callers that waited for another caller's computation
+        self.coalesced = 0
+
+    def claim(self, key):
+        """Return (future, is_leader) for key.
+
+        The leader must call resolve(key, ...) exactly once; everybody else
+        waits on the returned future.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def resolve(self, key, result=None, error=None):
+        """Publish the leader's result (or error) and forget the key"""
+        with self._lock:
+            future = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """Return fn(), sharing a single call between concurrent callers of key"""
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.resolve(key, error=e)
+            raise
+        self.resolve(key, result)
+        return result
+
+    def __len__(self):
+        with self._lock:
+            return len(self._calls)
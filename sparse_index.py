@@ -0,0 +1,124 @@
+"""
+Sparse TF-IDF search index
+
+Stores document vectors as a term-major CSR matrix (an inverted index built
+from the TfidfVectorizer output) and scores queries with sparse dot products,
+so only the postings of the query terms are ever touched. The index mimics
+the parts of the FAISS index API that SimpleVectorStore uses (`d`, `ntotal`,
+`add`, `search`) and reports the same squared L2 distances as
+faiss.IndexFlatL2 would for the same vectors.
+"""
+import os
+
+import numpy as np
+from scipy import sparse
+
+
+class SparseIndex:
+    """Exact cosine search over sparse vectors"""
+
+    def __init__(self, d):
+        self.d = d
+        # Term-major postings: row t holds the weight of term t in every document
+        self.postings = sparse.csr_matrix((d, 0), dtype=np.float32)
+        self.doc_norms = np.zeros(0, dtype=np.float32)
+
+    @property
+    def ntotal(self):
+        return self.postings.shape[1]
+
+    def add(self, vectors):
+        """Add a (n x d) sparse matrix of document vectors"""
+        vectors = sparse.csr_matrix(vectors, dtype=np.float32)
+        if vectors.shape[1] != self.d:
+            raise ValueError(f"Expected vectors of dimension {self.d}, got {vectors.shape[1]}")
+        docs = sparse.vstack([self.postings.T, vectors], format="csr")
+        self.postings = docs.T.tocsr()
+        self.doc_norms = _norms(self.postings)
+
+    def search(self, queries, k, mask=None):
+        """Return (distances, indices) arrays of shape (n_queries, k).
+
+        Results are ordered by distance, then by document index. Rows are
+        padded with -1 indices and infinite distances when the index holds
+        fewer than k documents, as FAISS does. mask, a boolean array over
+        the documents, restricts the search to those it marks True.
+        """
+        queries = sparse.csr_matrix(queries, dtype=np.float32)
+        n_queries = queries.shape[0]
+        distances = np.full((n_queries, k), np.inf, dtype=np.float32)
+        indices = np.full((n_queries, k), -1, dtype=np.int64)
+        if self.ntotal == 0 or k <= 0:
+            return distances, indices
+
+        dots = (queries @ self.postings).toarray()
+        query_norms = np.asarray(queries.multiply(queries).sum(axis=1), dtype=np.float32)
+        # ||q - x||^2 = ||q||^2 + ||x||^2 - 2 q.x
+        all_distances = np.maximum(query_norms + self.doc_norms - 2 * dots, 0)
+
+        # Allowed documents in ascending order, so ties still go to the lower index
+        allowed = None if mask is None else np.flatnonzero(mask)
+        if allowed is not None:
+            all_distances = all_distances[:, allowed]
+        n = min(k, all_distances.shape[1])
+        for row, row_distances in enumerate(all_distances):
+            top = smallest_k(row_distances, n)
+            distances[row, :n] = row_distances[top]
+            indices[row, :n] = top if allowed is None else allowed[top]
+        return distances, indices
+
+
+def smallest_k(values, n):
+    """Positions of the n smallest values, ordered by value and then position"""
+    if n < len(values):
+        top = np.argpartition(values, n - 1)[:n]
+        # The partition picks arbitrary positions among those tied with the
+        # n-th value; keep the lowest positions instead
+        kth = values[top].max()
+        if np.count_nonzero(values == kth) > np.count_nonzero(values[top] == kth):
+            top = np.concatenate([np.flatnonzero(values < kth), np.flatnonzero(values == kth)])[:n]
+    else:
+        top = np.arange(len(values))
+    return top[np.lexsort((top, values[top]))]
+
+
+def _norms(postings):
+    """Squared L2 norm of every document in a term-major postings matrix"""
+    docs = postings.T.tocsr()
+    return np.asarray(docs.multiply(docs).sum(axis=1), dtype=np.float32).ravel()
+
+
+def write_sparse_index(index, prefix):
+    """Save a SparseIndex as uncompressed .npy arrays that can be memory-mapped"""
+    postings = index.postings
+    np.save(f"{prefix}.data.npy", postings.data)
+    np.save(f"{prefix}.indices.npy", postings.indices)
+    np.save(f"{prefix}.indptr.npy", postings.indptr)
+    np.save(f"{prefix}.norms.npy", index.doc_norms)
+
+
+def read_sparse_index(prefix, mmap=False):
+    """Load a SparseIndex written by write_sparse_index.
+
+    With mmap=True the postings arrays are memory-mapped read-only instead
+    of being read into memory. Indexes saved as a single compressed
+    `{prefix}.npz` file are also accepted, but are always read into memory.
+    """
+    if not os.path.exists(f"{prefix}.data.npy") and os.path.exists(f"{prefix}.npz"):
+        postings = sparse.load_npz(f"{prefix}.npz").tocsr().astype(np.float32)
+        index = SparseIndex(postings.shape[0])
+        index.postings = postings
+        index.doc_norms = _norms(postings)
+        return index
+
+    mmap_mode = "r" if mmap else None
+    data = np.load(f"{prefix}.data.npy", mmap_mode=mmap_mode)
+    indices = np.load(f"{prefix}.indices.npy", mmap_mode=mmap_mode)
+    indptr = np.load(f"{prefix}.indptr.npy", mmap_mode=mmap_mode)
+    doc_norms = np.load(f"{prefix}.norms.npy", mmap_mode=mmap_mode)
+    index = SparseIndex(len(indptr) - 1)
+    index.postings = sparse.csr_matrix(
+        (data, indices, indptr), shape=(len(indptr) - 1, len(doc_norms)), copy=False
+    )
+    index.doc_norms = doc_norms
+    return index
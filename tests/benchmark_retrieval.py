@@ -0,0 +1,310 @@
+"""
+Retrieval benchmark suite
+
+Measures latency and memory of the retrieval hot path at several corpus
+sizes on a synthetic corpus generated from ./chunks by generate_corpus.py:
+
+- fit: TfidfEmbeddings.fit on the whole corpus
+- embed_query: TfidfEmbeddings.embed_query for single questions
+- search: SimpleVectorStore.similarity_search_with_score
+- filtered_search: the same, restricted to the 10% of chunks with
+  chunk_index 3 by a metadata filter
+- bm25_matrix_*, bm25_inverted_*: build and top-k search of the two BM25
+  engines (BM25Index and InvertedIndex) over the same chunks
+- load: SimpleVectorStore.load of the saved store
+- answer_question: the end-to-end query path (result cache disabled)
+- startup: cold `import query_assistant` in a fresh interpreter, checked
+  against STARTUP_TARGET_SECONDS
+
+Results are written as JSON so runs from different releases can be diffed:
+
+    python tests/benchmark_retrieval.py --sizes 1000,10000 --output before.json
+    python tests/benchmark_retrieval.py --sizes 1000,10000 --output after.json --compare before.json
+
+The corpus and queries are generated from a fixed seed, so runs on the same
+machine are comparable.
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Measure uncached answers; query_assistant also refuses to import without an API key
+os.environ["QUERY_CACHE_SIZE"] = "0"
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import faiss
+import sklearn
+
+from bm25_index import BM25Index
+from create_embeddings import TfidfEmbeddings, SimpleVectorStore, ShardedVectorStore
+from inverted_index import InvertedIndex
+from generate_corpus import CorpusModel
+import query_assistant
+
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# Cold import of the query path; web workers pay this on every start
+STARTUP_TARGET_SECONDS = 0.3
+# Build-time libraries the query path must not import
+HEAVY_MODULES = ("sklearn", "faiss", "tqdm")
+SOURCE_CHUNK_DIR = Path(__file__).resolve().parent.parent / "chunks"
+
+
+def synthetic_queries(texts, n_queries, seed=1, n_words=6):
+    """Short questions made of words drawn from random chunks"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in rng.integers(0, len(texts), size=n_queries):
+        words = texts[i].split()
+        start = rng.integers(0, max(1, len(words) - n_words))
+        queries.append("What is " + " ".join(words[start:start + n_words]) + "?")
+    return queries
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def latency_stats(seconds):
+    """Summary statistics in milliseconds for a list of timings"""
+    ms = np.array(seconds) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def measure_once(fn):
+    """Run fn once, returning (result, stats) with time and memory use"""
+    gc.collect()
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    stats = {
+        "seconds": elapsed,
+        "rss_delta_mb": rss_mb() - rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    return result, stats
+
+
+def measure_each(fn, inputs, warmup=5):
+    """Latency statistics of fn over inputs, after a few warm-up calls"""
+    for item in inputs[:warmup]:
+        fn(item)
+    timings = []
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        timings.append(time.perf_counter() - start)
+    return latency_stats(timings)
+
+
+def benchmark_size(corpus_model, n_chunks, index_type, n_queries, k, workdir, shards=1):
+    """Benchmark every stage at one corpus size"""
+    texts = corpus_model.generate_texts(n_chunks)
+    metadatas = [{"id": f"chunk_{i}", "source": f"doc_{i // 10}.txt", "chunk_index": i % 10}
+                 for i in range(n_chunks)]
+    queries = synthetic_queries(texts, n_queries)
+    result = {"corpus_size": n_chunks, "index_type": index_type, "k": k, "shards": shards}
+
+    embeddings = TfidfEmbeddings()
+    _, result["fit"] = measure_once(lambda: embeddings.fit(texts))
+    result["fit"]["vocabulary_size"] = len(embeddings.vectorizer.vocabulary_)
+    result["embed_query"] = measure_each(embeddings.embed_query, queries)
+
+    if shards > 1:
+        store = ShardedVectorStore(embeddings, shards, index_type=index_type)
+    else:
+        store = SimpleVectorStore(embeddings, index_type=index_type)
+    _, result["build_index"] = measure_once(lambda: store.add_texts(texts, metadatas))
+    result["search"] = measure_each(lambda q: store.similarity_search_with_score(q, k=k), queries)
+    result["filtered_search"] = measure_each(
+        lambda q: store.similarity_search_with_score(q, k=k, filter={"chunk_index": 3}), queries
+    )
+
+    for engine, index_class in (("matrix", BM25Index), ("inverted", InvertedIndex)):
+        keyword_index, build_stats = measure_once(lambda: index_class.build(embeddings.vectorizer, texts))
+        keyword_path = Path(workdir) / f"bm25_{engine}_{n_chunks}"
+        keyword_index.save(keyword_path)
+        build_stats["disk_mb"] = sum(f.stat().st_size for f in keyword_path.iterdir()) / 2**20
+        result[f"bm25_{engine}_build"] = build_stats
+        result[f"bm25_{engine}_search"] = measure_each(lambda q: keyword_index.search([q], k), queries)
+        del keyword_index
+
+    store_path = Path(workdir) / f"store_{n_chunks}"
+    store.save(store_path)
+    result["disk_mb"] = sum(f.stat().st_size for f in store_path.rglob("*") if f.is_file()) / 2**20
+    store_class = type(store)
+    del store, embeddings
+    gc.collect()
+
+    loaded, result["load"] = measure_once(lambda: store_class.load(store_path))
+    del loaded
+
+    with mock.patch.object(query_assistant, "VECTOR_STORE_PATH", store_path):
+        query_assistant._retriever = None
+        _, result["answer_question_first_call"] = measure_once(
+            lambda: query_assistant.answer_question(queries[0])
+        )
+        result["answer_question"] = measure_each(query_assistant.answer_question, queries)
+        query_assistant._retriever = None
+    gc.collect()
+    return result
+
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import query_assistant
+elapsed = time.perf_counter() - start
+heavy = sorted({name.split(".")[0] for name in sys.modules} & set(sys.argv[1:]))
+print(json.dumps({"seconds": elapsed, "heavy_modules": heavy}))
+"""
+
+
+def measure_startup(runs=5):
+    """Median cold import time of query_assistant over fresh interpreters"""
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "benchmark"))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, *HEAVY_MODULES],
+            capture_output=True, text=True, check=True, cwd=REPO_DIR, env=env,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    seconds = float(np.median([sample["seconds"] for sample in samples]))
+    return {
+        "import_query_assistant_seconds": seconds,
+        "target_seconds": STARTUP_TARGET_SECONDS,
+        "within_target": seconds <= STARTUP_TARGET_SECONDS,
+        "heavy_modules": samples[-1]["heavy_modules"],
+    }
+
+
+def environment():
+    """Versions and machine details recorded with every run"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scikit_learn": sklearn.__version__,
+        "faiss": getattr(faiss, "__version__", "unknown"),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+# Metrics shown when comparing two runs
+COMPARED_METRICS = [
+    ("fit", "seconds"),
+    ("build_index", "seconds"),
+    ("embed_query", "p50_ms"),
+    ("search", "p50_ms"),
+    ("search", "p99_ms"),
+    ("filtered_search", "p50_ms"),
+    ("bm25_inverted_search", "p50_ms"),
+    ("bm25_inverted_search", "p99_ms"),
+    ("load", "seconds"),
+    ("load", "rss_delta_mb"),
+    ("answer_question", "p50_ms"),
+    ("answer_question", "p99_ms"),
+]
+
+
+def compare(baseline, current):
+    """Print the relative change of key metrics between two runs"""
+    baseline_by_key = {(r["corpus_size"], r["index_type"]): r for r in baseline["results"]}
+    print(f"{'size':>9} {'metric':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+    if "startup" in baseline:
+        old = baseline["startup"]["import_query_assistant_seconds"]
+        new = current["startup"]["import_query_assistant_seconds"]
+        print(f"{'-':>9} {'startup.import_seconds':<28} {old:>12.3f} {new:>12.3f} {(new - old) / old * 100:>+7.1f}%")
+    for result in current["results"]:
+        before = baseline_by_key.get((result["corpus_size"], result["index_type"]))
+        if before is None:
+            continue
+        for stage, field in COMPARED_METRICS:
+            if stage not in before:
+                continue
+            old, new = before[stage][field], result[stage][field]
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{result['corpus_size']:>9} {stage + '.' + field:<28} {old:>12.3f} {new:>12.3f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the retrieval pipeline")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"Comma-separated corpus sizes in chunks (default {DEFAULT_SIZES})")
+    parser.add_argument("--index-type", default="sparse", help="Index type to benchmark (default sparse)")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per latency measurement")
+    parser.add_argument("--k", type=int, default=3, help="Passages retrieved per query")
+    parser.add_argument("--shards", type=int, default=1, help="Split the store across this many shards")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON results to compare against")
+    args = parser.parse_args()
+
+    run = {"environment": environment(), "startup": measure_startup(), "results": []}
+    print(f"Cold import of query_assistant: {run['startup']['import_query_assistant_seconds']:.3f}s "
+          f"(target {STARTUP_TARGET_SECONDS}s)", file=sys.stderr)
+    corpus_model = CorpusModel.fit(SOURCE_CHUNK_DIR)
+    # Keep progress messages from the code under test out of the JSON on stdout
+    with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stdout(sys.stderr):
+        for size in (int(s) for s in args.sizes.split(",")):
+            print(f"Benchmarking {size} chunks ({args.index_type})...", file=sys.stderr)
+            run["results"].append(benchmark_size(
+                corpus_model, size, args.index_type, args.queries, args.k, workdir, shards=args.shards
+            ))
+
+    output = json.dumps(run, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), run)
+
+
+if __name__ == "__main__":
+    main()
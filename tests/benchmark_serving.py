@@ -0,0 +1,232 @@
+"""
+Multi-worker serving benchmark
+
+Builds a sparse store from a synthetic corpus (generate_corpus.py), starts
+serve.py with an increasing number of worker processes and measures, for
+each worker count:
+
+- throughput and latency of /api/query under a fixed number of concurrent
+  keep-alive clients (result cache disabled)
+- memory of the parent and of every worker: RSS, PSS (shared pages split
+  between the processes mapping them) and USS (pages private to the process)
+
+With the index and chunk texts memory-mapped read-only, RSS counts the
+shared store pages in every worker while PSS and USS show that they are
+stored only once, so total PSS should grow far slower than workers x RSS.
+
+    python tests/benchmark_serving.py --chunks 100000 --workers 1,2,4 --output serving.json
+
+Client processes run on the same machine, so on small machines they compete
+with the workers for CPU; throughput scaling is only meaningful when there
+are spare cores for the clients.
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+from create_embeddings import SimpleVectorStore, TfidfEmbeddings
+from generate_corpus import CorpusModel
+
+DEFAULT_WORKERS = ",".join(str(2 ** i) for i in range(8) if 2 ** i <= (os.cpu_count() or 1))
+
+
+def build_store(workdir, n_chunks):
+    """Save a sparse store of n_chunks synthetic chunks to workdir/faiss_index"""
+    model = CorpusModel.fit(REPO_DIR / "chunks")
+    texts = model.generate_texts(n_chunks)
+    metadatas = [{"id": f"chunk_{i}", "source": f"doc_{i // 10}.txt", "chunk_index": i % 10}
+                 for i in range(n_chunks)]
+    store = SimpleVectorStore(TfidfEmbeddings(), index_type="sparse")
+    store.add_texts(texts, metadatas)
+    store.save(Path(workdir) / "faiss_index")
+    return model.generate_texts(2000, seed=1)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def child_pids(pid):
+    """Direct children of a process"""
+    children = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The process name may contain spaces; fields follow the last ")"
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            if int(fields[1]) == pid:
+                children.append(int(entry))
+    return sorted(children)
+
+
+def memory_mb(pid):
+    """RSS, PSS and USS of a process in MB, from /proc/<pid>/smaps_rollup"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        "rss_mb": values.get("Rss", 0.0),
+        "pss_mb": values.get("Pss", 0.0),
+        "uss_mb": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+    }
+
+
+def post_query(connection, question):
+    body = json.dumps({"question": question})
+    connection.request("POST", "/api/query", body, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def wait_until_ready(port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/metrics")
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def client(port, questions, duration, results):
+    """Send questions back to back over one keep-alive connection"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    i = 0
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            status = post_query(connection, questions[i % len(questions)])
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            status = None
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+        i += 1
+    results.put((latencies, errors))
+
+
+def run_load(port, questions, clients, duration):
+    """Throughput and latency with `clients` concurrent client processes"""
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=client, args=(port, questions[i::clients], duration, results))
+        for i in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        client_latencies, client_errors = results.get()
+        latencies.extend(client_latencies)
+        errors += client_errors
+    for process in processes:
+        process.join()
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": len(latencies) / duration,
+        "p50_ms": float(np.percentile(ms, 50)) if len(ms) else None,
+        "p99_ms": float(np.percentile(ms, 99)) if len(ms) else None,
+    }
+
+
+def benchmark_workers(app, workdir, workers, questions, clients, duration):
+    """Start serve.py with `workers` workers and measure it"""
+    port = free_port()
+    env = dict(os.environ, QUERY_CACHE_SIZE="0", OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "benchmark"),
+               PYTHONPATH=str(REPO_DIR))
+    server = subprocess.Popen(
+        [sys.executable, str(REPO_DIR / "serve.py"), app, "--workers", str(workers),
+         "--host", "127.0.0.1", "--port", str(port)],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(port)
+        # Warm up every worker before measuring
+        run_load(port, questions, clients, 1.0)
+        load = run_load(port, questions, clients, duration)
+        worker_memory = [memory_mb(pid) for pid in child_pids(server.pid)]
+        parent_memory = memory_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    return {
+        "workers": workers,
+        "clients": clients,
+        "load": load,
+        "parent_memory": parent_memory,
+        "worker_memory": worker_memory,
+        "total_rss_mb": parent_memory["rss_mb"] + sum(m["rss_mb"] for m in worker_memory),
+        "total_pss_mb": parent_memory["pss_mb"] + sum(m["pss_mb"] for m in worker_memory),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pre-fork serving")
+    parser.add_argument("--chunks", type=int, default=100000, help="Corpus size in chunks")
+    parser.add_argument("--workers", default=DEFAULT_WORKERS,
+                        help=f"Comma-separated worker counts (default {DEFAULT_WORKERS})")
+    parser.add_argument("--app", default="web_app:app", help="App to serve (web_app:app or flask_web_app:app)")
+    parser.add_argument("--clients", type=int, help="Concurrent clients (default 4 per worker of the largest run)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per worker count")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    worker_counts = [int(w) for w in args.workers.split(",")]
+    clients = args.clients or 4 * max(worker_counts)
+    run = {"chunks": args.chunks, "app": args.app, "cpu_count": os.cpu_count(), "results": []}
+    with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stdout(sys.stderr):
+        print(f"Building a {args.chunks}-chunk store...")
+        questions = build_store(workdir, args.chunks)
+        store_dir = Path(workdir) / "faiss_index"
+        run["store_mb"] = sum(f.stat().st_size for f in store_dir.iterdir()) / 2**20
+        for workers in worker_counts:
+            print(f"Serving with {workers} workers...")
+            result = benchmark_workers(args.app, workdir, workers, questions, clients, args.duration)
+            print(f"  {result['load']['requests_per_second']:.0f} req/s, "
+                  f"total RSS {result['total_rss_mb']:.0f} MB, total PSS {result['total_pss_mb']:.0f} MB")
+            run["results"].append(result)
+
+    output = json.dumps(run, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
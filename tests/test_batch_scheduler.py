@@ -0,0 +1,207 @@
+"""
+Tests for the micro-batching query scheduler
+"""
+import sys
+import os
+import threading
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from batch_scheduler import BatchScheduler
+from worker_pool import QueueFullError, WorkerPool
+
+
+class RecordingBatchFunction:
+    """Batch function that records the batches it receives"""
+
+    def __init__(self, release=None):
+        self.batches = []
+        self.release = release
+
+    def __call__(self, items):
+        if self.release is not None:
+            self.release.wait(timeout=5)
+        self.batches.append(list(items))
+        return [item * 2 for item in items]
+
+
+class TestBatchScheduler(unittest.TestCase):
+    """Test the BatchScheduler class"""
+
+    def make_scheduler(self, process_batch, **kwargs):
+        scheduler = BatchScheduler(process_batch, **kwargs)
+        self.addCleanup(scheduler.close)
+        return scheduler
+
+    def test_concurrent_requests_share_a_batch(self):
+        """Requests queued while the worker is busy are searched together"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        process = RecordingBatchFunction(release)
+        scheduler = self.make_scheduler(process, max_batch_size=10, window_ms=50)
+
+        futures = [scheduler.submit(i) for i in range(5)]
+        release.set()
+        self.assertEqual([f.result(timeout=5) for f in futures], [0, 2, 4, 6, 8])
+        self.assertEqual(process.batches, [[0, 1, 2, 3, 4]])
+        self.assertEqual(scheduler.pending, 0)
+
+    def test_max_batch_size(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        process = RecordingBatchFunction(release)
+        scheduler = self.make_scheduler(process, max_batch_size=2, window_ms=50)
+
+        futures = [scheduler.submit(i) for i in range(5)]
+        release.set()
+        self.assertEqual([f.result(timeout=5) for f in futures], [0, 2, 4, 6, 8])
+        self.assertEqual(process.batches, [[0, 1], [2, 3], [4]])
+
+    def test_window_expires(self):
+        """A lone request is processed once the window has passed"""
+        process = RecordingBatchFunction()
+        scheduler = self.make_scheduler(process, max_batch_size=10, window_ms=1)
+        self.assertEqual(scheduler.submit(21).result(timeout=5), 42)
+        self.assertEqual(process.batches, [[21]])
+
+    def test_errors_reach_every_caller(self):
+        def fail(items):
+            raise ValueError("boom")
+
+        scheduler = self.make_scheduler(fail, window_ms=1)
+        futures = [scheduler.submit(i) for i in range(3)]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=5)
+        self.assertEqual(scheduler.pending, 0)
+
+    def test_missing_results_fail_every_caller(self):
+        """A batch function returning too few results fails the whole batch"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def drop_last(items):
+            release.wait(timeout=5)
+            return [item * 2 for item in items[:-1]]
+
+        scheduler = self.make_scheduler(drop_last, max_batch_size=10, window_ms=50)
+        futures = [scheduler.submit(i) for i in range(3)]
+        release.set()
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+        self.assertEqual(scheduler.pending, 0)
+
+    def test_base_exceptions_reach_every_caller(self):
+        """SystemExit from the batch function fails its requests, and the
+        worker keeps processing later batches"""
+        calls = []
+
+        def exit_once(items):
+            calls.append(items)
+            if len(calls) == 1:
+                raise SystemExit(1)
+            return [item * 2 for item in items]
+
+        scheduler = self.make_scheduler(exit_once, window_ms=1, workers=1)
+        with self.assertRaises(SystemExit):
+            scheduler.submit(1).result(timeout=5)
+        self.assertEqual(scheduler.submit(2).result(timeout=5), 4)
+        self.assertEqual(scheduler.pending, 0)
+
+    def test_cancelled_requests_are_skipped(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        started = threading.Event()
+
+        def process(items):
+            started.set()
+            return RecordingBatchFunction(release)(items)
+
+        scheduler = self.make_scheduler(process, max_batch_size=1, window_ms=0)
+        first = scheduler.submit(1)
+        self.assertTrue(started.wait(timeout=5))
+        second = scheduler.submit(2)
+        self.assertTrue(second.cancel())
+        third = scheduler.submit(3)
+        release.set()
+        self.assertEqual((first.result(timeout=5), third.result(timeout=5)), (2, 6))
+
+    def test_max_pending(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        scheduler = self.make_scheduler(RecordingBatchFunction(release), window_ms=0, max_pending=2)
+
+        futures = [scheduler.submit(i) for i in range(2)]
+        with self.assertRaises(QueueFullError):
+            scheduler.submit(2)
+        release.set()
+        self.assertEqual([f.result(timeout=5) for f in futures], [0, 2])
+        self.assertEqual(scheduler.submit(3).result(timeout=5), 6)
+
+    def test_executor_bounds_concurrent_batches(self):
+        """With an executor, batches of every worker share its threads"""
+        pool = WorkerPool(max_workers=1, max_queue=10)
+        self.addCleanup(pool.shutdown)
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def process(items):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            threading.Event().wait(0.01)
+            with lock:
+                running.pop()
+            return [item * 2 for item in items]
+
+        scheduler = self.make_scheduler(process, max_batch_size=1, window_ms=0, workers=3, executor=pool)
+        futures = [scheduler.submit(i) for i in range(6)]
+        self.assertEqual([f.result(timeout=5) for f in futures], [0, 2, 4, 6, 8, 10])
+        self.assertEqual(max(peak), 1)
+
+    def test_executor_rejection_fails_the_batch(self):
+        pool = WorkerPool(max_workers=1, max_queue=0)
+        self.addCleanup(pool.shutdown)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        busy = pool.submit(release.wait, 5)
+
+        scheduler = self.make_scheduler(RecordingBatchFunction(), window_ms=0, executor=pool)
+        with self.assertRaises(QueueFullError):
+            scheduler.submit(1).result(timeout=5)
+        release.set()
+        busy.result(timeout=5)
+        # The pool frees its slot in a callback run just after the result is set
+        while pool.pending:
+            threading.Event().wait(0.001)
+        self.assertEqual(scheduler.submit(2).result(timeout=5), 4)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_usable_after_fork(self):
+        scheduler = self.make_scheduler(RecordingBatchFunction(), window_ms=0)
+        self.assertEqual(scheduler.submit(1).result(timeout=5), 2)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # The parent's worker threads do not exist in the child
+            try:
+                result = scheduler.submit(3).result(timeout=5)
+                os.write(write_fd, str(result).encode())
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            child_result = pipe.read()
+        os.waitpid(pid, 0)
+
+        self.assertEqual(child_result, "6")
+        self.assertEqual(scheduler.submit(5).result(timeout=5), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
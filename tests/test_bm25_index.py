@@ -0,0 +1,122 @@
+"""
+Tests for the BM25 keyword index
+"""
+import sys
+import os
+import math
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bm25_index import BM25Index, KeywordStore
+from query_vectorizer import QueryVectorizer
+from vector_store import TfidfEmbeddings
+
+
+def reference_bm25(tokenized_docs, query_tokens, k1=1.2, b=0.75):
+    """Straightforward BM25 scores of every document"""
+    n = len(tokenized_docs)
+    average_length = sum(len(doc) for doc in tokenized_docs) / n
+    scores = []
+    for doc in tokenized_docs:
+        score = 0.0
+        for term in query_tokens:
+            df = sum(term in other for other in tokenized_docs)
+            tf = doc.count(term)
+            if df == 0 or tf == 0:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / average_length))
+        scores.append(score)
+    return scores
+
+
+class TestBM25Index(unittest.TestCase):
+    def setUp(self):
+        self.texts = [
+            "Reliability means recovering from failure and scaling to meet demand",
+            "Cost optimization avoids unnecessary costs and idle resources",
+            "Security protects data, systems and assets with layered controls",
+            "Reliability workloads recover from infrastructure failure automatically",
+            "Performance efficiency uses computing resources efficiently",
+            "Operational excellence runs and monitors systems",
+        ]
+        embeddings = TfidfEmbeddings()
+        embeddings.fit(self.texts)
+        self.vectorizer = QueryVectorizer.from_sklearn(embeddings.vectorizer)
+        self.index = BM25Index.build(embeddings.vectorizer, self.texts)
+
+    def test_scores_match_reference(self):
+        tokenized = [self.vectorizer.tokens(text) for text in self.texts]
+        for query in ("reliability failure", "resources costs costs", "systems"):
+            with self.subTest(query=query):
+                expected = reference_bm25(tokenized, self.vectorizer.tokens(query))
+                scores, indices = self.index.search([query], len(self.texts))
+                found = {idx: score for idx, score in zip(indices[0], scores[0]) if idx >= 0}
+                self.assertEqual(set(found), {i for i, score in enumerate(expected) if score > 0})
+                for idx, score in found.items():
+                    self.assertAlmostEqual(score, expected[idx], places=5)
+
+    def test_ranking_and_padding(self):
+        scores, indices = self.index.search(["recover failure", "quantum"], 4)
+        self.assertEqual(sorted(indices[0, :2].tolist()), [0, 3])
+        self.assertEqual(indices[0, 2:].tolist(), [-1, -1])
+        self.assertTrue(np.all(np.diff(scores[0, :2]) <= 0))
+        self.assertEqual(indices[1].tolist(), [-1, -1, -1, -1])
+        self.assertTrue(np.isneginf(scores[1]).all())
+
+    def test_ties_ordered_by_index(self):
+        index = BM25Index.build(
+            self.vectorizer, ["security data", "cost demand", "security data", "security data"]
+        )
+        _, indices = index.search(["security"], 2)
+        self.assertEqual(indices[0].tolist(), [0, 2])
+
+    def test_save_and_load(self):
+        queries = ["reliability failure", "idle resources"]
+        expected = self.index.search(queries, 3)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.index.save(temp_dir)
+            loaded = BM25Index.load(temp_dir, self.vectorizer)
+            self.assertEqual((loaded.k1, loaded.b, loaded.ntotal), (self.index.k1, self.index.b, len(self.texts)))
+            for actual, wanted in zip(loaded.search(queries, 3), expected):
+                np.testing.assert_array_equal(actual, wanted)
+            del loaded
+
+
+class TestKeywordStore(unittest.TestCase):
+    def setUp(self):
+        self.texts = [
+            "Reliability means recovering from failure",
+            "Cost optimization avoids unnecessary costs",
+            "Reliability workloads recover from failure automatically",
+        ]
+        self.metadatas = [{"id": f"chunk_{i}"} for i in range(len(self.texts))]
+        embeddings = TfidfEmbeddings()
+        embeddings.fit(self.texts)
+        self.index = BM25Index.build(embeddings.vectorizer, self.texts)
+
+    def test_search_interface(self):
+        store = KeywordStore(self.index, self.texts, self.metadatas, version="v1")
+        results = store.similarity_search_with_score("failure costs", k=5)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0][:2], (self.texts[1], self.metadatas[1]))
+        scores = [score for _, _, score in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(
+            store.similarity_search_with_score_batch(["failure costs", "nothing"], k=5), [results, []]
+        )
+        with self.assertRaises(ValueError):
+            store.similarity_search_with_score("failure", search_params={"nprobe": 4})
+
+    def test_size_mismatch(self):
+        with self.assertRaises(ValueError):
+            KeywordStore(self.index, self.texts[:2], self.metadatas[:2])
+
+
+if __name__ == "__main__":
+    unittest.main()
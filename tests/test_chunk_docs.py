@@ -0,0 +1,63 @@
+"""
+Tests for document chunking
+"""
+import sys
+import os
+import filecmp
+import importlib.util
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from chunk_docs import chunk_documents
+
+
+@unittest.skipUnless(importlib.util.find_spec("langchain"), "requires langchain")
+class TestChunkDocuments(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        raw_dir = self.root / "raw_docs"
+        raw_dir.mkdir()
+        words = ["reliability", "security", "cost", "workload", "failure", "design", "principle"]
+        for i in range(12):
+            paragraphs = [
+                " ".join(words[(i + j + w) % len(words)] for w in range(20 + 15 * ((i * j) % 7)))
+                for j in range(1 + i % 5)
+            ]
+            (raw_dir / f"doc_{i:04d}_page.txt").write_text("\n\n".join(paragraphs), encoding="utf-8")
+        (raw_dir / "notes.txt").write_text("not a document", encoding="utf-8")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_metadata(self):
+        metadata_list = chunk_documents(self.root / "raw_docs", self.root / "chunks")
+        sources = [m["source"] for m in metadata_list]
+        self.assertEqual(sources, sorted(sources))
+        self.assertEqual(len(set(sources)), 12)
+        for metadata in metadata_list:
+            chunk = (self.root / "chunks" / f"{metadata['id']}.txt").read_text(encoding="utf-8")
+            self.assertLessEqual(len(chunk), 500)
+            self.assertTrue(metadata["id"].endswith(f"_chunk_{metadata['chunk_index']:03d}"))
+        with open(self.root / "chunks" / "metadata.json") as f:
+            self.assertEqual(json.load(f), metadata_list)
+
+    def test_parallel_matches_serial(self):
+        serial = chunk_documents(self.root / "raw_docs", self.root / "serial")
+        parallel = chunk_documents(self.root / "raw_docs", self.root / "parallel", workers=3)
+        self.assertEqual(parallel, serial)
+        comparison = filecmp.dircmp(self.root / "serial", self.root / "parallel")
+        self.assertEqual((comparison.left_only, comparison.right_only), ([], []))
+        _, mismatch, errors = filecmp.cmpfiles(
+            self.root / "serial", self.root / "parallel", comparison.common_files, shallow=False
+        )
+        self.assertEqual((mismatch, errors), ([], []))
+
+
+if __name__ == "__main__":
+    unittest.main()
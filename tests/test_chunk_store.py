@@ -0,0 +1,48 @@
+"""
+Tests for the memory-mapped chunk text and metadata storage
+"""
+import sys
+import os
+import unittest
+import tempfile
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from chunk_store import open_metadatas, open_texts, write_metadatas, write_texts
+
+
+class TestRecordStore(unittest.TestCase):
+    """Test writing and lazily reading chunk records"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = self.tmpdir.name
+
+    def test_round_trip(self):
+        """Texts and metadata read back exactly, including non-ASCII text"""
+        texts = ["first chunk", "", "zweiter Abschnitt – übersicht"]
+        metadatas = [{"id": "c0", "chunk_index": 0}, {}, {"id": "c2", "source": "doc.txt"}]
+        write_texts(self.path, texts)
+        write_metadatas(self.path, metadatas)
+
+        stored_texts = open_texts(self.path)
+        stored_metadatas = open_metadatas(self.path)
+        self.assertEqual(len(stored_texts), 3)
+        self.assertEqual(stored_texts[2], texts[2])
+        self.assertEqual(stored_texts[-1], texts[-1])
+        self.assertEqual(stored_texts[0:2], texts[0:2])
+        self.assertEqual(list(stored_texts), texts)
+        self.assertEqual(list(stored_metadatas), metadatas)
+        with self.assertRaises(IndexError):
+            stored_texts[3]
+
+    def test_empty(self):
+        """An empty store can be written and opened"""
+        write_texts(self.path, [])
+        self.assertEqual(len(open_texts(self.path)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
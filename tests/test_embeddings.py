@@ -8,11 +8,13 @@ from pathlib import Path
 import numpy as np
 import tempfile
 import pickle
+import faiss
 
 # Add the parent directory to the path so we can import the modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from create_embeddings import TfidfEmbeddings, SimpleVectorStore
+from create_embeddings import TfidfEmbeddings, LsaEmbeddings, SimpleVectorStore, evaluate_recall
+from index_factory import resolve_index_params
 
 class TestTfidfEmbeddings(unittest.TestCase):
     """Test the TfidfEmbeddings class"""
@@ -92,6 +94,15 @@ class TestSimpleVectorStore(unittest.TestCase):
         # The most similar document should be the one about reliability
         self.assertIn("reliability", results[0][0].lower())
     
+    def test_batch_search_matches_single(self):
+        """Batched search returns the same results as one search per query"""
+        queries = ["What is the AWS reliability pillar?", "avoid costs", "security", ""]
+        batch_results = self.vector_store.similarity_search_with_score_batch(queries, k=3)
+        self.assertEqual(len(batch_results), len(queries))
+        for query, results in zip(queries, batch_results):
+            self.assertEqual(results, self.vector_store.similarity_search_with_score(query, k=3))
+        self.assertEqual(self.vector_store.similarity_search_with_score_batch([], k=3), [])
+    
     def test_save_and_load(self):
         """Test saving and loading the vector store"""
         with tempfile.TemporaryDirectory() as tmpdirname:
@@ -102,8 +113,10 @@ class TestSimpleVectorStore(unittest.TestCase):
             
             # Check that files were created
             self.assertTrue((save_path / "index.faiss").exists())
-            self.assertTrue((save_path / "vectorizer.pickle").exists())
-            self.assertTrue((save_path / "data.pickle").exists())
+            self.assertTrue((save_path / "vectorizer.npz").exists())
+            self.assertFalse((save_path / "vectorizer.pickle").exists())
+            self.assertTrue((save_path / "texts.bin").exists())
+            self.assertTrue((save_path / "metadata.bin").exists())
             
             # Load the vector store
             loaded_store = SimpleVectorStore.load(save_path)
@@ -123,6 +136,239 @@ class TestSimpleVectorStore(unittest.TestCase):
             # Also compare metadata and check that distances are similar
             self.assertEqual(original_results[0][1], loaded_results[0][1])
             self.assertAlmostEqual(original_results[0][2], loaded_results[0][2], places=5)
+    
+    def test_load_without_mmap(self):
+        """Loading fully into memory gives the same results as memory-mapping"""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            save_path = Path(tmpdirname) / "test_vector_store"
+            self.vector_store.save(save_path)
+            mapped = SimpleVectorStore.load(save_path)
+            in_memory = SimpleVectorStore.load(save_path, mmap=False)
+            self.assertIsInstance(in_memory.texts, list)
+            self.assertEqual(list(mapped.texts), self.sample_texts)
+            self.assertEqual(list(mapped.metadatas), self.sample_metadata)
+            query = "Cost optimization"
+            self.assertEqual(
+                mapped.similarity_search_with_score(query, k=3),
+                in_memory.similarity_search_with_score(query, k=3)
+            )
+    
+    def test_load_pickle_format(self):
+        """Stores saved in the original pickle layout still load"""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            save_path = Path(tmpdirname) / "test_vector_store"
+            save_path.mkdir()
+            with open(save_path / "data.pickle", "wb") as f:
+                pickle.dump({"texts": self.sample_texts, "metadatas": self.sample_metadata}, f)
+            with open(save_path / "vectorizer.pickle", "wb") as f:
+                pickle.dump(self.embeddings.vectorizer, f)
+            faiss.write_index(self.vector_store.index, str(save_path / "index.faiss"))
+            
+            loaded_store = SimpleVectorStore.load(save_path)
+            self.assertEqual(loaded_store.index_type, "flat")
+            query = "What is the AWS reliability pillar?"
+            self.assertEqual(
+                self.vector_store.similarity_search_with_score(query, k=2),
+                loaded_store.similarity_search_with_score(query, k=2)
+            )
+
+
+class TestSparseVectorStore(unittest.TestCase):
+    """Test the sparse TF-IDF index against the dense FAISS index"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.sample_texts = [
+            "The AWS Well-Architected Framework helps you build secure applications",
+            "AWS provides reliability as a key pillar in the framework",
+            "Cost optimization helps you avoid unnecessary costs",
+            "Performance efficiency is about using resources efficiently",
+            "Operational excellence is about running and monitoring systems"
+        ]
+        self.sample_metadata = [{"source": f"doc{i}.txt"} for i in range(len(self.sample_texts))]
+        self.dense_store = SimpleVectorStore(TfidfEmbeddings())
+        self.dense_store.add_texts(self.sample_texts, self.sample_metadata)
+        self.sparse_store = SimpleVectorStore(TfidfEmbeddings(), index_type="sparse")
+        self.sparse_store.add_texts(self.sample_texts, self.sample_metadata)
+    
+    def test_matches_dense_results(self):
+        """Sparse search returns the same tuples as the dense FAISS search"""
+        for query in ["What is the AWS reliability pillar?", "avoid costs", "monitoring systems"]:
+            dense = self.dense_store.similarity_search_with_score(query, k=3)
+            sparse = self.sparse_store.similarity_search_with_score(query, k=3)
+            self.assertEqual(len(dense), len(sparse))
+            for (dense_text, dense_meta, dense_score), (text, meta, score) in zip(dense, sparse):
+                self.assertAlmostEqual(dense_score, score, places=5)
+                # Chunks with no overlapping terms tie, and ties may come back in any order
+                if score < 1.99:
+                    self.assertEqual(dense_text, text)
+                    self.assertEqual(dense_meta, meta)
+    
+    def test_k_larger_than_corpus(self):
+        """Asking for more results than stored chunks returns every chunk once"""
+        results = self.sparse_store.similarity_search_with_score("framework", k=10)
+        self.assertEqual(len(results), len(self.sample_texts))
+        self.assertEqual(len({r[0] for r in results}), len(self.sample_texts))
+    
+    def test_save_and_load(self):
+        """The sparse index round-trips through save and load"""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            save_path = Path(tmpdirname) / "test_vector_store"
+            self.sparse_store.save(save_path)
+            self.assertTrue((save_path / "index.data.npy").exists())
+            self.assertFalse((save_path / "index.faiss").exists())
+            
+            loaded_store = SimpleVectorStore.load(save_path)
+            self.assertEqual(loaded_store.index_type, "sparse")
+            query = "What is the AWS reliability pillar?"
+            self.assertEqual(
+                self.sparse_store.similarity_search_with_score(query, k=2),
+                loaded_store.similarity_search_with_score(query, k=2)
+            )
+
+
+class TestLsaEmbeddings(unittest.TestCase):
+    """Test the SVD-compressed embeddings"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.sample_texts = [
+            "The AWS Well-Architected Framework helps you build secure applications",
+            "AWS provides reliability as a key pillar in the framework",
+            "Cost optimization helps you avoid unnecessary costs",
+            "Performance efficiency is about using resources efficiently",
+            "Operational excellence is about running and monitoring systems"
+        ]
+        self.sample_metadata = [{"source": f"doc{i}.txt"} for i in range(len(self.sample_texts))]
+        self.embeddings = LsaEmbeddings(dimension=3)
+        self.vector_store = SimpleVectorStore(self.embeddings)
+        self.vector_store.add_texts(self.sample_texts, self.sample_metadata)
+    
+    def test_vectors_are_compressed_and_normalized(self):
+        """Vectors have the configured dimension and unit length"""
+        vectors = self.embeddings.embed_documents(self.sample_texts)
+        self.assertEqual(vectors.shape, (len(self.sample_texts), 3))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+        self.assertEqual(self.vector_store.index.d, 3)
+    
+    def test_scores_are_distances(self):
+        """Inner-product scores are reported as squared L2 distances"""
+        results = self.vector_store.similarity_search_with_score("reliability pillar", k=5)
+        scores = [score for _, _, score in results]
+        self.assertEqual(scores, sorted(scores))
+        for score in scores:
+            self.assertGreaterEqual(score, -1e-5)
+            self.assertLessEqual(score, 4 + 1e-5)
+    
+    def test_save_and_load(self):
+        """The SVD projection round-trips through save and load"""
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            save_path = Path(tmpdirname) / "test_vector_store"
+            self.vector_store.save(save_path)
+            loaded_store = SimpleVectorStore.load(save_path)
+            self.assertIsInstance(loaded_store.embeddings, LsaEmbeddings)
+            query = "monitoring systems"
+            original = self.vector_store.similarity_search_with_score(query, k=3)
+            loaded = loaded_store.similarity_search_with_score(query, k=3)
+            self.assertEqual([r[0] for r in original], [r[0] for r in loaded])
+    
+    def test_sparse_index_rejected(self):
+        """Dense LSA vectors cannot be stored in the sparse index"""
+        with self.assertRaises(ValueError):
+            SimpleVectorStore(LsaEmbeddings(), index_type="sparse")
+    
+    def test_recall_against_exact_ranking(self):
+        """Recall is 1.0 for an exact engine, and LSA keeps most of the
+        exact ranking even in 3 dimensions"""
+        exact_store = SimpleVectorStore(TfidfEmbeddings(), index_type="sparse")
+        exact_store.add_texts(self.sample_texts, self.sample_metadata)
+        flat_store = SimpleVectorStore(TfidfEmbeddings())
+        flat_store.add_texts(self.sample_texts, self.sample_metadata)
+        queries = ["reliability pillar", "avoid unnecessary costs", "monitoring systems", "secure applications"]
+        self.assertEqual(evaluate_recall(flat_store, exact_store, queries, k=1), 1.0)
+        # The seeded SVD scores 0.75 and 0.875; random query vectors fall
+        # below these bounds
+        self.assertGreaterEqual(evaluate_recall(self.vector_store, exact_store, queries, k=1), 0.75)
+        self.assertGreaterEqual(evaluate_recall(self.vector_store, exact_store, queries, k=2), 0.75)
+
+
+class TestApproximateIndexes(unittest.TestCase):
+    """Test the IVF and HNSW index types"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Build a corpus large enough to train IVF and PQ indexes"""
+        rng = np.random.default_rng(0)
+        vocabulary = [f"term{i}" for i in range(400)]
+        cls.texts = [" ".join(rng.choice(vocabulary, size=12)) for _ in range(300)]
+        cls.metadatas = [{"id": f"chunk_{i}"} for i in range(len(cls.texts))]
+        cls.embeddings = LsaEmbeddings(dimension=32)
+        cls.embeddings.fit(cls.texts)
+        cls.exact_store = SimpleVectorStore(cls.embeddings)
+        cls.exact_store.add_texts(cls.texts, cls.metadatas)
+        cls.queries = cls.texts[:20]
+    
+    def build(self, index_type, index_params=None):
+        store = SimpleVectorStore(self.embeddings, index_type=index_type, index_params=index_params)
+        store.add_texts(self.texts, self.metadatas)
+        return store
+    
+    def test_index_types_find_exact_matches(self):
+        """Each index type finds a chunk when queried with its own text"""
+        for index_type in ("ivf_flat", "ivf_pq", "hnsw"):
+            with self.subTest(index_type=index_type):
+                store = self.build(index_type)
+                self.assertTrue(store.index.is_trained)
+                self.assertEqual(store.index.ntotal, len(self.texts))
+                results = store.similarity_search_with_score_batch(self.queries, k=5)
+                hits = sum(q == r[0][0] for q, r in zip(self.queries, results))
+                self.assertGreaterEqual(hits, len(self.queries) * 0.8)
+    
+    def test_search_params_override(self):
+        """Probing every IVF list gives exact results for that query"""
+        store = self.build("ivf_flat", {"nlist": 16, "nprobe": 1})
+        self.assertEqual(store.index_params["nprobe"], 1)
+        exhaustive = {"nprobe": 16}
+        for query in self.queries:
+            self.assertEqual(
+                [r[0] for r in store.similarity_search_with_score(query, k=5, search_params=exhaustive)],
+                [r[0] for r in self.exact_store.similarity_search_with_score(query, k=5)]
+            )
+        with self.assertRaises(ValueError):
+            store.similarity_search_with_score("term1", search_params={"ef_search": 10})
+    
+    def test_params_persisted(self):
+        """Build and search settings survive save and load"""
+        store = self.build("hnsw", {"hnsw_m": 8, "ef_search": 24})
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            save_path = Path(tmpdirname) / "test_vector_store"
+            store.save(save_path)
+            loaded_store = SimpleVectorStore.load(save_path)
+            self.assertEqual(loaded_store.index_type, "hnsw")
+            self.assertEqual(loaded_store.index_params, store.index_params)
+            self.assertEqual(loaded_store.index.hnsw.efSearch, 24)
+            query = self.queries[0]
+            self.assertEqual(
+                [r[0] for r in store.similarity_search_with_score(query, k=3)],
+                [r[0] for r in loaded_store.similarity_search_with_score(query, k=3)]
+            )
+    
+    def test_pq_m_must_divide_dimension(self):
+        """An incompatible number of PQ sub-quantizers is rejected"""
+        with self.assertRaises(ValueError):
+            self.build("ivf_pq", {"pq_m": 5})
+
+    def test_default_pq_m(self):
+        """The default pq_m divides the dimension, and dimensions without a
+        reasonable divisor need an explicit one"""
+        self.assertEqual(resolve_index_params("ivf_pq", 1024, 100000)["pq_m"], 64)
+        self.assertEqual(resolve_index_params("ivf_pq", 300, 100000)["pq_m"], 60)
+        self.assertEqual(resolve_index_params("ivf_pq", 4, 100000)["pq_m"], 4)
+        for dimension in (10007, 514):
+            with self.subTest(dimension=dimension):
+                with self.assertRaisesRegex(ValueError, "PQ_M"):
+                    resolve_index_params("ivf_pq", dimension, 100000, {})
+        self.assertEqual(resolve_index_params("ivf_pq", 10007, 100000, {"pq_m": 1})["pq_m"], 1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,52 @@
+"""
+Tests for the fork-safe thread pool
+"""
+import sys
+import os
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fork_safe_executor import ForkSafeExecutor
+
+
+class TestForkSafeExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = ForkSafeExecutor(max_workers=2, thread_name_prefix="test")
+        self.addCleanup(self.executor.shutdown)
+
+    def test_submit_and_map(self):
+        self.assertEqual(self.executor.submit(pow, 2, 5).result(timeout=5), 32)
+        self.assertEqual(list(self.executor.map(abs, [-1, 2, -3])), [1, 2, 3])
+
+    def test_usable_after_shutdown(self):
+        self.assertEqual(self.executor.submit(abs, -1).result(timeout=5), 1)
+        self.executor.shutdown()
+        self.assertEqual(self.executor.submit(abs, -2).result(timeout=5), 2)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_usable_after_fork(self):
+        # Start the parent's threads before forking
+        self.assertEqual(self.executor.submit(abs, -1).result(timeout=5), 1)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # The parent's worker threads do not exist in the child
+            try:
+                result = self.executor.submit(abs, -3).result(timeout=5)
+                os.write(write_fd, str(result).encode())
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            child_result = pipe.read()
+        os.waitpid(pid, 0)
+
+        self.assertEqual(child_result, "3")
+        self.assertEqual(self.executor.submit(abs, -5).result(timeout=5), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests for the synthetic corpus generator
+"""
+import sys
+import os
+import json
+import re
+import unittest
+import tempfile
+from pathlib import Path
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from generate_corpus import CHUNK_SIZE, CorpusModel
+
+SOURCE_CHUNK_DIR = Path(__file__).resolve().parent.parent / "chunks"
+
+
+class TestCorpusModel(unittest.TestCase):
+    """Test fitting to the shipped chunks and generating new corpora"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = CorpusModel.fit(SOURCE_CHUNK_DIR)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_fit(self):
+        self.assertGreater(len(self.model.words), 0)
+        self.assertGreater(self.model.heaps_k, 0)
+        self.assertTrue(0 < self.model.heaps_beta < 1)
+
+    def test_generate_layout(self):
+        metadata_list = self.model.generate(self.tmpdir.name, 50, seed=0)
+        chunk_dir = Path(self.tmpdir.name) / "chunks"
+
+        with open(chunk_dir / "metadata.json") as f:
+            self.assertEqual(json.load(f), metadata_list)
+        self.assertEqual(len(metadata_list), 50)
+        for item in metadata_list:
+            self.assertRegex(item["id"], r"^doc_\d{6}_synthetic_chunk_\d{3}$")
+            self.assertEqual(item["id"], f"{Path(item['source']).stem}_chunk_{item['chunk_index']:03d}")
+            self.assertTrue(Path(item["source"]).exists())
+            text = (chunk_dir / f"{item['id']}.txt").read_text(encoding="utf-8")
+            self.assertTrue(0 < len(text) <= CHUNK_SIZE)
+
+    def test_deterministic(self):
+        self.assertEqual(self.model.generate_texts(20, seed=3), self.model.generate_texts(20, seed=3))
+        self.assertNotEqual(self.model.generate_texts(20, seed=3), self.model.generate_texts(20, seed=4))
+
+    def test_vocabulary_grows_with_size(self):
+        def vocabulary(texts):
+            return {word for text in texts for word in re.findall(r"[a-z]+", text.lower())}
+
+        small = vocabulary(self.model.generate_texts(100))
+        large = vocabulary(self.model.generate_texts(2000))
+        self.assertGreater(len(large), len(small))
+        self.assertGreater(len(large), len(self.model.words))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+"""
+Tests for hybrid BM25 and vector retrieval
+"""
+import sys
+import os
+import math
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# query_assistant refuses to import without an API key
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import query_assistant
+from bm25_index import BM25Index, KeywordStore
+from create_embeddings import TfidfEmbeddings, SimpleVectorStore
+from hybrid_search import HybridSearch, reciprocal_rank_fusion, weighted_fusion, RRF_K
+
+
+TEXTS = [
+    "The AWS Well-Architected Framework helps you build secure applications",
+    "AWS provides reliability as a key pillar in the framework",
+    "Cost optimization helps you avoid unnecessary costs",
+    "Performance efficiency is about using resources efficiently",
+    "Operational excellence is about running and monitoring systems",
+    "Reliability reliability reliability",
+]
+
+
+class TestFusion(unittest.TestCase):
+    def test_reciprocal_rank_fusion(self):
+        scores = reciprocal_rank_fusion([[3, 1], [1, 2]], (0.5, 1.0))
+        self.assertAlmostEqual(scores[3], 0.5 / (RRF_K + 1))
+        self.assertAlmostEqual(scores[1], 0.5 / (RRF_K + 2) + 1.0 / (RRF_K + 1))
+        self.assertAlmostEqual(scores[2], 1.0 / (RRF_K + 2))
+
+    def test_weighted_fusion(self):
+        scores = weighted_fusion([[(0, -1.0), (1, -3.0)], [(1, 8.0), (2, 4.0)]], (0.25, 0.75))
+        self.assertAlmostEqual(scores[0], 0.25)
+        self.assertAlmostEqual(scores[1], 0.75)
+        self.assertAlmostEqual(scores[2], 0.0)
+
+    def test_weighted_fusion_single_candidate(self):
+        self.assertEqual(weighted_fusion([[(4, 2.0)], []], (0.5, 0.5)), {4: 0.5})
+
+
+class TestHybridSearch(unittest.TestCase):
+    def setUp(self):
+        self.store = SimpleVectorStore(TfidfEmbeddings())
+        self.store.add_texts(TEXTS, [{"id": f"chunk_{i}"} for i in range(len(TEXTS))])
+        self.keyword_index = BM25Index.build(self.store.embeddings.vectorizer, TEXTS)
+
+    def test_results_in_vector_search_form(self):
+        for fusion in ("rrf", "weighted"):
+            with self.subTest(fusion=fusion):
+                hybrid = HybridSearch(self.store, self.keyword_index, fusion=fusion, candidates=3)
+                [results] = hybrid.search_batch(["reliability pillar"], k=2)
+                self.assertEqual(len(results), 2)
+                for text, metadata, distance in results:
+                    self.assertEqual(metadata["id"], f"chunk_{TEXTS.index(text)}")
+                self.assertIn(results[0][1]["id"], ("chunk_1", "chunk_5"))
+
+    def test_keyword_only_hits_have_infinite_distance(self):
+        hybrid = HybridSearch(self.store, self.keyword_index)
+        # A vector leg that only finds chunk 1
+        vector_hit = (np.array([[0.5, np.inf]], dtype=np.float32), np.array([[1, -1]]))
+        with mock.patch.object(self.store, "search_indices", return_value=vector_hit):
+            [results] = hybrid.search_batch(["reliability"], k=2)
+        self.assertEqual([metadata["id"] for _, metadata, _ in results], ["chunk_1", "chunk_5"])
+        self.assertEqual([distance for _, _, distance in results], [0.5, math.inf])
+
+    def test_matches_single_queries(self):
+        hybrid = HybridSearch(self.store, self.keyword_index)
+        queries = ["reliability", "monitoring systems", "unrelated words"]
+        batch = hybrid.search_batch(queries, k=3)
+        self.assertEqual(batch, [hybrid.search_batch([query], k=3)[0] for query in queries])
+        self.assertEqual(hybrid.search_batch([], k=3), [])
+
+    def test_rejects_bad_configuration(self):
+        with self.assertRaises(ValueError):
+            HybridSearch(self.store, self.keyword_index, fusion="borda")
+        smaller = BM25Index.build(self.store.embeddings.vectorizer, TEXTS[:3])
+        with self.assertRaises(ValueError):
+            HybridSearch(self.store, smaller)
+
+
+class TestHybridRetriever(unittest.TestCase):
+    """Test the query assistant in hybrid retrieval mode"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.store_path = Path(cls.tmpdir.name) / "faiss_index"
+        store = SimpleVectorStore(TfidfEmbeddings())
+        store.add_texts(TEXTS, [{"id": f"chunk_{i}", "source": f"doc{i}.txt"} for i in range(len(TEXTS))])
+        store.save(cls.store_path)
+        BM25Index.build(store.embeddings.vectorizer, TEXTS).save(cls.store_path / "bm25")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        for name, value in (("VECTOR_STORE_PATH", self.store_path), ("RETRIEVAL_MODE", "hybrid")):
+            patcher = mock.patch.object(query_assistant, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        query_assistant._retriever = None
+        self.addCleanup(setattr, query_assistant, "_retriever", None)
+        query_assistant.query_cache.clear()
+        self.addCleanup(query_assistant.query_cache.clear)
+
+    def test_answer_question(self):
+        retriever = query_assistant.get_retriever()
+        self.assertIsNotNone(retriever.hybrid)
+        result = query_assistant.answer_question("What is the reliability pillar?")
+        self.assertIn("reliability", result["answer"].lower())
+        self.assertEqual(result["sources"][0], "doc1.txt")
+        self.assertEqual(
+            query_assistant.answer_questions(["What is the reliability pillar?"]), [result]
+        )
+
+    def test_keyword_mode(self):
+        with mock.patch.object(query_assistant, "RETRIEVAL_MODE", "keyword"):
+            retriever = query_assistant.get_retriever()
+        self.assertIsInstance(retriever.vector_store, KeywordStore)
+        result = query_assistant.answer_question("What is the reliability pillar?")
+        self.assertEqual(result["sources"][0], "doc1.txt")
+
+    def test_keyword_mode_formatting(self):
+        """BM25 scores, where higher is better, are shown as scores and not
+        filtered like distances"""
+        with mock.patch.object(query_assistant, "RETRIEVAL_MODE", "keyword"):
+            retriever = query_assistant.get_retriever()
+        results, _ = retriever.retrieve({"query": "What is the reliability pillar?", "k": 3})
+        answer = query_assistant.answer_question("What is the reliability pillar?")["answer"]
+        self.assertNotIn("Relevance", answer)
+        for i, (_, _, score) in enumerate(results, 1):
+            self.assertIn(f"[{i}] (BM25 score: {score:.2f}) ", answer)
+        # Strong matches keep their score
+        self.assertGreater(results[0][2], 0.95)
+
+        vector_retriever = query_assistant.SimpleRetriever(query_assistant.load_vector_store())
+        self.assertFalse(vector_retriever.higher_scores_better)
+        self.assertEqual(
+            vector_retriever.format_regular_output("q", [("a", 0.5), ("b", 1.2)], []),
+            "Top 2 relevant passages for: q\n\n[1] (Relevance: 0.50) a\n\n[2] b\n\n",
+        )
+
+    def test_local_modes_reject_shard_servers(self):
+        with mock.patch.object(query_assistant, "SHARD_SERVERS", ["http://localhost:9100"]):
+            with self.assertRaises(ValueError):
+                query_assistant.load_retriever()
+
+    def test_missing_keyword_index(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "faiss_index"
+            store = SimpleVectorStore(TfidfEmbeddings())
+            store.add_texts(TEXTS, [{"id": f"chunk_{i}"} for i in range(len(TEXTS))])
+            store.save(path)
+            with mock.patch.object(query_assistant, "VECTOR_STORE_PATH", path):
+                with self.assertRaises(SystemExit):
+                    query_assistant.load_retriever()
+
+    def test_unknown_mode(self):
+        with mock.patch.object(query_assistant, "RETRIEVAL_MODE", "semantic"):
+            with self.assertRaises(ValueError):
+                query_assistant.load_retriever()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Tests for the inverted-index BM25 engine
+"""
+import sys
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bm25_index import BM25Index
+from inverted_index import InvertedIndex, load_bm25_index
+from vector_store import TfidfEmbeddings
+
+WORDS = (
+    "reliability security cost performance operational excellence sustainability workload "
+    "failure recovery scaling demand resources monitoring automation data network storage"
+).split()
+
+
+def random_texts(n, seed=0):
+    rng = random.Random(seed)
+    texts = [" ".join(rng.choices(WORDS, k=rng.randint(3, 12))) for _ in range(n)]
+    # Repeated texts tie on every query
+    return texts + texts[:n // 10]
+
+
+class TestInvertedIndex(unittest.TestCase):
+    def setUp(self):
+        self.texts = random_texts(300)
+        embeddings = TfidfEmbeddings()
+        embeddings.fit(self.texts)
+        self.vectorizer = embeddings.vectorizer
+        self.reference = BM25Index.build(self.vectorizer, self.texts)
+        rng = random.Random(1)
+        self.queries = [" ".join(rng.sample(WORDS, rng.randint(1, 5))) for _ in range(50)]
+        self.queries += ["failure failure recovery", "unknown words only"]
+
+    def test_matches_bm25_index(self):
+        for block_size in (1, 16, 256, 1000):
+            index = InvertedIndex.build(self.vectorizer, self.texts, block_size=block_size)
+            for k in (1, 5, 400):
+                with self.subTest(block_size=block_size, k=k):
+                    for actual, expected in zip(index.search(self.queries, k), self.reference.search(self.queries, k)):
+                        np.testing.assert_array_equal(actual, expected)
+
+    def test_compressed_postings(self):
+        index = InvertedIndex.build(self.vectorizer, self.texts)
+        self.assertEqual(index.offsets.dtype, np.uint8)
+        self.assertEqual(index.tfs.dtype, np.uint8)
+        self.assertEqual(len(index.offsets), self.reference.weights.nnz)
+
+    def test_prunes_ranges(self):
+        texts = self.texts + ["reliability failure zebra"]
+        embeddings = TfidfEmbeddings()
+        embeddings.fit(texts)
+        index = InvertedIndex.build(embeddings.vectorizer, texts, block_size=8)
+        with mock.patch.object(
+            InvertedIndex, "_score_ranges", autospec=True, side_effect=InvertedIndex._score_ranges
+        ) as score_ranges:
+            _, indices = index.search(["zebra reliability"], 1)
+        self.assertEqual(indices[0].tolist(), [len(texts) - 1])
+        # Only the range holding the rare term's chunk is scored
+        self.assertEqual(score_ranges.call_count, 1)
+        self.assertEqual(score_ranges.call_args[0][1].tolist(), [(len(texts) - 1) // 8])
+
+    def test_save_and_load(self):
+        index = InvertedIndex.build(self.vectorizer, self.texts, block_size=32)
+        expected = index.search(self.queries, 5)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index.save(f"{temp_dir}/inverted")
+            self.reference.save(f"{temp_dir}/matrix")
+            loaded = load_bm25_index(f"{temp_dir}/inverted", self.vectorizer)
+            self.assertIsInstance(loaded, InvertedIndex)
+            self.assertEqual((loaded.block_size, loaded.ntotal), (32, len(self.texts)))
+            for actual, wanted in zip(loaded.search(self.queries, 5), expected):
+                np.testing.assert_array_equal(actual, wanted)
+            self.assertIsInstance(load_bm25_index(f"{temp_dir}/matrix", self.vectorizer), BM25Index)
+            del loaded
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,317 @@
+"""
+Tests for metadata-filtered search
+"""
+import sys
+import os
+import random
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# query_assistant refuses to import without an API key
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import query_assistant
+from bm25_index import BM25Index, KeywordStore
+from generate_corpus import CorpusModel
+from hybrid_search import HybridSearch
+from inverted_index import InvertedIndex
+from metadata_filter import MetadataIndex, parse_filter, pillar_of
+from sharded_store import ShardedVectorStore, load_store
+from vector_store import SimpleVectorStore, TfidfEmbeddings
+
+CHUNK_DIR = os.path.join(os.path.dirname(__file__), '..', 'chunks')
+
+SOURCES = [
+    "raw_docs/doc_0013_wellarchitected-latest-framework-_-_-sec-design.txt",
+    "raw_docs/doc_0012_wellarchitected-latest-security-pillar-welcome.txt",
+    "raw_docs/doc_0021_wellarchitected-latest-framework-_-_-rel-bp.txt",
+    "raw_docs/doc_0029_wellarchitected-latest-framework-_-cost-optimizati.txt",
+    "raw_docs/doc_0001_wellarchitected-latest-framework-welcome.txt",
+]
+
+
+def random_metadatas(n, seed=0):
+    """Metadata of n chunks: a few large sources and many small ones"""
+    rng = random.Random(seed)
+    metadatas = []
+    for i in range(n):
+        source = rng.choice(SOURCES) if rng.random() < 0.7 else f"raw_docs/doc_{rng.randrange(400):04d}_misc.txt"
+        metadatas.append({"id": f"chunk_{i}", "source": source, "chunk_index": rng.randrange(12)})
+    # Chunks without some of the fields match no filter on them
+    metadatas[5] = {"id": "chunk_5"}
+    return metadatas
+
+
+def matches(metadata, search_filter):
+    """Straightforward evaluation of a filter against one chunk's metadata"""
+    for field, values in search_filter.items():
+        if field == "chunk_index":
+            value = metadata.get("chunk_index")
+            if value is None or not values.get("gte", 0) <= value <= values.get("lte", 10 ** 9):
+                return False
+        else:
+            values = [values] if isinstance(values, str) else values
+            value = pillar_of(metadata.get("source")) if field == "pillar" else metadata.get(field)
+            if value not in values:
+                return False
+    return True
+
+
+FILTERS = [
+    {"pillar": "security"},
+    {"pillar": ["reliability", "cost-optimization"], "chunk_index": {"lte": 5}},
+    {"source": SOURCES[4]},
+    {"source": ["raw_docs/doc_0007_misc.txt", "raw_docs/doc_0123_misc.txt", SOURCES[2]]},
+    {"chunk_index": {"gte": 3, "lte": 4}},
+    {"source": "raw_docs/missing.txt"},
+]
+
+
+class TestParseFilter(unittest.TestCase):
+    def test_pillar_of(self):
+        self.assertEqual(pillar_of(SOURCES[0]), "security")
+        self.assertEqual(pillar_of(SOURCES[1]), "security")
+        self.assertEqual(pillar_of(SOURCES[2]), "reliability")
+        self.assertEqual(pillar_of(SOURCES[3]), "cost-optimization")
+        self.assertEqual(pillar_of("raw_docs/doc_0004_wellarchitected-latest-framework-_-operational-exc.txt"),
+                         "operational-excellence")
+        self.assertEqual(pillar_of("raw_docs/doc_0039_wellarchitected-latest-framework-_-_-sus-bp.txt"),
+                         "sustainability")
+        self.assertIsNone(pillar_of(SOURCES[4]))
+        self.assertIsNone(pillar_of(None))
+
+    def test_normalized_form(self):
+        self.assertIsNone(parse_filter(None))
+        self.assertIsNone(parse_filter({}))
+        self.assertEqual(
+            parse_filter({"chunk_index": {"gt": 1, "lt": 4}, "pillar": ["security", "reliability", "security"]}),
+            (("pillar", ("reliability", "security")), ("chunk_index", (2, 3))),
+        )
+        self.assertEqual(parse_filter({"source": "a.txt"}), parse_filter({"source": ["a.txt"]}))
+        self.assertEqual(parse_filter({"chunk_index": 7}), (("chunk_index", (7, 7)),))
+
+    def test_rejects_invalid_filters(self):
+        for spec in (
+            ["security"], {"author": "me"}, {"pillar": "networking"}, {"source": 3},
+            {"chunk_index": {"from": 1}}, {"chunk_index": {"lte": "5"}}, {"chunk_index": True},
+        ):
+            with self.subTest(spec=spec):
+                with self.assertRaises(ValueError):
+                    parse_filter(spec)
+
+
+class TestMetadataIndex(unittest.TestCase):
+    def setUp(self):
+        self.metadatas = random_metadatas(1000)
+        self.index = MetadataIndex.build(self.metadatas)
+
+    def test_masks_match_metadata(self):
+        for search_filter in FILTERS:
+            with self.subTest(filter=search_filter):
+                expected = [matches(metadata, search_filter) for metadata in self.metadatas]
+                self.assertEqual(self.index.mask(search_filter).tolist(), expected)
+        self.assertIsNone(self.index.mask(None))
+
+    def test_common_values_are_bitmaps(self):
+        sources = self.index.postings["source"]
+        for source in SOURCES:
+            self.assertGreaterEqual(sources.bitmap_rows[sources.positions[source]], 0)
+        rare = sources.positions["raw_docs/doc_0007_misc.txt"]
+        self.assertEqual(sources.bitmap_rows[rare], -1)
+        self.assertEqual(sources.bitmaps.shape, (len(SOURCES), 125))
+
+    def test_masks_are_cached_read_only(self):
+        mask = self.index.mask({"pillar": "security"})
+        self.assertIs(self.index.mask({"pillar": ["security"]}), mask)
+        with self.assertRaises(ValueError):
+            mask[0] = not mask[0]
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.index.save(temp_dir)
+            loaded = MetadataIndex.load(temp_dir)
+            for search_filter in FILTERS:
+                np.testing.assert_array_equal(loaded.mask(search_filter), self.index.mask(search_filter))
+            del loaded
+
+
+class TestFilteredSearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        model = CorpusModel.fit(CHUNK_DIR)
+        cls.texts = model.generate_texts(600)
+        cls.metadatas = random_metadatas(len(cls.texts))
+        cls.queries = [" ".join(text.split()[:6]) for text in model.generate_texts(20, seed=1)]
+
+    def build(self, index_type, index_params=None, n_shards=None):
+        embeddings = TfidfEmbeddings()
+        if n_shards is None:
+            store = SimpleVectorStore(embeddings, index_type=index_type, index_params=index_params)
+        else:
+            store = ShardedVectorStore(embeddings, n_shards, index_type=index_type, index_params=index_params)
+        store.add_texts(self.texts, self.metadatas)
+        return store
+
+    def assert_filtered_exact(self, store, k=10, ordered_ties=True):
+        """Filtered results are the matching chunks of the full ranking"""
+        full = store.similarity_search_with_score_batch(self.queries, k=len(self.texts))
+        for search_filter in FILTERS:
+            results = store.similarity_search_with_score_batch(self.queries, k=k, filter=search_filter)
+            for expected, actual in zip(full, results):
+                expected = [hit for hit in expected if matches(hit[1], search_filter)][:k]
+                np.testing.assert_allclose([d for _, _, d in actual], [d for _, _, d in expected], rtol=1e-5)
+                self.assertTrue(all(matches(metadata, search_filter) for _, metadata, _ in actual))
+                if ordered_ties:
+                    self.assertEqual([metadata["id"] for _, metadata, _ in actual],
+                                     [metadata["id"] for _, metadata, _ in expected])
+
+    def test_sparse(self):
+        self.assert_filtered_exact(self.build("sparse"))
+
+    def test_flat(self):
+        self.assert_filtered_exact(self.build("flat"))
+
+    def test_ivf_probing_every_list(self):
+        # IVF lists return tied chunks in no particular order
+        self.assert_filtered_exact(self.build("ivf_flat", {"nlist": 8, "nprobe": 8}), ordered_ties=False)
+
+    def test_sharded(self):
+        self.assert_filtered_exact(self.build("sparse", n_shards=3))
+
+    def test_returns_k_results(self):
+        search_filter = {"source": SOURCES[4], "chunk_index": {"lte": 5}}
+        n_matching = sum(matches(metadata, search_filter) for metadata in self.metadatas)
+        for store in (self.build("hnsw"), self.build("ivf_pq")):
+            with self.subTest(index_type=store.index_type):
+                results = store.similarity_search_with_score(self.queries[0], k=10, filter=search_filter)
+                self.assertEqual(len(results), min(10, n_matching))
+                self.assertTrue(all(matches(metadata, search_filter) for _, metadata, _ in results))
+
+    def test_search_params_keep_index_defaults(self):
+        store = self.build("ivf_flat", {"nlist": 8, "nprobe": 8})
+        search_filter = {"pillar": "security"}
+        expected = store.similarity_search_with_score(self.queries[0], k=5, filter=search_filter)
+        # Without overrides the filtered search still probes every list
+        self.assertEqual(
+            store.similarity_search_with_score(self.queries[0], k=5, search_params={"nprobe": 8}, filter=search_filter),
+            expected,
+        )
+
+    def test_saved_index_is_loaded(self):
+        for n_shards in (None, 2):
+            store = self.build("sparse", n_shards=n_shards)
+            expected = store.similarity_search_with_score_batch(self.queries, k=5, filter=FILTERS[1])
+            with tempfile.TemporaryDirectory() as temp_dir:
+                store.save(temp_dir)
+                loaded = load_store(temp_dir)
+                with mock.patch.object(MetadataIndex, "build", side_effect=AssertionError("rebuilt")):
+                    actual = loaded.similarity_search_with_score_batch(self.queries, k=5, filter=FILTERS[1])
+                self.assertEqual(
+                    [[metadata["id"] for _, metadata, _ in results] for results in actual],
+                    [[metadata["id"] for _, metadata, _ in results] for results in expected],
+                )
+                del loaded
+
+    def test_keyword_engines(self):
+        embeddings = TfidfEmbeddings()
+        embeddings.fit(self.texts)
+        metadata_index = MetadataIndex.build(self.metadatas)
+        for engine in (BM25Index, InvertedIndex):
+            index = engine.build(embeddings.vectorizer, self.texts)
+            full_scores, full_indices = index.search(self.queries, len(self.texts))
+            for search_filter in FILTERS:
+                mask = metadata_index.mask(search_filter)
+                with self.subTest(engine=engine.__name__, filter=search_filter):
+                    scores, indices = index.search(self.queries, 10, mask=mask)
+                    for row in range(len(self.queries)):
+                        allowed = [(s, i) for s, i in zip(full_scores[row], full_indices[row]) if i >= 0 and mask[i]]
+                        found = [(s, i) for s, i in zip(scores[row], indices[row]) if i >= 0]
+                        self.assertEqual(found, allowed[:10])
+
+    def test_keyword_store_and_hybrid(self):
+        store = self.build("sparse")
+        keyword_index = InvertedIndex.build(store.embeddings.vectorizer, self.texts)
+        keyword_store = KeywordStore(keyword_index, store.texts, store.metadatas)
+        hybrid = HybridSearch(store, keyword_index)
+        search_filter = {"pillar": ["reliability", "cost-optimization"]}
+        keyword_results = keyword_store.similarity_search_with_score_batch(self.queries, k=8, filter=search_filter)
+        hybrid_results = hybrid.search_batch(self.queries, k=8, filter=search_filter)
+        for results in keyword_results + hybrid_results:
+            self.assertTrue(all(matches(metadata, search_filter) for _, metadata, _ in results))
+        # BM25 only finds chunks sharing a word with the query; the vector leg fills up the rest
+        self.assertTrue(all(len(results) == 8 for results in hybrid_results))
+
+
+class TestFilteredAnswers(unittest.TestCase):
+    """Test filters passed through the query assistant"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.store_path = Path(cls.tmpdir.name) / "faiss_index"
+        texts = [
+            "Security pillar: protect data with encryption",
+            "Security best practices for identity management",
+            "Reliability pillar: recover from failure",
+            "Reliability best practices for data backup",
+        ]
+        metadatas = [
+            {"id": f"chunk_{i}", "source": SOURCES[0] if i < 2 else SOURCES[2], "chunk_index": i % 2}
+            for i in range(len(texts))
+        ]
+        store = SimpleVectorStore(TfidfEmbeddings(), index_type="sparse")
+        store.add_texts(texts, metadatas)
+        store.save(cls.store_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        patcher = mock.patch.object(query_assistant, "VECTOR_STORE_PATH", self.store_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        query_assistant._retriever = None
+        self.addCleanup(setattr, query_assistant, "_retriever", None)
+        query_assistant.query_cache.clear()
+        self.addCleanup(query_assistant.query_cache.clear)
+
+    def test_answer_question(self):
+        question = "What are the data best practices?"
+        unfiltered = query_assistant.answer_question(question)
+        security = query_assistant.answer_question(question, filter={"pillar": "security"})
+        self.assertEqual(set(unfiltered["sources"]), {SOURCES[0], SOURCES[2]})
+        self.assertEqual(security["sources"], [SOURCES[0], SOURCES[0]])
+        # Filtered and unfiltered answers are cached separately
+        self.assertEqual(len(query_assistant.query_cache), 2)
+        self.assertEqual(query_assistant.answer_question(question, filter={"pillar": ["security"]}), security)
+        with self.assertRaises(ValueError):
+            query_assistant.answer_question(question, filter={"pillar": "networking"})
+
+    def test_answer_questions_groups_filters(self):
+        questions = ["data backup", "data backup", "identity management"]
+        filters = [{"pillar": "reliability"}, {"chunk_index": 0}, None]
+        retriever = query_assistant.get_retriever()
+        with mock.patch.object(
+            retriever.vector_store, "similarity_search_with_score_batch",
+            wraps=retriever.vector_store.similarity_search_with_score_batch,
+        ) as search:
+            answers = query_assistant.answer_questions(questions, filters=filters)
+        self.assertEqual(search.call_count, 3)
+        query_assistant.query_cache.clear()
+        self.assertEqual(
+            answers,
+            [query_assistant.answer_question(q, filter=f) for q, f in zip(questions, filters)],
+        )
+        self.assertEqual(set(answers[0]["sources"]), {SOURCES[2]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Tests for the query pipeline metrics
+"""
+import sys
+import os
+import tempfile
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from metrics import Counter, Histogram, Registry, SharedValues
+
+
+class TestMetrics(unittest.TestCase):
+    """Test histograms, counters and the text format"""
+
+    def setUp(self):
+        self.registry = Registry()
+        self.histogram = self.registry.register(
+            Histogram("stage_seconds", "Stage time", "stage", buckets=(0.01, 0.1))
+        )
+        self.counter = self.registry.register(Counter("queries_total", "Queries", "type"))
+
+    def test_histogram_buckets_are_cumulative(self):
+        for seconds in (0.005, 0.05, 0.05, 3.0):
+            self.histogram.observe("search", seconds)
+        samples = {(name, labels.get("le")): value for name, labels, value in self.histogram.samples()}
+        self.assertEqual(samples[("stage_seconds_bucket", 0.01)], 1)
+        self.assertEqual(samples[("stage_seconds_bucket", 0.1)], 3)
+        self.assertEqual(samples[("stage_seconds_bucket", float("inf"))], 4)
+        self.assertEqual(samples[("stage_seconds_count", None)], 4)
+        self.assertAlmostEqual(samples[("stage_seconds_sum", None)], 3.105)
+
+    def test_time_records_failures(self):
+        with self.assertRaises(ValueError):
+            with self.histogram.time("search"):
+                raise ValueError("boom")
+        self.assertEqual(self.histogram.count("search"), 1)
+
+    def test_counter(self):
+        self.counter.inc("summary")
+        self.counter.inc("regular", 2)
+        self.assertEqual(self.counter.value("regular"), 2)
+        self.assertEqual(self.counter.value("missing"), 0)
+
+    def test_render(self):
+        self.histogram.observe("embed_query", 0.002)
+        self.counter.inc("regular")
+        lines = self.registry.render().splitlines()
+        self.assertIn("# TYPE stage_seconds histogram", lines)
+        self.assertIn('stage_seconds_bucket{stage="embed_query",le="0.01"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="embed_query",le="+Inf"} 1', lines)
+        self.assertIn('stage_seconds_count{stage="embed_query"} 1', lines)
+        self.assertIn("# TYPE queries_total counter", lines)
+        self.assertIn('queries_total{type="regular"} 1', lines)
+
+        self.registry.reset()
+        self.assertNotIn('queries_total{type="regular"} 1', self.registry.render().splitlines())
+
+
+class TestSharedMetrics(unittest.TestCase):
+    """Test metrics summed across processes"""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory = temp_dir.name
+        self.registry = Registry()
+        self.histogram = self.registry.register(
+            Histogram("stage_seconds", "Stage time", "stage", buckets=(0.01, 0.1))
+        )
+        self.counter = self.registry.register(Counter("queries_total", "Queries", "type"))
+
+    def test_values_before_sharing_are_kept(self):
+        self.counter.inc("regular", 2)
+        self.histogram.observe("store_load", 0.05)
+        self.registry.share(self.directory)
+        self.counter.inc("regular")
+        self.assertEqual(self.counter.value("regular"), 3)
+        self.assertEqual(self.histogram.count("store_load"), 1)
+        self.assertIn('queries_total{type="regular"} 3', self.registry.render().splitlines())
+
+    def test_file_grows(self):
+        self.registry.share(self.directory)
+        for i in range(3000):
+            self.counter.inc(f"label_{i:04d}", i)
+        values = SharedValues(self.directory).snapshot()
+        self.assertEqual(len(values), 3000)
+        self.assertEqual(values[("queries_total", "label_2999")], 2999)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_forked_processes_are_summed(self):
+        self.registry.share(self.directory)
+        self.counter.inc("regular")
+        children = []
+        for _ in range(3):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    self.counter.inc("regular", 2)
+                    self.histogram.observe("search", 0.05)
+                finally:
+                    os._exit(0)
+            children.append(pid)
+        for pid in children:
+            os.waitpid(pid, 0)
+
+        # The children have exited, and their values still count
+        self.assertEqual(self.counter.value("regular"), 7)
+        lines = self.registry.render().splitlines()
+        self.assertIn('stage_seconds_bucket{stage="search",le="0.1"} 3', lines)
+        self.assertIn('stage_seconds_count{stage="search"} 3', lines)
+        self.registry.reset()
+        self.assertEqual(self.counter.value("regular"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
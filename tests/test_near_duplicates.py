@@ -0,0 +1,101 @@
+"""
+Tests for near-duplicate chunk detection
+"""
+import sys
+import os
+import unittest
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from near_duplicates import find_near_duplicates, jaccard, lsh_bands, minhash_signatures, shingle_sets
+from create_embeddings import drop_near_duplicates
+
+
+def reference_shingles(text, size=3):
+    words = text.lower().split()
+    return {tuple(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))} if words else set()
+
+
+class TestShingles(unittest.TestCase):
+    def test_jaccard_matches_shingle_sets(self):
+        texts = [
+            "the quick brown fox jumps over the lazy dog",
+            "the quick brown fox leaps over the lazy dog",
+            "a completely different sentence about cost optimization",
+            "short text",
+            "",
+        ]
+        hashes, offsets = shingle_sets(texts)
+        for i in range(len(texts)):
+            self.assertEqual(offsets[i + 1] - offsets[i], len(reference_shingles(texts[i])))
+            for j in range(len(texts)):
+                a, b = reference_shingles(texts[i]), reference_shingles(texts[j])
+                expected = len(a & b) / len(a | b) if a and b else 0.0
+                self.assertAlmostEqual(jaccard(hashes, offsets, i, j), expected)
+
+    def test_minhash_estimates_jaccard(self):
+        rng = np.random.default_rng(0)
+        words = [f"w{i}" for i in range(2000)]
+        base = rng.choice(words, size=400).tolist()
+        edited = base[:300] + rng.choice(words, size=100).tolist()
+        hashes, offsets = shingle_sets([" ".join(base), " ".join(edited)])
+        signatures = minhash_signatures(hashes, offsets, num_perm=512)
+        estimate = np.mean(signatures[0] == signatures[1])
+        self.assertAlmostEqual(estimate, jaccard(hashes, offsets, 0, 1), delta=0.06)
+
+    def test_band_shape(self):
+        for threshold in (0.5, 0.8, 0.95):
+            bands, rows = lsh_bands(threshold)
+            self.assertLessEqual(bands * rows, 128)
+            # Pairs at the threshold almost always share a bucket
+            self.assertGreater(1 - (1 - threshold ** rows) ** bands, 0.5)
+
+
+class TestFindNearDuplicates(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        vocabulary = [f"term{i}" for i in range(5000)]
+        self.texts = [" ".join(rng.choice(vocabulary, size=80)) for _ in range(200)]
+
+    def test_keeps_first_copy(self):
+        words = self.texts[3].split()
+        texts = self.texts + [
+            self.texts[3],
+            " ".join(words[:-1] + ["edited"]),
+            self.texts[150].upper(),
+        ]
+        duplicates = find_near_duplicates(texts, threshold=0.8)
+        self.assertEqual([(dropped, kept) for dropped, kept, _ in duplicates], [(200, 3), (201, 3), (202, 150)])
+        self.assertEqual(duplicates[0][2], 1.0)
+        self.assertGreaterEqual(duplicates[1][2], 0.8)
+
+    def test_threshold(self):
+        words = self.texts[0].split()
+        # Half of text 0 followed by half of text 1
+        texts = self.texts + [" ".join(words[40:] + self.texts[1].split()[:40])]
+        self.assertEqual(find_near_duplicates(texts, threshold=0.9), [])
+        duplicates = find_near_duplicates(texts, threshold=0.3)
+        self.assertEqual([dropped for dropped, _, _ in duplicates], [200])
+        self.assertIn(duplicates[0][1], (0, 1))
+        with self.assertRaises(ValueError):
+            find_near_duplicates(texts, threshold=0)
+
+    def test_distinct_and_empty_texts_kept(self):
+        self.assertEqual(find_near_duplicates(self.texts + ["", ""]), [])
+
+    def test_drop_near_duplicates_report(self):
+        texts = ["alpha beta gamma delta", "unrelated words here now", "alpha beta gamma delta"]
+        metadatas = [{"id": f"chunk_{i}"} for i in range(3)]
+        kept_texts, kept_metadatas, report = drop_near_duplicates(texts, metadatas, threshold=0.8)
+        self.assertEqual(kept_texts, texts[:2])
+        self.assertEqual(kept_metadatas, metadatas[:2])
+        self.assertEqual(report["dropped"], [{"id": "chunk_2", "duplicate_of": "chunk_0", "similarity": 1.0}])
+        _, kept_metadatas, report = drop_near_duplicates(texts, metadatas, threshold=0)
+        self.assertEqual((kept_metadatas, report["dropped"]), (metadatas, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
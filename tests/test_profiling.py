@@ -0,0 +1,62 @@
+"""
+Tests for on-demand profiling of single calls
+"""
+import sys
+import os
+import tempfile
+import time
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from profiling import profile_call
+
+
+def inner():
+    time.sleep(0.01)
+    return 42
+
+
+def outer():
+    return inner()
+
+
+class TestProfileCall(unittest.TestCase):
+    """Test profile_call and the collapsed-stack output"""
+
+    def test_result_and_stacks(self):
+        result, profile = profile_call(outer)
+        self.assertEqual(result, 42)
+        self.assertGreaterEqual(profile.elapsed, 0.01)
+
+        weights = {}
+        for line in profile.collapsed().splitlines():
+            stack, weight = line.rsplit(" ", 1)
+            weights[stack] = int(weight)
+        sleep_stack = "test_profiling.py:outer;test_profiling.py:inner;time:sleep"
+        self.assertIn(sleep_stack, weights)
+        # Sleeping dominates and is charged to the innermost frame, in microseconds
+        self.assertGreaterEqual(weights[sleep_stack], 9000)
+        self.assertEqual(max(weights, key=weights.get), sleep_stack)
+
+    def test_profiler_removed_after_errors(self):
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            profile_call(fail)
+        self.assertIsNone(sys.getprofile())
+
+    def test_save_in(self):
+        _, profile = profile_call(outer)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            first = profile.save_in(tmpdir)
+            second = profile.save_in(tmpdir)
+            self.assertNotEqual(first, second)
+            with open(first) as f:
+                self.assertEqual(f.read(), profile.collapsed())
+
+
+if __name__ == "__main__":
+    unittest.main()
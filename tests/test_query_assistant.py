@@ -0,0 +1,255 @@
+"""
+Tests for the query assistant retrieval path
+"""
+import sys
+import os
+import unittest
+from unittest import mock
+from pathlib import Path
+import tempfile
+import threading
+import time
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# query_assistant refuses to import without an API key
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import metrics
+import query_assistant
+from create_embeddings import TfidfEmbeddings, SimpleVectorStore
+
+
+class TestSharedRetriever(unittest.TestCase):
+    """Test that the vector store is loaded once and shared"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Build a small vector store on disk"""
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.store_path = Path(cls.tmpdir.name) / "faiss_index"
+        texts = [
+            "The AWS Well-Architected Framework helps you build secure applications",
+            "AWS provides reliability as a key pillar in the framework",
+            "Cost optimization helps you avoid unnecessary costs",
+            "Performance efficiency is about using resources efficiently",
+            "Operational excellence is about running and monitoring systems"
+        ]
+        metadatas = [{"id": f"chunk_{i}", "source": f"doc{i}.txt"} for i in range(len(texts))]
+        store = SimpleVectorStore(TfidfEmbeddings())
+        store.add_texts(texts, metadatas)
+        store.save(cls.store_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        """Point the assistant at the test store and reset the shared retriever"""
+        patcher = mock.patch.object(query_assistant, "VECTOR_STORE_PATH", self.store_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        query_assistant._retriever = None
+        self.addCleanup(setattr, query_assistant, "_retriever", None)
+        query_assistant.query_cache.clear()
+        self.addCleanup(query_assistant.query_cache.clear)
+
+    def test_store_loaded_once(self):
+        """Repeated and concurrent questions load the store only once"""
+        with mock.patch.object(
+            query_assistant, "load_store", wraps=query_assistant.load_store
+        ) as load:
+            threads = [
+                threading.Thread(target=query_assistant.answer_question, args=("reliability pillar",))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            query_assistant.answer_question("What is cost optimization?")
+            self.assertEqual(load.call_count, 1)
+
+    def test_create_retriever_shares_store(self):
+        """Retrievers with different k share one vector store"""
+        first = query_assistant.create_retriever(k=1)
+        second = query_assistant.create_retriever(k=3)
+        self.assertIs(first.vector_store, second.vector_store)
+        self.assertEqual(len(first({"query": "reliability"})["source_documents"]), 1)
+        self.assertEqual(len(second({"query": "reliability"})["source_documents"]), 3)
+
+    def test_answer_question(self):
+        """answer_question returns an answer and its sources"""
+        result = query_assistant.answer_question("What is the reliability pillar?")
+        self.assertIn("reliability", result["answer"].lower())
+        self.assertEqual(result["sources"][0], "doc1.txt")
+
+    def test_answer_questions_matches_single(self):
+        """Batched answers match answering each question on its own"""
+        questions = [
+            "What is the reliability pillar?",
+            "Give me an overview of cost optimization",
+            "Summarize operational excellence",
+            "monitoring"
+        ]
+        self.assertEqual(
+            query_assistant.answer_questions(questions),
+            [query_assistant.answer_question(question) for question in questions]
+        )
+        self.assertEqual(query_assistant.answer_questions([]), [])
+
+    def test_repeated_question_served_from_cache(self):
+        """A repeated question skips the vector store search"""
+        store = query_assistant.get_retriever().vector_store
+        with mock.patch.object(
+            store, "similarity_search_with_score", wraps=store.similarity_search_with_score
+        ) as search:
+            first = query_assistant.answer_question("What is the reliability pillar?")
+            second = query_assistant.answer_question("what is the   reliability pillar?")
+            self.assertEqual(search.call_count, 1)
+        self.assertEqual(first["sources"], second["sources"])
+        # Callers get copies they can modify freely
+        second["sources"].append("extra")
+        self.assertNotIn("extra", query_assistant.answer_question("What is the reliability pillar?")["sources"])
+
+    def test_cached_answer_repeats_callers_question(self):
+        """A cache hit for an equivalent question does not show the question
+        that filled the cache"""
+        first = query_assistant.answer_question("What is RELIABILITY?")
+        second = query_assistant.answer_question("what is   reliability?")
+        self.assertTrue(first["answer"].startswith("Top 3 relevant passages for: What is RELIABILITY?\n"))
+        self.assertTrue(second["answer"].startswith("Top 3 relevant passages for: what is   reliability?\n"))
+        self.assertNotIn("RELIABILITY", second["answer"])
+        self.assertEqual(first["sources"], second["sources"])
+        batch = query_assistant.answer_questions(["WHAT is reliability?"])
+        self.assertTrue(batch[0]["answer"].startswith("Top 3 relevant passages for: WHAT is reliability?\n"))
+
+    def test_answer_question_without_cache(self):
+        """use_cache=False always searches and leaves the cache alone"""
+        query_assistant.answer_question("What is the reliability pillar?")
+        store = query_assistant.get_retriever().vector_store
+        with mock.patch.object(
+            store, "similarity_search_with_score", wraps=store.similarity_search_with_score
+        ) as search:
+            answer = query_assistant.answer_question("What is the reliability pillar?", use_cache=False)
+            self.assertEqual(search.call_count, 1)
+        self.assertEqual(answer, query_assistant.answer_question("What is the reliability pillar?"))
+
+    def test_new_index_version_invalidates_cache(self):
+        """Loading a store with a new version does not serve old answers"""
+        query_assistant.answer_question("What is the reliability pillar?")
+        retriever = query_assistant.get_retriever()
+        retriever.vector_store.version = "rebuilt"
+        with mock.patch.object(
+            retriever.vector_store, "similarity_search_with_score",
+            wraps=retriever.vector_store.similarity_search_with_score
+        ) as search:
+            query_assistant.answer_question("What is the reliability pillar?")
+            self.assertEqual(search.call_count, 1)
+
+    def test_summary_query_searches_once(self):
+        """Summary queries run a single search and return unique chunks"""
+        retriever = query_assistant.create_retriever(k=3)
+        store = retriever.vector_store
+        with mock.patch.object(
+            store, "similarity_search_with_score", wraps=store.similarity_search_with_score
+        ) as search:
+            result = retriever({"query": "Give me an overview of the framework pillars"})
+            search.assert_called_once()
+            self.assertEqual(search.call_args.kwargs["k"], query_assistant.SUMMARY_K)
+        ids = [doc["id"] for doc in result["source_documents"]]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertTrue(result["result"].startswith("Summary of"))
+
+    def test_dedupe_by_chunk_id(self):
+        """Repeated chunk ids keep only their best-ranked copy"""
+        results = [
+            ("a", {"id": "chunk_0"}, 0.1),
+            ("a", {"id": "chunk_0"}, 0.1),
+            ("b", {"id": "chunk_1"}, 0.2),
+        ]
+        self.assertEqual(
+            query_assistant.SimpleRetriever.dedupe(results),
+            [("a", {"id": "chunk_0"}, 0.1), ("b", {"id": "chunk_1"}, 0.2)]
+        )
+
+    def test_concurrent_identical_questions_search_once(self):
+        """Identical questions asked at the same time share one search"""
+        store = query_assistant.get_retriever().vector_store
+        search = store.similarity_search_with_score
+        release = threading.Event()
+        self.addCleanup(release.set)
+        calls = []
+
+        def slow_search(*args, **kwargs):
+            calls.append(args)
+            release.wait(timeout=5)
+            return search(*args, **kwargs)
+
+        results = []
+        coalesced_before = query_assistant.in_flight.coalesced
+        with mock.patch.object(store, "similarity_search_with_score", side_effect=slow_search):
+            threads = [
+                threading.Thread(
+                    target=lambda q: results.append(query_assistant.answer_question(q)),
+                    args=(question,)
+                )
+                for question in ["What is the reliability pillar?", "what is the RELIABILITY pillar?"] * 3
+            ]
+            for thread in threads:
+                thread.start()
+            # Hold the search until the other five requests have joined it
+            while query_assistant.in_flight.coalesced - coalesced_before < 5 and len(calls) < 2:
+                time.sleep(0.001)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(result["sources"] == results[0]["sources"] for result in results))
+        # Each caller's answer repeats its own question
+        headers = sorted(result["answer"].split("\n")[0] for result in results)
+        self.assertEqual(headers, sorted(
+            ["Top 3 relevant passages for: What is the reliability pillar?"] * 3
+            + ["Top 3 relevant passages for: what is the RELIABILITY pillar?"] * 3
+        ))
+        self.assertEqual(len(query_assistant.in_flight), 0)
+
+    def test_duplicate_questions_in_batch_search_once(self):
+        """Repeated questions in one batch are searched once"""
+        store = query_assistant.get_retriever().vector_store
+        with mock.patch.object(
+            store, "similarity_search_with_score_batch", wraps=store.similarity_search_with_score_batch
+        ) as search:
+            answers = query_assistant.answer_questions(["reliability", "Reliability ", "cost"])
+            self.assertEqual(search.call_args.args[0], ["reliability", "cost"])
+        self.assertEqual(answers[0]["sources"], answers[1]["sources"])
+        self.assertTrue(answers[1]["answer"].startswith("Top 3 relevant passages for: Reliability \n"))
+
+    def test_pipeline_metrics(self):
+        """Answering records stage timings and query counters"""
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+        query_assistant.answer_question("What is the reliability pillar?")
+        query_assistant.answer_question("What is the reliability pillar?")
+        query_assistant.answer_questions(["Summarize cost optimization"])
+
+        for stage in ("store_load", "embed_query", "search", "format_regular", "format_summary"):
+            self.assertGreater(metrics.STAGE_SECONDS.count(stage), 0, stage)
+        self.assertEqual(metrics.QUERIES.value("regular"), 2)
+        self.assertEqual(metrics.QUERIES.value("summary"), 1)
+        self.assertEqual(metrics.CACHE_REQUESTS.value("hit"), 1)
+        self.assertEqual(metrics.CACHE_REQUESTS.value("miss"), 2)
+
+    def test_reload_replaces_retriever(self):
+        """reload_retriever swaps in a freshly loaded store"""
+        before = query_assistant.get_retriever()
+        after = query_assistant.reload_retriever()
+        self.assertIsNot(before, after)
+        self.assertIs(query_assistant.get_retriever(), after)
+
+
+if __name__ == '__main__':
+    unittest.main()
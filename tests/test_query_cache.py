@@ -0,0 +1,71 @@
+"""
+Tests for the in-process query result cache
+"""
+import sys
+import os
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from query_cache import QueryCache, normalize_question
+
+
+class FakeClock:
+    """Manually advanced clock for TTL tests"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestQueryCache(unittest.TestCase):
+    """Test the QueryCache class"""
+
+    def test_normalized_keys(self):
+        """Case and whitespace differences map to the same key"""
+        self.assertEqual(normalize_question("  What are   the Pillars? "), "what are the pillars?")
+        self.assertEqual(
+            QueryCache.make_key("v1", "What are the pillars?", 3, False),
+            QueryCache.make_key("v1", "what are  the pillars?", 3, False)
+        )
+        self.assertNotEqual(
+            QueryCache.make_key("v1", "pillars", 3, False),
+            QueryCache.make_key("v2", "pillars", 3, False)
+        )
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted when the cache is full"""
+        cache = QueryCache(max_size=2, ttl=0)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_ttl_expiry(self):
+        """Entries expire once their time-to-live has passed"""
+        clock = FakeClock()
+        cache = QueryCache(max_size=10, ttl=5, clock=clock)
+        cache.set("a", 1)
+        clock.now = 4.9
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 5.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_disabled(self):
+        """A cache with max_size 0 stores nothing"""
+        cache = QueryCache(max_size=0)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
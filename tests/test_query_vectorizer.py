@@ -0,0 +1,109 @@
+"""
+Tests for the pickle-free query vectorizer
+"""
+import sys
+import os
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from create_embeddings import LsaEmbeddings, SimpleVectorStore, TfidfEmbeddings
+from query_vectorizer import QueryVectorizer
+
+TEXTS = [
+    "The AWS Well-Architected Framework helps you build secure applications",
+    "AWS provides reliability as a key pillar in the framework",
+    "Cost optimization helps you avoid unnecessary costs",
+    "Performance efficiency is about using resources efficiently",
+    "Operational excellence is about running and monitoring systems",
+    "Sustainability: reduce the environmental impact of cloud workloads",
+]
+
+QUERIES = [
+    "What is the reliability pillar?",
+    "COST cost Cost optimization, costs!",
+    "",
+    "the and of is",
+    "Ünïcode café résumé framework",
+    "unknown words only",
+    "monitoring\nsystems\tand\nworkloads",
+]
+
+
+def assert_identical(test, expected, actual):
+    """Same sparsity structure and bit-for-bit equal values"""
+    expected = expected.tocsr()
+    expected.sort_indices()
+    test.assertEqual(expected.shape, actual.shape)
+    np.testing.assert_array_equal(expected.indptr, actual.indptr)
+    np.testing.assert_array_equal(expected.indices, actual.indices)
+    test.assertEqual(expected.data.dtype, actual.data.dtype)
+    np.testing.assert_array_equal(expected.data.view(np.int64), actual.data.view(np.int64))
+
+
+class TestQueryVectorizer(unittest.TestCase):
+    """Test QueryVectorizer against the fitted sklearn vectorizer"""
+
+    def setUp(self):
+        self.sklearn_vectorizer = TfidfVectorizer(lowercase=True, stop_words='english').fit(TEXTS)
+        self.vectorizer = QueryVectorizer.from_sklearn(self.sklearn_vectorizer)
+
+    def test_bit_identical(self):
+        assert_identical(self, self.sklearn_vectorizer.transform(QUERIES), self.vectorizer.transform(QUERIES))
+        for query in QUERIES:
+            assert_identical(self, self.sklearn_vectorizer.transform([query]), self.vectorizer.transform([query]))
+        self.assertEqual(self.vectorizer.transform([]).shape, (0, len(self.vectorizer.terms)))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = Path(tmpdirname) / "vectorizer.npz"
+            self.vectorizer.save(path)
+            with np.load(path, allow_pickle=False) as data:
+                self.assertNotIn(np.dtype(object), [data[name].dtype for name in data.files])
+            loaded = QueryVectorizer.load(path)
+        self.assertEqual(loaded.vocabulary_, self.sklearn_vectorizer.vocabulary_)
+        self.assertEqual(loaded.stop_words, frozenset(self.sklearn_vectorizer.get_stop_words()))
+        assert_identical(self, self.sklearn_vectorizer.transform(QUERIES), loaded.transform(QUERIES))
+
+    def test_other_supported_settings(self):
+        for settings in ({"lowercase": False}, {"use_idf": False}, {"norm": None}, {"stop_words": None}):
+            with self.subTest(**settings):
+                sklearn_vectorizer = TfidfVectorizer(**settings).fit(TEXTS)
+                vectorizer = QueryVectorizer.from_sklearn(sklearn_vectorizer)
+                assert_identical(self, sklearn_vectorizer.transform(QUERIES), vectorizer.transform(QUERIES))
+
+    def test_unsupported_settings(self):
+        for settings in ({"ngram_range": (1, 2)}, {"sublinear_tf": True}, {"binary": True}, {"norm": "l1"}):
+            with self.subTest(**settings):
+                with self.assertRaises(ValueError):
+                    QueryVectorizer.from_sklearn(TfidfVectorizer(**settings).fit(TEXTS))
+
+    def test_saved_stores_use_query_vectorizer(self):
+        """Loaded stores search exactly like the stores that were saved"""
+        stores = [
+            SimpleVectorStore(TfidfEmbeddings(), index_type="sparse"),
+            SimpleVectorStore(TfidfEmbeddings(), index_type="flat"),
+            SimpleVectorStore(LsaEmbeddings(dimension=4), index_type="flat"),
+        ]
+        for store in stores:
+            with self.subTest(index_type=store.index_type, embeddings=type(store.embeddings).__name__):
+                store.add_texts(TEXTS, [{"id": str(i)} for i in range(len(TEXTS))])
+                with tempfile.TemporaryDirectory() as tmpdirname:
+                    store.save(tmpdirname)
+                    loaded = SimpleVectorStore.load(tmpdirname)
+                    self.assertIsInstance(loaded.embeddings.vectorizer, QueryVectorizer)
+                    for query in QUERIES:
+                        self.assertEqual(
+                            store.similarity_search_with_score(query, k=3),
+                            loaded.similarity_search_with_score(query, k=3)
+                        )
+
+
+if __name__ == "__main__":
+    unittest.main()
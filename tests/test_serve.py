@@ -0,0 +1,127 @@
+"""
+Tests for the pre-fork server
+"""
+import sys
+import os
+import signal
+import socket
+import subprocess
+import textwrap
+import time
+import unittest
+import urllib.request
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+
+from serve import app_interface, load_app
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# ASGI app answering every request with the pid of the worker and its parent
+PID_APP = textwrap.dedent("""
+    import os
+    import sys
+
+    from serve import serve
+
+    async def app(scope, receive, send):
+        body = f"{os.getpid()} {os.getppid()}".encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": body})
+
+    serve(app, host="127.0.0.1", port=int(sys.argv[1]), workers=2)
+""")
+
+# ASGI app counting requests to /count and serving /metrics
+METRICS_APP = textwrap.dedent("""
+    import sys
+
+    import metrics
+    from serve import serve
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/count":
+            metrics.QUERIES.inc("regular")
+            body = b"ok"
+        else:
+            body = metrics.render().encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": body})
+
+    metrics.QUERIES.inc("regular")
+    serve(app, host="127.0.0.1", port=int(sys.argv[1]), workers=2)
+""")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(test, source, port):
+    """Run source as a server on port and wait until it answers"""
+    server = subprocess.Popen(
+        [sys.executable, "-c", source, str(port)],
+        cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    test.addCleanup(server.kill)
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=5) as response:
+                return server, response.read()
+        except OSError:
+            if time.monotonic() > deadline:
+                test.fail("Server did not start")
+            time.sleep(0.1)
+
+
+class TestServe(unittest.TestCase):
+    def test_app_interface(self):
+        async def asgi_app(scope, receive, send):
+            pass
+
+        self.assertEqual(app_interface(Flask(__name__)), "wsgi")
+        self.assertEqual(app_interface(asgi_app), "asgi3")
+
+    def test_load_app(self):
+        self.assertIs(load_app("serve:app_interface"), app_interface)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_workers_serve_and_stop(self):
+        server, body = start_server(self, PID_APP, free_port())
+        pid, parent = map(int, body.split())
+
+        # Requests are handled by a forked worker, not the supervising parent
+        self.assertNotEqual(pid, server.pid)
+        self.assertEqual(parent, server.pid)
+
+        server.send_signal(signal.SIGTERM)
+        self.assertEqual(server.wait(timeout=30), 0)
+        with self.assertRaises(OSError):
+            os.kill(pid, 0)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_metrics_summed_across_workers(self):
+        port = free_port()
+        server, _ = start_server(self, METRICS_APP, port)
+        for _ in range(20):
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/count", timeout=5) as response:
+                response.read()
+        # Whichever worker answers, it reports the count of the whole server,
+        # including the one recorded by the parent before forking
+        for _ in range(6):
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+                self.assertIn('rag_queries_total{type="regular"} 21', response.read().decode().splitlines())
+        server.send_signal(signal.SIGTERM)
+        self.assertEqual(server.wait(timeout=30), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+"""
+Tests for the shard servers and the coordinator, run as local processes
+"""
+import sys
+import os
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from generate_corpus import CorpusModel
+import metrics
+import query_assistant
+from shard_coordinator import PartialResults, ShardClient, ShardCoordinator, ShardsUnavailableError
+from sharded_store import ShardedVectorStore
+from vector_store import TfidfEmbeddings
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+N_SHARDS = 3
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeShard:
+    """Shard server that reports `info` but stalls or fails on every search"""
+
+    def __init__(self, info, delay=None, status=500):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.reply(200, info)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                if delay:
+                    time.sleep(delay)
+                self.reply(status, {"detail": "unavailable"})
+
+            def reply(self, code, body):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestShardServers(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        model = CorpusModel.fit(os.path.join(REPO_DIR, "chunks"))
+        cls.texts = model.generate_texts(300)
+        cls.metadatas = [
+            {"id": f"chunk_{i}", "source": f"doc_{i // 10}.txt", "chunk_index": i % 10} for i in range(len(cls.texts))
+        ]
+        cls.queries = [" ".join(text.split()[:6]) for text in model.generate_texts(20, seed=1)]
+        cls.local = ShardedVectorStore(TfidfEmbeddings(), N_SHARDS, index_type="sparse")
+        cls.local.add_texts(cls.texts, cls.metadatas)
+
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.local.save(cls.temp_dir.name)
+        cls.servers = []
+        cls.urls = []
+        for shard in range(N_SHARDS):
+            port = free_port()
+            cls.servers.append(subprocess.Popen(
+                [sys.executable, os.path.join(REPO_DIR, "shard_server.py"), cls.temp_dir.name,
+                 "--shard", str(shard), "--host", "127.0.0.1", "--port", str(port)],
+                cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ))
+            cls.urls.append(f"http://127.0.0.1:{port}")
+        deadline = time.monotonic() + 60
+        for url in cls.urls:
+            while True:
+                try:
+                    ShardClient(url).request("GET", "/info")
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        cls.tearDownClass()
+                        raise
+                    time.sleep(0.1)
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.send_signal(signal.SIGTERM)
+        for server in cls.servers:
+            server.wait(timeout=30)
+        cls.temp_dir.cleanup()
+
+    def fake_shard(self, shard, **kwargs):
+        info = {"shard": shard, "shards": N_SHARDS, "version": "fake", "chunks": 0, "index_type": "sparse"}
+        fake = FakeShard(info, **kwargs)
+        self.addCleanup(fake.close)
+        return fake
+
+    def test_info(self):
+        info = ShardClient(self.urls[1]).request("GET", "/info")
+        self.assertEqual((info["shard"], info["shards"], info["chunks"]), (1, N_SHARDS, 100))
+
+    def test_matches_local_sharded_store(self):
+        coordinator = ShardCoordinator(self.urls)
+        expected = self.local.similarity_search_with_score_batch(self.queries, k=7)
+        actual = coordinator.similarity_search_with_score_batch(self.queries, k=7)
+        self.assertEqual(
+            [[(text, metadata, float(distance)) for text, metadata, distance in results] for results in expected],
+            actual,
+        )
+        self.assertNotIsInstance(actual[0], PartialResults)
+
+    def test_filtered_search_matches_local_sharded_store(self):
+        coordinator = ShardCoordinator(self.urls)
+        search_filter = {"source": ["doc_3.txt", "doc_17.txt"], "chunk_index": {"lte": 6}}
+        expected = self.local.similarity_search_with_score_batch(self.queries, k=7, filter=search_filter)
+        actual = coordinator.similarity_search_with_score_batch(self.queries, k=7, filter=search_filter)
+        self.assertEqual(
+            [[(text, metadata, float(distance)) for text, metadata, distance in results] for results in expected],
+            actual,
+        )
+        self.assertTrue(all(len(results) == 7 for results in actual))
+        with self.assertRaises(ValueError):
+            coordinator.similarity_search_with_score(self.queries[0], filter={"author": "me"})
+
+    def test_shards_must_cover_the_store(self):
+        with self.assertRaises(ValueError):
+            ShardCoordinator(self.urls[:2])
+        with self.assertRaises(ValueError):
+            ShardCoordinator(self.urls + [self.urls[0]])
+
+    def test_slow_shard_is_left_out(self):
+        slow = self.fake_shard(2, delay=2)
+        coordinator = ShardCoordinator(self.urls[:2] + [slow.url], timeout=0.3)
+        timeouts = metrics.SHARD_REQUESTS.value("timeout")
+
+        start = time.monotonic()
+        results = coordinator.similarity_search_with_score(self.queries[0], k=5)
+        self.assertLess(time.monotonic() - start, 1.5)
+
+        self.assertIsInstance(results, PartialResults)
+        self.assertEqual(results.missing_shards, [slow.url])
+        self.assertEqual(len(results), 5)
+        # Shard 2 holds every third chunk, starting with chunk 2
+        self.assertTrue(all(int(metadata["id"].split("_")[1]) % N_SHARDS != 2 for _, metadata, _ in results))
+        self.assertEqual(metrics.SHARD_REQUESTS.value("timeout"), timeouts + 1)
+
+    def test_no_shard_answers(self):
+        coordinator = ShardCoordinator([self.fake_shard(shard).url for shard in range(N_SHARDS)])
+        with self.assertRaises(ShardsUnavailableError):
+            coordinator.similarity_search_with_score(self.queries[0])
+
+    def test_answer_question_through_coordinator(self):
+        query_assistant._retriever = None
+        self.addCleanup(setattr, query_assistant, "_retriever", None)
+        query_assistant.query_cache.clear()
+        self.addCleanup(query_assistant.query_cache.clear)
+        question = self.queries[0]
+
+        with mock.patch.object(query_assistant, "SHARD_SERVERS", self.urls):
+            answer = query_assistant.answer_question(question)
+        expected = query_assistant.SimpleRetriever(self.local)({"query": question, "k": query_assistant.DEFAULT_K})
+        self.assertEqual(answer["answer"], expected["result"])
+        self.assertEqual(len(query_assistant.query_cache), 1)
+
+    def test_partial_answers_are_not_cached(self):
+        query_assistant._retriever = None
+        self.addCleanup(setattr, query_assistant, "_retriever", None)
+        query_assistant.query_cache.clear()
+        self.addCleanup(query_assistant.query_cache.clear)
+        failing = self.fake_shard(0)
+
+        with mock.patch.object(query_assistant, "SHARD_SERVERS", [failing.url] + self.urls[1:]):
+            query_assistant.answer_question(self.queries[0])
+            query_assistant.answer_questions(self.queries[1:3])
+        self.assertEqual(len(query_assistant.query_cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
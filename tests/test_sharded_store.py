@@ -0,0 +1,115 @@
+"""
+Tests for the sharded vector store
+"""
+import sys
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from generate_corpus import CorpusModel
+from sharded_store import ShardedVectorStore, load_store, merge_top_k
+from vector_store import SimpleVectorStore, TfidfEmbeddings
+
+CHUNK_DIR = os.path.join(os.path.dirname(__file__), '..', 'chunks')
+
+
+class TestMergeTopK(unittest.TestCase):
+    def test_merges_in_distance_then_index_order(self):
+        shard_results = [
+            (np.array([[0.1, 0.5, 0.5]], dtype=np.float32), np.array([[0, 4, 8]])),
+            (np.array([[0.5, 0.7, np.inf]], dtype=np.float32), np.array([[1, 5, -1]])),
+        ]
+        distances, indices = merge_top_k(shard_results, 1, 4)
+        self.assertEqual(indices.tolist(), [[0, 1, 4, 8]])
+        np.testing.assert_allclose(distances, [[0.1, 0.5, 0.5, 0.5]])
+
+    def test_pads_missing_results(self):
+        shard_results = [(np.array([[0.2, np.inf]], dtype=np.float32), np.array([[3, -1]]))]
+        distances, indices = merge_top_k(shard_results, 1, 3)
+        self.assertEqual(indices.tolist(), [[3, -1, -1]])
+        self.assertTrue(np.isinf(distances[0, 1:]).all())
+
+
+class TestShardedVectorStore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        model = CorpusModel.fit(CHUNK_DIR)
+        cls.texts = model.generate_texts(600)
+        # Exact duplicates produce tied distances across shards
+        cls.texts[10] = cls.texts[11] = cls.texts[12] = cls.texts[3]
+        cls.metadatas = [{"id": f"chunk_{i}"} for i in range(len(cls.texts))]
+        cls.queries = [" ".join(text.split()[:6]) for text in model.generate_texts(50, seed=1)]
+        cls.queries.append(cls.texts[3])
+
+    def build(self, index_type, n_shards=None):
+        embeddings = TfidfEmbeddings()
+        embeddings.fit(self.texts)
+        if n_shards is None:
+            store = SimpleVectorStore(embeddings, index_type=index_type)
+        else:
+            store = ShardedVectorStore(embeddings, n_shards, index_type=index_type)
+        # Added in two batches to exercise the round-robin continuation
+        store.add_texts(self.texts[:250], self.metadatas[:250])
+        store.add_texts(self.texts[250:], self.metadatas[250:])
+        return store
+
+    def test_matches_unsharded_ranking(self):
+        for index_type in ("sparse", "flat"):
+            expected_distances, expected_indices = self.build(index_type).search_indices(self.queries, k=10)
+            for n_shards in (1, 3, 8):
+                with self.subTest(index_type=index_type, n_shards=n_shards):
+                    store = self.build(index_type, n_shards)
+                    distances, indices = store.search_indices(self.queries, k=10)
+                    np.testing.assert_array_equal(indices, expected_indices)
+                    np.testing.assert_array_equal(distances, expected_distances)
+
+    def test_records_in_global_order(self):
+        store = self.build("sparse", 3)
+        self.assertEqual(len(store.texts), len(self.texts))
+        self.assertEqual(list(store.texts), self.texts)
+        self.assertEqual(store.metadatas[-1], self.metadatas[-1])
+        self.assertEqual([len(shard.texts) for shard in store.shards], [200, 200, 200])
+
+        results = store.similarity_search_with_score(self.texts[42], k=1)
+        self.assertEqual(results[0][1]["id"], "chunk_42")
+
+    def test_more_shards_than_texts(self):
+        embeddings = TfidfEmbeddings()
+        store = ShardedVectorStore(embeddings, 8, index_type="sparse")
+        store.add_texts(self.texts[:3], self.metadatas[:3])
+        distances, indices = store.search_indices([self.texts[1]], k=5)
+        self.assertEqual(indices[0, 0], 1)
+        self.assertEqual(sorted(indices[0, :3].tolist()), [0, 1, 2])
+        self.assertEqual(indices[0, 3:].tolist(), [-1, -1])
+
+    def test_save_and_load(self):
+        store = self.build("sparse", 3)
+        expected = store.search_indices(self.queries, k=5)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store.save(temp_dir)
+            loaded = load_store(temp_dir)
+            self.assertIsInstance(loaded, ShardedVectorStore)
+            self.assertEqual(loaded.n_shards, 3)
+            self.assertEqual(loaded.version, store.version)
+            self.assertTrue(all(shard.embeddings is loaded.embeddings for shard in loaded.shards))
+            for actual, wanted in zip(loaded.search_indices(self.queries, k=5), expected):
+                np.testing.assert_array_equal(actual, wanted)
+            self.assertEqual(loaded.texts[7], self.texts[7])
+            del loaded
+
+    def test_load_store_opens_unsharded_stores(self):
+        store = self.build("sparse")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store.save(temp_dir)
+            loaded = load_store(temp_dir)
+            self.assertIs(type(loaded), SimpleVectorStore)
+            del loaded
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Tests for coalescing identical in-flight computations
+"""
+import sys
+import os
+import threading
+import time
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test the SingleFlight class"""
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        self.addCleanup(release.set)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(timeout=5)
+            return "answer"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do("key", compute)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        # Wait until every follower has joined the leader's call
+        while flight.coalesced < 4 and threads[0].is_alive():
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["answer"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.coalesced, 4)
+        self.assertEqual(len(flight), 0)
+
+    def test_sequential_calls_recompute(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("key", lambda: 1), 1)
+        self.assertEqual(flight.do("key", lambda: 2), 2)
+        self.assertEqual(flight.coalesced, 0)
+
+    def test_errors_are_shared(self):
+        flight = SingleFlight()
+        future, leader = flight.claim("key")
+        follower, follower_leads = flight.claim("key")
+        self.assertTrue(leader)
+        self.assertFalse(follower_leads)
+        self.assertIs(follower, future)
+
+        flight.resolve("key", error=ValueError("boom"))
+        with self.assertRaises(ValueError):
+            follower.result(timeout=5)
+        self.assertEqual(len(flight), 0)
+
+    def test_failed_call_is_forgotten(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            flight.do("key", fail)
+        self.assertEqual(flight.do("key", lambda: "retried"), "retried")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Tests that the query path imports only what serving needs
+"""
+import sys
+import os
+import json
+import subprocess
+import tempfile
+import unittest
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_DIR)
+
+CHECK_IMPORTS = """
+import json, sys
+import query_assistant
+print(json.dumps(sorted({name.split(".")[0] for name in sys.modules})))
+"""
+
+CHECK_QUERY = """
+import json, sys
+from pathlib import Path
+import query_assistant
+query_assistant.VECTOR_STORE_PATH = Path(sys.argv[1])
+query_assistant.answer_question("What is the reliability pillar?")
+print(json.dumps(sorted({name.split(".")[0] for name in sys.modules})))
+"""
+
+
+def imported_modules(script, *args):
+    """Top-level modules imported after running script in a fresh interpreter"""
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "test-key"))
+    output = subprocess.run(
+        [sys.executable, "-c", script, *args],
+        capture_output=True, text=True, check=True, cwd=REPO_DIR, env=env,
+    ).stdout
+    return set(json.loads(output.strip().splitlines()[-1]))
+
+
+class TestLeanImports(unittest.TestCase):
+    """Importing query_assistant must not load build-time libraries"""
+
+    def test_no_heavy_imports(self):
+        modules = imported_modules(CHECK_IMPORTS)
+        self.assertIn("query_assistant", modules)
+        for heavy in ("sklearn", "faiss", "tqdm", "create_embeddings"):
+            self.assertNotIn(heavy, modules)
+
+    def test_sparse_store_served_without_sklearn_or_faiss(self):
+        """Loading a saved sparse store and answering needs neither library"""
+        from create_embeddings import SimpleVectorStore, TfidfEmbeddings
+
+        store = SimpleVectorStore(TfidfEmbeddings(), index_type="sparse")
+        store.add_texts(
+            ["AWS provides reliability as a key pillar", "Cost optimization avoids unnecessary costs"],
+            [{"id": "chunk_0", "source": "doc0.txt"}, {"id": "chunk_1", "source": "doc1.txt"}],
+        )
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            store.save(tmpdirname)
+            modules = imported_modules(CHECK_QUERY, tmpdirname)
+        self.assertNotIn("sklearn", modules)
+        self.assertNotIn("faiss", modules)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Tests for the FastAPI and Flask web apps
+"""
+import sys
+import os
+import tempfile
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# query_assistant refuses to import without an API key
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from fastapi.testclient import TestClient
+
+import metrics
+
+
+def setUpModule():
+    """Import the apps from an empty directory
+
+    The apps create templates/ and load ./faiss_index from the working
+    directory at import time.
+    """
+    global web_app, flask_web_app
+    cwd = os.getcwd()
+    tmpdir = tempfile.TemporaryDirectory()
+    os.chdir(tmpdir.name)
+    try:
+        import web_app
+        import flask_web_app
+    finally:
+        os.chdir(cwd)
+        tmpdir.cleanup()
+
+
+def request_series():
+    """Endpoint labels of the request latency histogram"""
+    return {
+        line.split('endpoint="')[1].split('"')[0]
+        for line in metrics.render().splitlines()
+        if line.startswith("rag_request_duration_seconds_count")
+    }
+
+
+class TestRequestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def test_fastapi_labels_by_route(self):
+        client = TestClient(web_app.app)
+        for i in range(3):
+            self.assertEqual(client.get(f"/api/nope{i}").status_code, 404)
+        self.assertEqual(client.post("/api/query/batch", json={}).status_code, 422)
+        self.assertEqual(request_series(), {"unmatched", "/api/query/batch"})
+
+    def test_flask_labels_by_route(self):
+        client = flask_web_app.app.test_client()
+        for i in range(3):
+            self.assertEqual(client.get(f"/api/nope{i}").status_code, 404)
+        self.assertEqual(client.post("/api/query/batch", json={}).status_code, 400)
+        self.assertEqual(request_series(), {"unmatched", "/api/query/batch"})
+
+
+class TestFlaskBatch(unittest.TestCase):
+    def test_non_object_body(self):
+        client = flask_web_app.app.test_client()
+        for body in (["a"], "a", 1):
+            response = client.post("/api/query/batch", json=body)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json(), {"error": "No questions provided"})
+
+
+if __name__ == "__main__":
+    unittest.main()
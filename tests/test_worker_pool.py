@@ -0,0 +1,76 @@
+"""
+Tests for the bounded worker pool used by the async web app
+"""
+import sys
+import os
+import asyncio
+import threading
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from worker_pool import QueueFullError, WorkerPool
+
+
+class TestWorkerPool(unittest.TestCase):
+    """Test the WorkerPool class"""
+
+    def setUp(self):
+        self.pool = WorkerPool(max_workers=2, max_queue=1)
+        self.release = threading.Event()
+        self.addCleanup(self.pool.shutdown)
+        # Never leave workers blocked if a test fails
+        self.addCleanup(self.release.set)
+
+    def blocked(self, value):
+        self.release.wait(timeout=5)
+        return value
+
+    def test_run_returns_result(self):
+        self.assertEqual(asyncio.run(self.pool.run(sum, [1, 2, 3])), 6)
+        self.assertEqual(self.pool.pending, 0)
+
+    def test_rejects_beyond_capacity(self):
+        """Workers plus queue slots are admitted, the next call is rejected"""
+        futures = [self.pool.submit(self.blocked, i) for i in range(3)]
+        self.assertEqual(self.pool.pending, 3)
+        with self.assertRaises(QueueFullError):
+            self.pool.submit(self.blocked, 3)
+
+        self.release.set()
+        self.assertEqual([f.result(timeout=5) for f in futures], [0, 1, 2])
+        self.assertEqual(self.pool.pending, 0)
+        self.assertEqual(self.pool.submit(self.blocked, 4).result(timeout=5), 4)
+
+    def test_errors_free_their_slot(self):
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            asyncio.run(self.pool.run(fail))
+        self.assertEqual(self.pool.pending, 0)
+
+    def test_event_loop_not_blocked(self):
+        """Other coroutines keep running while workers are busy"""
+        async def scenario():
+            slow = asyncio.ensure_future(self.pool.run(self.blocked, "slow"))
+            await asyncio.sleep(0)
+            ticks = 0
+            while ticks < 3:
+                await asyncio.sleep(0.01)
+                ticks += 1
+            self.release.set()
+            return ticks, await slow
+
+        self.assertEqual(asyncio.run(scenario()), (3, "slow"))
+
+    def test_invalid_limits(self):
+        with self.assertRaises(ValueError):
+            WorkerPool(max_workers=0)
+        with self.assertRaises(ValueError):
+            WorkerPool(max_queue=-1)
+
+
+if __name__ == "__main__":
+    unittest.main()
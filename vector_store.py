@@ -0,0 +1,419 @@
+"""
+Vector store used to serve queries
+
+TfidfEmbeddings, LsaEmbeddings and SimpleVectorStore, split out of
+create_embeddings.py so the query path only imports what searching needs.
+Heavy libraries are imported on first use: scikit-learn only when fitting
+new embeddings (saved stores use the pickle-free QueryVectorizer), and FAISS
+only for dense index types, so a sparse TF-IDF store is served without
+importing either.
+"""
+import json
+import os
+import pickle
+import uuid
+
+import numpy as np
+
+from chunk_store import open_metadatas, open_texts, write_metadatas, write_texts
+from index_factory import (
+    ANN_INDEX_TYPES, apply_search_params, create_index, resolve_index_params, search_parameters
+)
+from metadata_filter import MetadataIndex
+from metrics import STAGE_SECONDS
+from query_vectorizer import QueryVectorizer
+from sparse_index import SparseIndex, write_sparse_index, read_sparse_index
+
+INDEX_TYPES = ("flat", "sparse") + ANN_INDEX_TYPES
+
+# On-disk layout written by SimpleVectorStore.save: 1 pickled texts and
+# metadata, 2 memory-mappable blobs (chunk_store), 3 adds the pickle-free
+# vectorizer.npz in place of vectorizer.pickle
+STORE_FORMAT = 3
+
+
+def faiss_mmap_flags():
+    """Flags to open FAISS indexes read-only and memory-mapped.
+
+    IO_FLAG_MMAP_IFC (newer FAISS releases) also maps flat vector storage
+    instead of copying it.
+    """
+    import faiss
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def _is_inner_product(index):
+    import faiss
+    return getattr(index, "metric_type", faiss.METRIC_L2) == faiss.METRIC_INNER_PRODUCT
+
+
+class TfidfEmbeddings:
+    """Simple TF-IDF based embeddings"""
+    
+    def __init__(self, vectorizer=None):
+        """Create untrained embeddings, or wrap an already fitted vectorizer"""
+        if vectorizer is None:
+            # Only needed to fit new embeddings
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            vectorizer = TfidfVectorizer(lowercase=True, stop_words='english')
+            self.trained = False
+        else:
+            self.trained = True
+        self.vectorizer = vectorizer
+        self.vectors = None
+    
+    def fit(self, texts):
+        """Fit the vectorizer on the texts"""
+        self.vectors = self.vectorizer.fit_transform(texts)
+        self.trained = True
+    
+    def embed_documents(self, texts):
+        """Embed documents using the fitted vectorizer"""
+        if not self.trained:
+            raise ValueError("Vectorizer not trained. Call fit() first.")
+        return self.vectorizer.transform(texts).toarray()
+    
+    def embed_query(self, text):
+        """Embed a single query"""
+        if not self.trained:
+            raise ValueError("Vectorizer not trained. Call fit() first.")
+        return self.vectorizer.transform([text]).toarray()[0]
+
+    def embed_documents_sparse(self, texts):
+        """Embed documents as a sparse CSR matrix"""
+        if not self.trained:
+            raise ValueError("Vectorizer not trained. Call fit() first.")
+        return self.vectorizer.transform(texts).astype(np.float32)
+
+    def embed_query_sparse(self, text):
+        """Embed a single query as a 1 x vocabulary sparse CSR matrix"""
+        if not self.trained:
+            raise ValueError("Vectorizer not trained. Call fit() first.")
+        return self.vectorizer.transform([text]).astype(np.float32)
+
+
+class LsaEmbeddings(TfidfEmbeddings):
+    """TF-IDF embeddings compressed with latent semantic analysis.
+    
+    A TruncatedSVD fitted on the TF-IDF matrix projects every vector down to
+    `dimension` components, which are then L2-normalized so inner products
+    are cosine similarities.
+    """
+    
+    def __init__(self, dimension=256, vectorizer=None):
+        super().__init__(vectorizer)
+        self.dimension = dimension
+        self.components = None
+    
+    def fit(self, texts):
+        """Fit the vectorizer and the SVD projection on the texts"""
+        from sklearn.decomposition import TruncatedSVD
+        super().fit(texts)
+        n_docs, n_features = self.vectors.shape
+        n_components = max(1, min(self.dimension, n_docs, n_features - 1))
+        svd = TruncatedSVD(n_components=n_components, random_state=0)
+        svd.fit(self.vectors)
+        self.components = svd.components_.astype(np.float32)
+        self.dimension = n_components
+    
+    def project(self, tfidf_vectors):
+        """Project sparse TF-IDF vectors into the normalized latent space"""
+        vectors = np.asarray(tfidf_vectors @ self.components.T, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        # All-zero vectors (no known terms) stay zero instead of dividing by 0
+        return vectors / np.where(norms > 0, norms, 1)
+    
+    def embed_documents(self, texts):
+        """Embed documents in the latent space"""
+        if not self.trained:
+            raise ValueError("Vectorizer not trained. Call fit() first.")
+        return self.project(self.vectorizer.transform(texts))
+    
+    def embed_query(self, text):
+        """Embed a single query in the latent space"""
+        return self.embed_documents([text])[0]
+    
+    def embed_documents_sparse(self, texts):
+        raise ValueError("LSA embeddings are dense; use the flat index type")
+    
+    def embed_query_sparse(self, text):
+        raise ValueError("LSA embeddings are dense; use the flat index type")
+
+
+class SimpleVectorStore:
+    """Simple vector store using FAISS or a sparse TF-IDF index"""
+    
+    def __init__(self, embeddings, texts=None, metadatas=None, index_type="flat", index_params=None):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+        if index_type == "sparse" and isinstance(embeddings, LsaEmbeddings):
+            raise ValueError("LSA embeddings are dense and cannot use the sparse index")
+        self.embeddings = embeddings
+        self.texts = texts or []
+        self.metadatas = metadatas or []
+        self.index_type = index_type
+        self.index_params = dict(index_params or {})
+        self.index = None
+        # Built from the metadata on first use unless loaded with the store
+        self._metadata_index = None
+        # Identifies the indexed content; changes whenever texts are added
+        self.version = uuid.uuid4().hex
+    
+    def add_texts(self, texts, metadatas=None):
+        """Add texts to the vector store"""
+        if metadatas is None:
+            metadatas = [{} for _ in texts]
+        
+        # Stores loaded from disk hold read-only, memory-mapped records
+        if not isinstance(self.texts, list):
+            self.texts = list(self.texts)
+            self.metadatas = list(self.metadatas)
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+        self._metadata_index = None
+        self.version = uuid.uuid4().hex
+        
+        if not self.embeddings.trained:
+            self.embeddings.fit(self.texts)
+        
+        if self.index_type == "sparse":
+            vectors = self.embeddings.embed_documents_sparse(texts)
+            if self.index is None:
+                self.index = SparseIndex(vectors.shape[1])
+            self.index.add(vectors)
+            return
+        
+        vectors = self.embeddings.embed_documents(texts)
+        
+        vectors = np.array(vectors).astype('float32')
+        
+        import faiss
+        if self.index is None:
+            # Initialize FAISS index; normalized LSA vectors use inner product
+            dimension = vectors.shape[1]
+            metric = faiss.METRIC_INNER_PRODUCT if isinstance(self.embeddings, LsaEmbeddings) else faiss.METRIC_L2
+            self.index_params = resolve_index_params(
+                self.index_type, dimension, len(vectors), self.index_params
+            )
+            self.index = create_index(self.index_type, dimension, metric, self.index_params)
+        
+        # IVF indexes learn their clusters (and PQ codebooks) from the first batch
+        if not self.index.is_trained:
+            self.index.train(vectors)
+        
+        # Add vectors to index
+        self.index.add(vectors)
+    
+    def similarity_search_with_score(self, query, k=5, search_params=None, filter=None):
+        """Search for similar documents.
+        
+        search_params overrides the stored search settings of approximate
+        indexes for this query, e.g. {"nprobe": 32} or {"ef_search": 128}.
+        filter restricts the results to chunks with matching metadata, e.g.
+        {"pillar": "security"} (see metadata_filter).
+        """
+        return self.similarity_search_with_score_batch(
+            [query], k=k, search_params=search_params, filter=filter
+        )[0]
+    
+    @property
+    def metadata_index(self):
+        """MetadataIndex of the stored chunks, used to evaluate filters"""
+        if self._metadata_index is None:
+            self._metadata_index = MetadataIndex.build(self.metadatas)
+        return self._metadata_index
+    
+    def filter_mask(self, filter):
+        """Boolean mask of the chunks matching filter, or None for no filter"""
+        if not filter:
+            return None
+        with STAGE_SECONDS.time("filter"):
+            return self.metadata_index.mask(filter)
+    
+    def search_indices(self, queries, k=5, search_params=None, filter=None):
+        """Vectorize and search queries, returning FAISS-style (distances, indices)"""
+        mask = self.filter_mask(filter)
+        with STAGE_SECONDS.time("embed_query"):
+            query_vectors = self.embed_queries(queries)
+        with STAGE_SECONDS.time("search"):
+            return self.search_vectors(query_vectors, k, search_params=search_params, mask=mask)
+
+    def embed_queries(self, queries):
+        """Vectorize queries in the form the index searches"""
+        if self.index_type == "sparse":
+            return self.embeddings.embed_documents_sparse(queries)
+        return np.array(self.embeddings.embed_documents(queries)).astype('float32')
+
+    def search_vectors(self, query_vectors, k=5, search_params=None, mask=None):
+        """Search vectorized queries, returning FAISS-style (distances, indices).
+        
+        mask, a boolean array over the stored chunks, restricts the search
+        to the chunks it marks True.
+        """
+        # Every engine reports squared L2 distances (lower is more similar)
+        if self.index_type == "sparse":
+            # Only validates search_params, none of which apply
+            search_parameters(self.index_type, search_params)
+            return self.index.search(query_vectors, k, mask=mask)
+        selector = None
+        if mask is not None:
+            import faiss
+            # The selector reads the bitmap without holding a reference to it
+            bitmap = np.packbits(mask, bitorder="little")
+            selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        params = search_parameters(self.index_type, search_params, selector=selector, defaults=self.index_params)
+        if params is None:
+            distances, indices = self.index.search(query_vectors, k)
+        else:
+            distances, indices = self.index.search(query_vectors, k, params=params)
+        if mask is not None and self.index_type in ANN_INDEX_TYPES:
+            # The probed lists or visited graph nodes may hold fewer than k
+            # allowed chunks; search those queries again over all of them
+            short = np.flatnonzero((indices >= 0).sum(axis=1) < min(k, int(np.count_nonzero(mask))))
+            if len(short):
+                distances[short], indices[short] = self._search_all(query_vectors[short], k, selector)
+        if _is_inner_product(self.index):
+            # For unit vectors ||q - x||^2 = 2 - 2 q.x
+            distances = 2 - 2 * distances
+        return distances, indices
+    
+    def _search_all(self, query_vectors, k, selector):
+        """Search an approximate index over every chunk the selector allows"""
+        import faiss
+        if self.index_type == "hnsw":
+            # Exact search of the graph's flat vector storage
+            storage = faiss.downcast_index(self.index.storage)
+            return storage.search(query_vectors, k, params=faiss.SearchParameters(sel=selector))
+        nlist = faiss.extract_index_ivf(self.index).nlist
+        params = search_parameters(self.index_type, {"nprobe": nlist}, selector=selector)
+        return self.index.search(query_vectors, k, params=params)
+    
+    def similarity_search_with_score_batch(self, queries, k=5, search_params=None, filter=None):
+        """Search for several queries at once.
+        
+        All queries are vectorized in one transform call and searched in one
+        index call. Returns one list of (text, metadata, distance) tuples per
+        query, in query order.
+        """
+        if not queries:
+            return []
+        distances, indices = self.search_indices(queries, k, search_params=search_params, filter=filter)
+        
+        batch_results = []
+        for row_distances, row_indices in zip(distances, indices):
+            results = []
+            for distance, idx in zip(row_distances, row_indices):
+                # FAISS pads with -1 when k exceeds the number of stored vectors
+                if 0 <= idx < len(self.texts):
+                    results.append((self.texts[idx], self.metadatas[idx], distance))
+            batch_results.append(results)
+        
+        return batch_results
+        
+    def save(self, path):
+        """Save the vector store to disk.
+        
+        Texts and metadata are written pickle-free as contiguous blobs plus
+        offset arrays (see chunk_store) so load() can memory-map them.
+        """
+        # Create directory if it doesn't exist
+        os.makedirs(path, exist_ok=True)
+        
+        # Save texts and metadata
+        write_texts(path, self.texts)
+        write_metadatas(path, self.metadatas)
+        self.metadata_index.save(f"{path}/metadata_index")
+        
+        # Save the search index
+        if self.index_type == "sparse":
+            write_sparse_index(self.index, f"{path}/index")
+        else:
+            import faiss
+            faiss.write_index(self.index, f"{path}/index.faiss")
+        
+        config = {
+            "index_type": self.index_type,
+            "version": self.version,
+            "format": STORE_FORMAT,
+            "embedding": "tfidf",
+            "index_params": self.index_params,
+        }
+        if isinstance(self.embeddings, LsaEmbeddings):
+            config.update(embedding="lsa", dimension=self.embeddings.dimension)
+            np.save(f"{path}/svd_components.npy", self.embeddings.components)
+        with open(f"{path}/config.json", "w") as f:
+            json.dump(config, f)
+        
+        # Save the query-time parameters of the vectorizer
+        vectorizer = self.embeddings.vectorizer
+        if not isinstance(vectorizer, QueryVectorizer):
+            vectorizer = QueryVectorizer.from_sklearn(vectorizer)
+        vectorizer.save(f"{path}/vectorizer.npz")
+    
+    @classmethod
+    def load(cls, path, mmap=True, embeddings=None):
+        """Load the vector store from disk.
+        
+        With mmap=True (the default) the index and chunk texts are
+        memory-mapped read-only, and a text is only read from disk when a
+        search returns it. Stores saved in the older pickle formats are still
+        loaded, with texts fully in memory and the sklearn vectorizer
+        unpickled. Passing embeddings reuses already loaded, identical
+        embeddings instead of reading them from path.
+        """
+        # Stores saved before config.json existed are always flat FAISS indexes
+        config = {"index_type": "flat", "format": 1, "embedding": "tfidf"}
+        if os.path.exists(f"{path}/config.json"):
+            with open(f"{path}/config.json", "r") as f:
+                config.update(json.load(f))
+        
+        # Load texts and metadata
+        if config["format"] >= 2:
+            texts = open_texts(path) if mmap else list(open_texts(path))
+            metadatas = open_metadatas(path) if mmap else list(open_metadatas(path))
+        else:
+            with open(f"{path}/data.pickle", "rb") as f:
+                data = pickle.load(f)
+            texts, metadatas = data["texts"], data["metadatas"]
+        
+        if embeddings is None:
+            # Load vectorizer
+            if os.path.exists(f"{path}/vectorizer.npz"):
+                vectorizer = QueryVectorizer.load(f"{path}/vectorizer.npz")
+            else:
+                with open(f"{path}/vectorizer.pickle", "rb") as f:
+                    vectorizer = pickle.load(f)
+            
+            # Create embeddings
+            if config["embedding"] == "lsa":
+                embeddings = LsaEmbeddings(config["dimension"], vectorizer=vectorizer)
+                embeddings.components = np.load(f"{path}/svd_components.npy")
+            else:
+                embeddings = TfidfEmbeddings(vectorizer)
+        
+        # Create vector store
+        store = cls(
+            embeddings, texts, metadatas,
+            index_type=config["index_type"], index_params=config.get("index_params"),
+        )
+        
+        # Load the search index
+        if store.index_type == "sparse":
+            store.index = read_sparse_index(f"{path}/index", mmap=mmap)
+        else:
+            import faiss
+            if mmap:
+                store.index = faiss.read_index(f"{path}/index.faiss", faiss_mmap_flags())
+            else:
+                store.index = faiss.read_index(f"{path}/index.faiss")
+            apply_search_params(store.index, store.index_type, store.index_params)
+        
+        # Stores saved before metadata filtering build the index on first use
+        if os.path.exists(f"{path}/metadata_index/config.json"):
+            store._metadata_index = MetadataIndex.load(f"{path}/metadata_index", mmap=mmap)
+        
+        # Older stores have no recorded version; fall back to the file's mtime
+        version_file = f"{path}/config.json" if os.path.exists(f"{path}/config.json") else f"{path}/index.faiss"
+        store.version = config.get("version") or f"mtime-{os.stat(version_file).st_mtime_ns}"
+        
+        return store
@@ -12,13 +12,22 @@ LEGAL DISCLAIMER:
  authoritative information.
 - AWS Well-Architected Framework documentation is copyrighted by AWS.
 """
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
+from typing import Optional
 import uvicorn
 from pathlib import Path
+import asyncio
 import os
+import time
+
+from batch_scheduler import BatchScheduler
+from metadata_filter import parse_filter
+import metrics
+from profiling import profile_call
+from worker_pool import QueueFullError, WorkerPool
 
 # Import the query assistant
 import logging
@@ -31,7 +40,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 # Try importing the query assistant, but provide fallback if it fails
 try:
-   from query_assistant import answer_question, create_retriever
+   from query_assistant import answer_question, answer_questions, create_retriever, get_retriever
    logger.info("Successfully imported query_assistant module")
    QUERY_ASSISTANT_AVAILABLE = True
 except Exception as e:
@@ -40,21 +49,69 @@ except Exception as e:
    QUERY_ASSISTANT_AVAILABLE = False
    
    # Mock functions for testing
-   def answer_question(question):
+   def answer_question(question, use_cache=True, filter=None):
        return {
            "answer": f"This is a mock answer for: {question}",
            "sources": ["Mock source 1", "Mock source 2"]
        }
    
+   def answer_questions(questions, filters=None):
+       return [answer_question(question) for question in questions]
+   
    def create_retriever():
        return None
 
+# Largest number of questions accepted by /api/query/batch
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 1000))
+
+# Worker threads that run retrieval off the event loop, and how many more
+# requests may wait for a worker before new ones are rejected with 503
+QUERY_WORKERS = int(os.environ.get("QUERY_WORKERS", min(4, os.cpu_count() or 1)))
+QUERY_QUEUE_DEPTH = int(os.environ.get("QUERY_QUEUE_DEPTH", 64))
+worker_pool = WorkerPool(max_workers=QUERY_WORKERS, max_queue=QUERY_QUEUE_DEPTH)
+
+
+def answer_filtered_questions(requests):
+   """Answer the (question, metadata filter) pairs of one batch"""
+   return answer_questions(
+       [question for question, _ in requests], filters=[filter for _, filter in requests]
+   )
+
+
+# Single queries arriving within QUERY_BATCH_WINDOW_MS of each other are
+# searched together, up to QUERY_BATCH_SIZE per batch (1 disables batching).
+# Batches run on worker_pool, so they count against the same QUERY_WORKERS
+# limit as batch requests and profiled queries
+QUERY_BATCH_SIZE = int(os.environ.get("QUERY_BATCH_SIZE", 32))
+QUERY_BATCH_WINDOW_MS = float(os.environ.get("QUERY_BATCH_WINDOW_MS", 2))
+batch_scheduler = BatchScheduler(
+   answer_filtered_questions,
+   max_batch_size=QUERY_BATCH_SIZE,
+   window_ms=QUERY_BATCH_WINDOW_MS,
+   workers=QUERY_WORKERS,
+   max_pending=QUERY_WORKERS * QUERY_BATCH_SIZE + QUERY_QUEUE_DEPTH,
+   executor=worker_pool,
+)
+
+# Profiling of single queries on request (X-Profile: 1 header or ?profile=1);
+# profiles are returned inline and also saved to PROFILE_DIR when it is set
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+
 app = FastAPI(
    title="RAG FAQ Assistant",
    description="Retrieve information from documentation using natural language queries",
    version="0.1.0",
 )
 
+# Load the vector store once at startup so requests share a single retriever
+if QUERY_ASSISTANT_AVAILABLE:
+   try:
+       get_retriever()
+       logger.info("Vector store loaded")
+   except (Exception, SystemExit) as e:
+       logger.error(f"Failed to load vector store at startup: {e}")
+
 # Create templates directory if it doesn't exist
 templates_dir = Path("templates")
 templates_dir.mkdir(exist_ok=True)
@@ -194,11 +251,61 @@ templates = Jinja2Templates(directory="templates")
 # Define request/response models
 class QueryRequest(BaseModel):
    question: str
+   # Restricts the passages by metadata, e.g. {"pillar": "security"}
+   filter: Optional[dict] = None
 
 
 class QueryResponse(BaseModel):
    answer: str
    sources: list[str]
+   profile: Optional[str] = None
+   profile_file: Optional[str] = None
+
+
+class BatchQueryRequest(BaseModel):
+   questions: list[str]
+   # Applies to every question of the batch
+   filter: Optional[dict] = None
+
+
+class BatchQueryResponse(BaseModel):
+   results: list[QueryResponse]
+
+
+def endpoint_label(request):
+   """Route template of a request, so clients cannot create new metric series"""
+   route = request.scope.get("route")
+   return route.path if route is not None else "unmatched"
+
+
+@app.middleware("http")
+async def record_request_time(request: Request, call_next):
+   """Time every API request for the /metrics endpoint"""
+   start = time.perf_counter()
+   try:
+       return await call_next(request)
+   finally:
+       if request.url.path.startswith("/api/"):
+           metrics.REQUEST_SECONDS.observe(endpoint_label(request), time.perf_counter() - start)
+
+
+def check_filter(filter):
+   """Raise a 400 response for an invalid metadata filter"""
+   try:
+       parse_filter(filter)
+   except ValueError as e:
+       raise HTTPException(status_code=400, detail=str(e))
+
+
+def server_busy(e, endpoint):
+   """503 response for requests rejected because the worker pool is full"""
+   logger.warning(f"Rejecting query: {e}")
+   metrics.ERRORS.inc(endpoint)
+   return HTTPException(
+       status_code=503,
+       detail="Server is busy, please retry shortly",
+       headers={"Retry-After": "1"}
+   )
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -207,25 +314,86 @@ async def get_index(request: Request):
    return templates.TemplateResponse("index.html", {"request": request})
 
 
-@app.post("/api/query", response_model=QueryResponse)
-async def query(request: QueryRequest):
+def profiling_requested(http_request):
+   """Whether this request asked for a profile and profiling is enabled"""
+   return PROFILING_ENABLED and (
+       http_request.headers.get("X-Profile") == "1"
+       or http_request.query_params.get("profile") == "1"
+   )
+
+
+async def profiled_answer(question, filter=None):
+   """Answer one question under the profiler, bypassing batching and the cache"""
+   result, profile = await worker_pool.run(
+       profile_call, answer_question, question, use_cache=False, filter=filter
+   )
+   logger.info(f"Profiled query in {profile.elapsed * 1000:.1f} ms")
+   response = {"answer": result["answer"], "sources": result["sources"], "profile": profile.collapsed()}
+   if PROFILE_DIR:
+       response["profile_file"] = profile.save_in(PROFILE_DIR)
+   return response
+
+
+@app.post("/api/query", response_model=QueryResponse, response_model_exclude_none=True)
+async def query(request: QueryRequest, http_request: Request):
    """Process a query and return the answer with sources"""
+   check_filter(request.filter)
    try:
        logger.info(f"Processing query: {request.question}")
-       result = answer_question(request.question)
+       if profiling_requested(http_request):
+           return await profiled_answer(request.question, request.filter)
+       result = await asyncio.wrap_future(batch_scheduler.submit((request.question, request.filter)))
        logger.info("Query processed successfully")
        return {
            "answer": result["answer"],
            "sources": result["sources"]
        }
+   except QueueFullError as e:
+       raise server_busy(e, "/api/query")
    except Exception as e:
        logger.error(f"Error processing query: {e}")
+       metrics.ERRORS.inc("/api/query")
        return {
            "answer": f"Error processing your query: {e}",
            "sources": ["Error occurred"]
        }
 
 
+@app.post("/api/query/batch", response_model=BatchQueryResponse)
+async def query_batch(request: BatchQueryRequest):
+   """Process a list of queries with one batched search"""
+   if len(request.questions) > MAX_BATCH_SIZE:
+       raise HTTPException(
+           status_code=400,
+           detail=f"At most {MAX_BATCH_SIZE} questions per batch"
+       )
+   check_filter(request.filter)
+   try:
+       logger.info(f"Processing batch of {len(request.questions)} queries")
+       results = await worker_pool.run(
+           answer_questions, request.questions, filters=[request.filter] * len(request.questions)
+       )
+       logger.info("Batch processed successfully")
+       return {"results": results}
+   except QueueFullError as e:
+       raise server_busy(e, "/api/query/batch")
+   except Exception as e:
+       logger.error(f"Error processing batch: {e}")
+       metrics.ERRORS.inc("/api/query/batch")
+       return {
+           "results": [
+               {"answer": f"Error processing your query: {e}", "sources": ["Error occurred"]}
+               for _ in request.questions
+           ]
+       }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+   """Pipeline latency histograms and counters in Prometheus text format"""
+   return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 if __name__ == "__main__":
    # Get port from environment variable or default to 8000
    port = int(os.environ.get("PORT", 8000))
@@ -243,4 +411,10 @@ if __name__ == "__main__":
    print("For authoritative information, refer to official AWS documentation.\n")
    
    # Start the server
-   uvicorn.run("web_app:app", host="0.0.0.0", port=port, reload=True)
+   if os.environ.get("DEBUG", "").lower() in ("1", "true", "yes"):
+       # Development: a single process that reloads on code changes
+       uvicorn.run("web_app:app", host="0.0.0.0", port=port, reload=True)
+   else:
+       # Production: pre-forked workers sharing the memory-mapped index
+       from serve import serve
+       serve(app, port=port)
@@ -0,0 +1,66 @@
+"""
+Bounded worker pool for running blocking retrieval off the event loop
+
+Retrieval (query vectorization, index search and formatting) is synchronous
+and CPU-bound. The async web app hands it to a fixed number of worker
+threads instead of calling it on the event loop, so a slow query no longer
+stalls other connections. Admission is bounded too: at most
+`max_workers + max_queue` calls may be running or waiting at once, and
+further submissions fail immediately with QueueFullError so the server can
+shed load (HTTP 503) instead of building an unbounded backlog.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the pool already holds as many calls as it admits"""
+
+
+class WorkerPool:
+    """Thread pool with a limit on running plus queued calls"""
+
+    def __init__(self, max_workers=4, max_queue=64):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if max_queue < 0:
+            raise ValueError("max_queue must not be negative")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.capacity = max_workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query-worker")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self):
+        """Calls currently running or waiting for a worker"""
+        return self._pending
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) and return a concurrent.futures.Future"""
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise QueueFullError(
+                    f"{self._pending} queries in progress (limit {self.capacity})"
+                )
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on a worker thread and await its result"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1